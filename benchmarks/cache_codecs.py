@@ -0,0 +1,44 @@
+"""Compare the API cache codecs: encode time, decode time and stored bytes,
+for the dummy_api fixtures and a synthetic large part.
+
+    python benchmarks/cache_codecs.py
+"""
+from common import best_of, fixture, setup_django, synthetic_part
+setup_django()
+
+from regulations.generator import cache_codecs   # noqa
+
+
+def codecs():
+    yield 'pickle', cache_codecs.PickleCodec()
+    yield 'compact', cache_codecs.CompactCodec()
+    yield 'compact+zlib', cache_codecs.CompactCodec('zlib')
+    if cache_codecs.lz4 is not None:
+        yield 'compact+lz4', cache_codecs.CompactCodec('lz4')
+
+
+def main():
+    values = [
+        ('regulation/1005/2011-11111',
+         fixture('regulation', '1005', '2011-11111')),
+        ('layer/terms/1005/2011-11111',
+         fixture('layer', 'terms', '1005', '2011-11111')),
+        ('layer/internal-citations/1005/2011-11111',
+         fixture('layer', 'internal-citations', '1005', '2011-11111')),
+        ('synthetic part (200 sections)', synthetic_part()),
+    ]
+    print '%-42s %-13s %10s %10s %10s' % ('value', 'codec', 'bytes',
+                                          'encode ms', 'decode ms')
+    for name, value in values:
+        for codec_name, codec in codecs():
+            encoded = codec.encode(value)
+            assert cache_codecs.decode(encoded) == value
+            encode = best_of(lambda: codec.encode(value))
+            decode = best_of(lambda: cache_codecs.decode(encoded))
+            print '%-42s %-13s %10d %10.2f %10.2f' % (
+                name, codec_name, len(encoded), encode * 1000,
+                decode * 1000)
+
+
+if __name__ == '__main__':
+    main()
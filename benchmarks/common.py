@@ -0,0 +1,75 @@
+"""Shared helpers for the scripts in this directory. Run the benchmarks
+from the repository root, e.g. `python benchmarks/cache_codecs.py`."""
+import json
+import os
+import random
+import sys
+import time
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DUMMY_API = os.path.join(ROOT, 'dummy_api')
+
+
+def setup_django():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'regulations.settings.dev')
+    import django
+    django.setup()
+
+
+def fixture(*path):
+    """JSON from the dummy_api directory"""
+    with open(os.path.join(DUMMY_API, *path)) as f:
+        return json.load(f)
+
+
+def best_of(fn, repeat=5, number=1):
+    """Fastest wall-clock time, in seconds, of `number` calls to fn"""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            fn()
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+WORDS = ('consumer account transfer electronic financial institution '
+         'means any the of to a in for shall paragraph section').split()
+
+
+def sentence(rng, words=25):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '.'
+
+
+def synthetic_part(part='9999', sections=200, depth=3, fanout=4, seed=0):
+    """A regulation tree shaped like a large part: `sections` sections, each
+    with paragraphs nested `depth` deep, `fanout` children per level"""
+    rng = random.Random(seed)
+    markers = ['abcdefghijklmnopqrstuvwxyz', '123456789',
+               ['i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix'],
+               'ABCDEFGHIJKLMNOPQRSTUVWXYZ']
+
+    def paragraphs(label, level):
+        if level >= depth:
+            return []
+        children = []
+        for marker in markers[level][:fanout]:
+            child_label = label + [marker]
+            children.append({
+                'label': child_label, 'node_type': 'regtext',
+                'text': u'(%s) %s' % (marker, sentence(rng)),
+                'children': paragraphs(child_label, level + 1)})
+        return children
+
+    return {
+        'label': [part], 'node_type': 'regtext', 'text': u'',
+        'title': u'PART %s - SYNTHETIC (REGULATION S)' % part,
+        'children': [{
+            'label': [part, str(i)], 'node_type': 'regtext',
+            'title': u'\xa7 %s.%d Section %d.' % (part, i, i),
+            'text': sentence(rng),
+            'children': paragraphs([part, str(i)], 0)}
+            for i in range(1, sections + 1)]}
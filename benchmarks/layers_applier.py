@@ -0,0 +1,117 @@
+"""Compare applying inline and search/replace layer elements to a node's text
+in one pass over offsets (LayersApplier.apply_layers) against rewriting the
+text once per element (LayersApplier.replace_each), for paragraphs of
+increasing length, with a definition, citation or key term roughly every
+other sentence. Then compare applying inline layer pairs (every definition,
+with its offsets) after converting them to occurrence numbers, as
+InlineLayersApplier used to, against applying them at their offsets.
+
+    python benchmarks/layers_applier.py
+"""
+import random
+
+from common import best_of, sentence, setup_django
+setup_django()
+
+from regulations.generator.layers.layers_applier import (    # noqa
+    LayersApplier)
+from regulations.generator.layers.location_replace import (  # noqa
+    LocationReplace)
+from regulations.generator.layers.offset_replace import (    # noqa
+    find_all, OffsetElement)
+
+
+TERMS = [
+    ('financial institution', '<a href="#1005-2-i" class="citation '
+     'definition" data-definition="1005-2-i" data-defined-term="financial '
+     'institution">financial institution</a>'),
+    ('electronic', '<a href="#1005-2-e" class="citation definition" '
+     'data-definition="1005-2-e">electronic</a>'),
+    ('consumer', '<a href="#1005-2-c" class="citation definition" '
+     'data-definition="1005-2-c">consumer</a>'),
+    ('paragraph', '<dfn class="key-term">paragraph</dfn>'),
+]
+
+
+def paragraph(sentences, seed=0):
+    """Text and layer elements for one long (appendix-like) paragraph"""
+    rng = random.Random(seed)
+    text = u'(a) ' + u' '.join(sentence(rng) for _ in range(sentences))
+    elements = [(u'(a)', u'<span class="stripped-marker">a.</span>'
+                 u'<em class="paragraph-marker">(a)</em>', [0])]
+    for original, replacement in TERMS:
+        count = text.count(original)
+        elements.extend((original, replacement, [idx])
+                        for idx in range(0, count, 2))
+    return text, elements
+
+
+def inline_pairs(text):
+    """(original, replacement, (start, end)) at every occurrence of the
+    terms, as the definitions layer provides them"""
+    pairs = []
+    for original, replacement in TERMS[:3]:
+        pairs.extend((original, replacement, (start, start + len(original)))
+                     for start in find_all(original, text))
+    return pairs
+
+
+def converted(pairs, text):
+    """The conversion InlineLayersApplier.get_layer_pairs used to make"""
+    elements = []
+    for o, r, offset in pairs:
+        offset_locations = LocationReplace.find_all_offsets(o, text)
+        elements.append((o, r, [offset_locations.index(offset)]))
+    return elements
+
+
+def ordered(elements):
+    return [e for _, e in sorted((-len(e[0]), e) for e in elements)]
+
+
+def main():
+    print '%10s %10s %10s %12s %12s' % ('sentences', 'chars', 'elements',
+                                        'legacy ms', 'offsets ms')
+    for sentences in (5, 20, 80, 320):
+        text, elements = paragraph(sentences)
+
+        def legacy():
+            return LayersApplier().replace_each(
+                text, [(o, r, list(l)) for o, r, l in ordered(elements)])
+
+        def offsets():
+            applier = LayersApplier()
+            applier.enqueue_from_list(
+                [(o, r, list(l)) for o, r, l in elements])
+            return applier.apply_layers(text)
+
+        assert legacy() == offsets()
+        print '%10d %10d %10d %12.2f %12.2f' % (
+            sentences, len(text), len(elements), best_of(legacy) * 1000,
+            best_of(offsets) * 1000)
+
+    print
+    print '%10s %10s %10s %12s %12s' % ('sentences', 'chars', 'pairs',
+                                        'convert ms', 'offsets ms')
+    for sentences in (5, 20, 80, 320):
+        text, _ = paragraph(sentences)
+        pairs = inline_pairs(text)
+
+        def convert():
+            applier = LayersApplier()
+            applier.enqueue_from_list(converted(pairs, text))
+            return applier.apply_layers(text)
+
+        def offsets():
+            applier = LayersApplier()
+            applier.enqueue_from_list([OffsetElement(*p) for p in pairs])
+            return applier.apply_layers(text)
+
+        assert convert() == offsets()
+        print '%10d %10d %10d %12.2f %12.2f' % (
+            sentences, len(text), len(pairs), best_of(convert) * 1000,
+            best_of(offsets) * 1000)
+
+
+if __name__ == '__main__':
+    main()
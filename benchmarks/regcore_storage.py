@@ -0,0 +1,58 @@
+"""Per-call cost of fetching a regulation tree in-process: through regcore's
+URLs (view, JSON serialization, json.loads) versus directly from its
+storage layer. Both are backed by the same in-memory trees, so the
+difference is the overhead the storage backend removes.
+
+    python benchmarks/regcore_storage.py
+"""
+from common import best_of, setup_django, synthetic_part
+setup_django()
+
+from django.conf.urls import url    # noqa
+from django.http import JsonResponse    # noqa
+from django.test import override_settings   # noqa
+
+from regulations.generator.api_client import ApiClient  # noqa
+
+
+TREES = {}
+
+
+class Storage(object):
+    """Part 9xxx has xxx sections"""
+    def regulation(self, label, version):
+        if label not in TREES:
+            TREES[label] = synthetic_part(label, sections=int(label) - 9000)
+        return TREES[label]
+
+
+def regulation_view(request, label, version):
+    return JsonResponse(Storage().regulation(label, version))
+
+urlpatterns = [
+    url(r'^regulation/(?P<label>[^/]+)/(?P<version>[^/]+)$',
+        regulation_view),
+]
+
+
+def main():
+    print '%-10s %14s %14s %14s' % ('sections', 'urls ms', 'storage ms',
+                                    'saved ms')
+    for sections in (10, 50, 200, 800):
+        part = str(9000 + sections)
+        suffix = 'regulation/%s/v1' % part
+        with override_settings(EREGS_REGCORE_URLS='regcore_storage'):
+            client = ApiClient()
+            via_urls = best_of(lambda: client.get(suffix))
+        with override_settings(
+                EREGS_REGCORE_URLS='regcore_storage',
+                EREGS_REGCORE_STORAGE='regcore_storage.Storage'):
+            client = ApiClient()
+            via_storage = best_of(lambda: client.get(suffix))
+        print '%-10d %14.2f %14.4f %14.2f' % (
+            sections, via_urls * 1000, via_storage * 1000,
+            (via_urls - via_storage) * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compare resolving search/replace layer elements' occurrences against the
+replacements already made by walking every earlier replacement, once per
+original (as OffsetReplace used to), against the sorted index of them
+(OffsetReplace.locate). Run over the fixture node with the most
+search/replace elements (a model form, with its graphics), and over a
+synthetic paragraph full of definitions with an increasing number of
+search/replace originals.
+
+    python benchmarks/search_replace.py
+"""
+import random
+
+from common import best_of, fixture, sentence, setup_django
+setup_django()
+
+from regulations.generator.layers.definitions import (  # noqa
+    DefinitionsLayer)
+from regulations.generator.layers.graphics import GraphicsLayer     # noqa
+from regulations.generator.layers.internal_citation import (    # noqa
+    InternalCitationLayer)
+from regulations.generator.layers.layers_applier import (   # noqa
+    InlineLayersApplier, SearchReplaceLayersApplier)
+from regulations.generator.layers.offset_replace import (   # noqa
+    find_all, OffsetElement, OffsetReplace)
+from regulations.generator.layers.paragraph_markers import (    # noqa
+    ParagraphMarkersLayer)
+
+
+VERSION = '2012-12121'
+
+
+class Walking(OffsetReplace):
+    """Each original's occurrences checked against every span in turn"""
+    def occurrences(self, original):
+        if original not in self.found:
+            self.found[original] = [
+                [(start, False) for start in find_all(original, self.text)],
+                0]
+        return OffsetReplace.occurrences(self, original)
+
+
+def ordered(elements):
+    return [e for _, e in sorted((-len(e[0]), e) for e in elements)]
+
+
+def fixture_nodes():
+    """(label, text, elements) for each fixture node"""
+    inline, search = InlineLayersApplier(), SearchReplaceLayersApplier()
+    inline.add_layer(DefinitionsLayer(
+        fixture('layer', 'terms', '1005', VERSION)))
+    inline.add_layer(InternalCitationLayer(
+        fixture('layer', 'internal-citations', '1005', VERSION)))
+    search.add_layer(GraphicsLayer(
+        fixture('layer', 'graphics', '1005', VERSION)))
+    search.add_layer(ParagraphMarkersLayer(
+        fixture('layer', 'paragraph-markers', '1005', VERSION)))
+
+    nodes = []
+
+    def walk(node):
+        label = '-'.join(node['label'])
+        if node['text']:
+            nodes.append((label, node['text'], ordered(
+                inline.get_layer_pairs(label, node['text'])
+                + search.get_layer_pairs(label))))
+        for child in node['children']:
+            walk(child)
+    walk(fixture('regulation', '1005', VERSION))
+    return nodes
+
+
+def synthetic(originals):
+    """A long paragraph, every occurrence of a few terms linked, plus
+    search/replace elements for some of its other words"""
+    rng = random.Random(0)
+    text = u' '.join(sentence(rng) for _ in range(320))
+    elements = []
+    for term in ('financial institution', 'electronic', 'consumer'):
+        replacement = u'<a class="definition">%s</a>' % term
+        elements.extend(OffsetElement(term, replacement,
+                                      (start, start + len(term)))
+                        for start in find_all(term, text))
+    words = sorted(set(text.replace('.', '').split()))
+    phrases = sorted(set(' '.join(text.split()[i:i + 2])
+                         for i in range(0, len(text.split()), 5)))
+    for original in (phrases + words)[:originals]:
+        elements.append((original, u'<dfn>%s</dfn>' % original, [0]))
+    return text, ordered(elements)
+
+
+def compare(name, text, elements):
+    assert (Walking(text).apply(elements)
+            == OffsetReplace(text).apply(elements))
+    searches = sum(1 for e in elements if not isinstance(e, OffsetElement))
+    print '%-16s %8d %8d %8d %12.3f %12.3f' % (
+        name, len(text), len(elements) - searches, searches,
+        best_of(lambda: Walking(text).apply(elements), number=5) * 1000,
+        best_of(lambda: OffsetReplace(text).apply(elements), number=5)
+        * 1000)
+
+
+def main():
+    print '%-16s %8s %8s %8s %12s %12s' % ('node', 'chars', 'inline',
+                                           'search', 'walking ms',
+                                           'indexed ms')
+    nodes = sorted(fixture_nodes(), key=lambda n: -sum(
+        1 for e in n[2] if not isinstance(e, OffsetElement)))
+    for label, text, elements in nodes[:1]:
+        compare(label, text, elements)
+    for originals in (10, 40, 160):
+        text, elements = synthetic(originals)
+        compare('synthetic', text, elements)
+
+
+if __name__ == '__main__':
+    main()
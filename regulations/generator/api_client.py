@@ -1,13 +1,153 @@
+from hashlib import md5
 from importlib import import_module
 import json
 import os
+import re
+import threading
+import time
 
 from django.conf import settings 
 from django.core.urlresolvers import Resolver404, resolve
 from django.http import Http404
 from django.test import RequestFactory
 from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
 import requests
+from requests.adapters import HTTPAdapter
+
+from regulations.generator import regcore_storage, sqlite_store, upstream
+from regulations.generator.stats import Counters
+
+
+DEFAULT_POOL = {
+    'POOL_CONNECTIONS': 4,      # number of upstream hosts to keep pools for
+    'POOL_MAXSIZE': 16,         # connections kept alive per host
+    'POOL_BLOCK': False,        # wait for a free connection when exhausted
+    'MAX_RETRIES': 0,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 60,
+    'KEEP_ALIVE': True,
+}
+
+#   Read timeouts (seconds) by API path; the first match applies. Other
+#   requests get READ_TIMEOUT
+DEFAULT_BUDGETS = [
+    (r'^layer/', 5),
+    (r'^regulation/[^/]+$', 5),     # versions of a regulation
+    (r'^notice', 10),
+    (r'^diff/', 20),
+    (r'^regulation/', 30),          # regulation trees
+    (r'^search', 30),
+]
+
+#   Fetching many resources in one request. The API answers
+#   GET <PATH>?path=<suffix>&path=<suffix>... with a JSON object mapping each
+#   suffix to its data (null if there's no such resource)
+DEFAULT_BUNDLE = {
+    'ENABLED': True,
+    'PATH': 'bundle',
+    'MAX_PATHS': 50,
+    #   Seconds before asking an API which lacked the endpoint again
+    'RECHECK_INTERVAL': 60 * 60,
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+#   APIs without a bundle endpoint, by base URLs: when to check again
+_unbundled = {}
+bundle_counters = Counters('requests', 'paths', 'unsupported')
+
+
+def pool_config():
+    """DEFAULT_POOL, overridden by settings.EREGS_API_POOL"""
+    config = dict(DEFAULT_POOL)
+    config.update(getattr(settings, 'EREGS_API_POOL', {}))
+    return config
+
+
+def bundle_config():
+    """DEFAULT_BUNDLE, overridden by settings.EREGS_API_BUNDLE"""
+    config = dict(DEFAULT_BUNDLE)
+    config.update(getattr(settings, 'EREGS_API_BUNDLE', {}))
+    return config
+
+
+def budget_for(suffix, config=None):
+    """How long (seconds) to wait on the API for `suffix`, per
+    settings.EREGS_API_BUDGETS, falling back to READ_TIMEOUT"""
+    budgets = getattr(settings, 'EREGS_API_BUDGETS', DEFAULT_BUDGETS)
+    for pattern, seconds in budgets:
+        if re.match(pattern, suffix):
+            return seconds
+    return (config or pool_config())['READ_TIMEOUT']
+
+
+class BudgetExceeded(Exception):
+    """The API didn't answer within the latency budget for the request"""
+    pass
+
+
+def shared_session(config=None):
+    """A requests.Session shared by every ApiClient in this process (one per
+    distinct pool configuration) so that connections to the API are kept
+    alive and reused rather than re-established for each call. urllib3's
+    pools are thread safe; we only need to guard creation."""
+    config = config or pool_config()
+    key = tuple(sorted(config.items()))
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=config['POOL_CONNECTIONS'],
+                    pool_maxsize=config['POOL_MAXSIZE'],
+                    pool_block=config['POOL_BLOCK'],
+                    max_retries=config['MAX_RETRIES'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                if not config['KEEP_ALIVE']:
+                    session.headers['Connection'] = 'close'
+                _sessions[key] = session
+    return session
+
+
+def pool_stats():
+    """Usage of each upstream connection pool, keyed by host. Useful when
+    sizing EREGS_API_POOL: if `connections` keeps growing relative to
+    `requests`, the pool is too small (or keep-alive isn't being honored)"""
+    stats = {}
+    for session in list(_sessions.values()):
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = '%s://%s:%s' % (pool.scheme, pool.host, pool.port)
+                host_stats = stats.setdefault(
+                    host, {'connections': 0, 'requests': 0, 'idle': 0,
+                           'maxsize': 0})
+                host_stats['connections'] += pool.num_connections
+                host_stats['requests'] += pool.num_requests
+                host_stats['idle'] += sum(
+                    1 for conn in list(pool.pool.queue) if conn is not None)
+                host_stats['maxsize'] += pool.pool.maxsize
+    return stats
+
+
+class NotModified(object):
+    """Returned by ApiClient.get when the caller's validators still match
+    the resource, i.e. their copy is current"""
+    def __repr__(self):
+        return 'NOT_MODIFIED'
+
+NOT_MODIFIED = NotModified()
+
+
+def content_etag(content):
+    return '"%s"' % md5(content).hexdigest()
 
 
 class ApiClient:
@@ -15,7 +155,17 @@ class ApiClient:
 
     Optionally define settings.EREGS_REGCORE_URLS to the module name of the
     related cfpb/regulations-core project (e.g. 'regcore.urls') to use a
-    runtime import to handle requests instead of HTTP.
+    runtime import to handle requests instead of HTTP. Going further,
+    settings.EREGS_REGCORE_STORAGE may name a storage adapter (e.g.
+    'regulations.generator.regcore_storage.RegcoreStorage') which answers
+    the common endpoints without serializing to JSON and back; see
+    regcore_storage.
+
+    HTTP requests share a process-wide, keep-alive connection pool; see
+    settings.EREGS_API_POOL. settings.API_BASE may also be a list of the
+    base URLs of several replicas, which are load balanced (and optionally
+    hedged); see upstream and settings.EREGS_API_UPSTREAM. Or it may be
+    'sqlite:///path/to/file.db' to read from a local copy; see sqlite_store.
     """
     def __init__(self):
         self.base_url = settings.API_BASE
@@ -24,29 +174,115 @@ class ApiClient:
         if self.regcore_urls:
             self.regcore_urls = import_module(self.regcore_urls)
 
-    def get_from_file_system(self, suffix):
-        if os.path.isdir(self.base_url + suffix):
+        self.regcore_storage = getattr(settings, 'EREGS_REGCORE_STORAGE',
+                                       None)
+        if self.regcore_storage:
+            self.regcore_storage = regcore_storage.StorageBackend(
+                import_string(self.regcore_storage)())
+
+    @property
+    def base_urls(self):
+        if isinstance(self.base_url, (list, tuple)):
+            return list(self.base_url)
+        return [self.base_url]
+
+    def get_from_file_system(self, suffix, validators=None):
+        base_url = self.base_urls[0]
+        if os.path.isdir(base_url + suffix):
             suffix = suffix + "/index.html"
-        f = open(self.base_url + suffix)
+        if validators is not None:
+            stat = os.stat(base_url + suffix)
+            etag = '"%x-%x"' % (int(stat.st_mtime * 1e6), stat.st_size)
+            if validators.get('etag') == etag:
+                return NOT_MODIFIED
+            validators.clear()
+            validators['etag'] = etag
+        f = open(base_url + suffix)
         content = f.read()
         f.close()
         return json.loads(content)
 
+    def get_from_sqlite(self, suffix, params={}):
+        path = self.base_urls[0][len('sqlite://'):]
+        return sqlite_store.store_for(path).get(suffix, params)
+
     @cached_property
     def request_factory(self):
         return RequestFactory()
 
-    def get_from_http(self, suffix, params={}):
-        url = self.base_url + suffix
-        r = requests.get(url, params=params)
-        if r.status_code == requests.codes.ok:
+    @cached_property
+    def pool_config(self):
+        return pool_config()
+
+    @property
+    def session(self):
+        return shared_session(self.pool_config)
+
+    @property
+    def timeout(self):
+        return (self.pool_config['CONNECT_TIMEOUT'],
+                self.pool_config['READ_TIMEOUT'])
+
+    def timeout_for(self, suffix):
+        """Connect and read timeouts for a request. The read timeout is
+        the request's latency budget (strictly, it bounds each wait for
+        data rather than the whole response)"""
+        return (self.pool_config['CONNECT_TIMEOUT'],
+                budget_for(suffix, self.pool_config))
+
+    def get_from_http(self, suffix, params={}, validators=None):
+        base_urls = self.base_urls
+        if len(base_urls) == 1:
+            return self.get_from_base(base_urls[0], suffix, params,
+                                      validators)
+
+        def fetch(base_url):
+            # Hedged requests mustn't share one validators dict
+            attempt_validators = None
+            if validators is not None:
+                attempt_validators = dict(validators)
+            result = self.get_from_base(base_url, suffix, params,
+                                        attempt_validators)
+            return result, attempt_validators
+
+        result, attempt_validators = upstream.upstream(base_urls).call(
+            fetch, final=(BudgetExceeded,))
+        if validators is not None:
+            validators.clear()
+            validators.update(attempt_validators)
+        return result
+
+    def get_from_base(self, base_url, suffix, params={}, validators=None):
+        url = base_url + suffix
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        timeout = self.timeout_for(suffix)
+        try:
+            r = self.session.get(url, params=params, headers=headers,
+                                 timeout=timeout)
+        except requests.exceptions.Timeout as e:
+            raise BudgetExceeded('%s took longer than %ss: %s'
+                                 % (url, timeout[1], e))
+        if r.status_code == requests.codes.not_modified and headers:
+            return NOT_MODIFIED
+        elif r.status_code == requests.codes.ok:
+            if validators is not None:
+                validators.clear()
+                if 'ETag' in r.headers:
+                    validators['etag'] = r.headers['ETag']
+                if 'Last-Modified' in r.headers:
+                    validators['last_modified'] = r.headers['Last-Modified']
             return r.json()
         elif r.status_code == 404:
             return None
         else:
             r.raise_for_status()
 
-    def get_from_regcore(self, suffix, params={}):
+    def get_from_regcore(self, suffix, params={}, validators=None):
         path = '/' + suffix
 
         try:
@@ -56,7 +292,10 @@ class ApiClient:
             # an invalid request that doesn't match a URL pattern.
             return None
 
-        request = self.request_factory.get(path, data=params)
+        headers = {}
+        if validators and validators.get('etag'):
+            headers['HTTP_IF_NONE_MATCH'] = validators['etag']
+        request = self.request_factory.get(path, data=params, **headers)
 
         try:
             response = func(request, *args, **kwargs)
@@ -77,12 +316,73 @@ class ApiClient:
                 )
             )
 
+        if response.status_code == 304 and headers:
+            return NOT_MODIFIED
+        if validators is not None:
+            # regcore's views don't set validators themselves; a hash of
+            # the body still spares us parsing an unchanged response
+            etag = response.get('ETag') or content_etag(response.content)
+            if validators.get('etag') == etag:
+                return NOT_MODIFIED
+            validators.clear()
+            validators['etag'] = etag
+
         return json.loads(response.content)
 
-    def get(self, suffix, params={}):
+    def get_bundle(self, suffixes):
+        """Fetch several resources in one request to the API's bundle
+        endpoint: a dict mapping each suffix to its data (None if there's no
+        such resource; suffixes may be missing from the dict if the API
+        skipped them). Returns None if bundling isn't possible: the API is
+        in-process or on disk, where each lookup is cheap anyway, or it has
+        no bundle endpoint (which is remembered for a while)"""
+        config = bundle_config()
+        base_urls = self.base_urls
+        if (not config['ENABLED'] or self.regcore_storage
+                or self.regcore_urls or not base_urls[0].startswith('http')):
+            return None
+        key = tuple(base_urls)
+        if _unbundled.get(key, 0) > time.time():
+            return None
+
+        suffixes, bundle = list(suffixes), {}
+        for start in range(0, len(suffixes), config['MAX_PATHS']):
+            chunk = suffixes[start:start + config['MAX_PATHS']]
+            try:
+                result = self.get_from_http(config['PATH'], {'path': chunk})
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code >= 500:
+                    raise
+                result = None       # e.g. 405: some other resource
+            if not isinstance(result, dict):
+                bundle_counters.incr('unsupported')
+                _unbundled[key] = time.time() + config['RECHECK_INTERVAL']
+                return None
+            bundle_counters.incr('requests')
+            bundle_counters.incr('paths', len(result))
+            bundle.update(result)
+        return bundle
+
+    def get(self, suffix, params={}, validators=None):
+        """Fetch and parse a resource; None if there's no such resource. If
+        given, `validators` (a dict, possibly empty) makes the request
+        conditional and is updated with the response's validators; if the
+        resource still matches them, returns NOT_MODIFIED without
+        downloading or parsing it"""
+        if self.regcore_storage:
+            result = self.regcore_storage.get(suffix, params)
+            if result is not regcore_storage.UNKNOWN:
+                # No serialized form to validate; lookups are cheap anyway
+                if validators:
+                    validators.clear()
+                return result
         if self.regcore_urls:
-            return self.get_from_regcore(suffix, params=params)
-        elif self.base_url.startswith('http'):
-            return self.get_from_http(suffix, params=params)
+            return self.get_from_regcore(suffix, params=params,
+                                         validators=validators)
+        elif self.base_urls[0].startswith('sqlite://'):
+            return self.get_from_sqlite(suffix, params=params)
+        elif self.base_urls[0].startswith('http'):
+            return self.get_from_http(suffix, params=params,
+                                      validators=validators)
         else:
-            return self.get_from_file_system(suffix)
+            return self.get_from_file_system(suffix, validators=validators)
@@ -1,20 +1,481 @@
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
 from django.core.cache import get_cache
-from regulations.generator import api_client
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from regulations.generator import api_client, bulk, cache_codecs, degraded
+from regulations.generator.api_client import BudgetExceeded
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled import CompiledLayer
+from regulations.generator.lru import ByteLRU, footprint, MISSING
+from regulations.generator.refresh import refresher, swr_config
+from regulations.generator.singleflight import SingleFlight
+from regulations.generator.stats import Counters
+
+
+DEFAULT_COALESCE = {
+    # Also coalesce across processes by holding a lock entry in the cache.
+    # Only useful when api_cache is shared (e.g. memcached)
+    'CACHE_LOCK': False,
+    'LOCK_TIMEOUT': 10,     # seconds before waiters give up on the holder
+    'POLL_INTERVAL': 0.05,
+}
+
+#   Concurrent misses for the same key within this process share one fetch
+inflight = SingleFlight()
+#   Misses answered by another process which held the cache lock
+lock_counters = Counters('lock_acquired', 'lock_waits', 'lock_timeouts')
+
+
+def coalescing_stats():
+    stats = inflight.counters.snapshot()
+    stats.update(lock_counters.snapshot())
+    return stats
+
+
+DEFAULT_API_CACHE = {
+    'L2_ALIAS': 'api_cache',
+    #   Approximate ceiling on L1's memory per process; entries are charged
+    #   for their decoded objects, several times their encoded size
+    'L1_MAX_BYTES': 64 * 1024 * 1024,
+    'L1_MAX_ITEM_BYTES': 16 * 1024 * 1024,  # larger values skip L1
+    'CODEC': 'pickle',      # or 'compact' or a dotted path to a codec class
+    'CODEC_OPTIONS': {},    # e.g. {'compression': 'zlib'} for 'compact'
+    #   Cache published versions (trees, layers, diffs) indefinitely. Only
+    #   safe if invalidations reach every process, so None (the default)
+    #   enables it only when L2 is shared between processes
+    'IMMUTABLE_VERSIONS': None,
+    #   How often to check whether a part or version has been invalidated
+    'GENERATION_CHECK_INTERVAL': 5,
+    #   Seconds to remember that the API had no such resource (0: never)
+    'NOT_FOUND_TTL': 60,
+    #   Seconds past expiry to hold entries with validators (ETags, etc.),
+    #   so that they can be revalidated rather than re-fetched
+    'REVALIDATE_FOR': 24 * 60 * 60,
+    #   Seconds past expiry to hold entries, to be served if the API
+    #   doesn't answer within its latency budget
+    'STALE_IF_ERROR': 24 * 60 * 60,
+}
+
+_l1_caches = {}
+_l1_lock = threading.Lock()
+l2_counters = Counters('hits', 'misses', 'sets')
+#   'hits' are upstream calls saved by remembering a 404
+not_found_counters = Counters('stored', 'hits')
+#   'not_modified' are re-fetches answered without a body to parse
+revalidation_counters = Counters('conditional', 'not_modified')
+#   Fetches which exceeded their latency budget, and whether we had
+#   something stale to serve in their place
+budget_counters = Counters('exceeded', 'served_stale')
+#   Resources requested via ApiReader.prefetch: already cached, fetched in a
+#   bundle, or fetched individually
+prefetch_counters = Counters('cached', 'bundled', 'fetched')
+#   Layers compiled from their JSON, and compiled layers served from L1
+compiled_counters = Counters('compiled', 'reused')
+
+logger = logging.getLogger(__name__)
+
+
+class NotFound(object):
+    """Cached in place of a resource the API returned a 404 for, so that
+    it's distinguishable from a cache miss. A singleton, which pickles by
+    reference so that it survives a round trip through the cache"""
+    def __reduce__(self):
+        return 'NOT_FOUND'
+
+    def __nonzero__(self):
+        return False
+
+    def __repr__(self):
+        return 'NOT_FOUND'
+
+NOT_FOUND = NotFound()
+
+
+def api_cache_config():
+    config = dict(DEFAULT_API_CACHE)
+    config.update(getattr(settings, 'EREGS_API_CACHE', {}))
+    return config
+
+
+def is_shared(cache):
+    """Whether a Django cache is visible to other processes, i.e. whether
+    an invalidation recorded in it reaches them"""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def l1_cache(config=None):
+    """The in-process tier, shared by every ApiCache in this process"""
+    config = config or api_cache_config()
+    key = (config['L1_MAX_BYTES'], config['L1_MAX_ITEM_BYTES'])
+    if key not in _l1_caches:
+        with _l1_lock:
+            if key not in _l1_caches:
+                _l1_caches[key] = ByteLRU(*key)
+    return _l1_caches[key]
+
+
+def cache_stats():
+    """Hit/miss/eviction counters for each tier of the API cache"""
+    return {'l1': l1_cache().stats(), 'l2': l2_counters.snapshot(),
+            'not_found': not_found_counters.snapshot(),
+            'revalidation': revalidation_counters.snapshot(),
+            'budget': budget_counters.snapshot(),
+            'prefetch': prefetch_counters.snapshot(),
+            'compiled': compiled_counters.snapshot()}
+
+
+def copy_data(data):
+    """A copy of JSON-like data (dicts, lists and immutable leaves) which
+    is considerably faster than copy.deepcopy or unpickling"""
+    data_type = type(data)
+    if data_type is dict:
+        data = data.copy()
+        for key, value in data.iteritems():
+            if type(value) in (dict, list):
+                data[key] = copy_data(value)
+    elif data_type is list:
+        data = [copy_data(value) if type(value) in (dict, list) else value
+                for value in data]
+    return data
+
+
+tree_counters = Counters('derived', 'fetched')
+
+
+def immutable_scope(cache_key_elements):
+    """A published regulation version never changes, nor do its layers or
+    diffs between versions. For these immutable resources, return the
+    regulation part and the version(s) they belong to; None for mutable
+    resources (version lists, notices, etc.)"""
+    resource = cache_key_elements[0]
+    if resource in ('regulation', 'regulation-index'):
+        label, version = cache_key_elements[1:3]
+        return label.split('-')[0], [version]
+    elif resource == 'layer':
+        part, version = cache_key_elements[2:4]
+        return part, [version]
+    elif resource == 'diff':
+        label, older, newer = cache_key_elements[1:4]
+        return label.split('-')[0], [older, newer]
+
+#   (generation key) -> (generation, time checked)
+_generations = {}
+
+
+def generation_seed():
+    """Where a part's or version's generation starts: the current time in
+    milliseconds rather than 0, so that a generation which L2 drops (e.g.
+    culls) starts again beyond any value it had reached"""
+    return int(time.time() * 1000)
+
+
+def index_labels(tree):
+    """Map each label in the tree to the path (child indexes) to its node"""
+    index = {}
+    to_visit = [(tree, [])]
+    while to_visit:
+        node, path = to_visit.pop()
+        index['-'.join(node['label'])] = path
+        for idx, child in enumerate(node.get('children', [])):
+            to_visit.append((child, path + [idx]))
+    return index
+
+
+def ancestor_labels(label):
+    """Labels of the trees which might contain `label`, nearest first.
+    Interpretations nest under the interpretation of their parent
+    paragraph, e.g. 1005-2-a-Interp-1 lives in 1005-2-a-Interp, then
+    1005-2-Interp, 1005-Interp, and finally the part, 1005."""
+    parts = label.split('-')
+    candidates = []
+    if 'Interp' in parts:
+        interp_idx = parts.index('Interp')
+        for end in range(len(parts) - 1, interp_idx, -1):
+            candidates.append(parts[:end])
+        base = parts[:interp_idx]
+        for end in range(len(base) - 1, 0, -1):
+            candidates.append(base[:end] + ['Interp'])
+    else:
+        for end in range(len(parts) - 1, 0, -1):
+            candidates.append(parts[:end])
+    candidates.append(parts[:1])
+
+    seen = set([label])
+    for candidate in candidates:
+        candidate = '-'.join(candidate)
+        if candidate not in seen:
+            seen.add(candidate)
+            yield candidate
 
 
 class ApiCache(object):
-    """ Interface with the cache. """
+    """ Interface with the cache. Two tiers: an in-process LRU of decoded
+    objects, bounded by bytes (L1), in front of a Django cache holding
+    serialized values (L2, by default the 'api_cache' alias). Values are
+    copied on the way in and out of L1, so callers may mutate them. How
+    values are serialized for L2 is pluggable; see cache_codecs.
+
+    Each entry records when it stops being fresh; with stale-while-
+    revalidate enabled, entries are kept (stale) for a while longer. Entries
+    are held past expiry so that they can be revalidated with a conditional
+    request, if they have validators, or served if the API is too slow. """
     def __init__(self):
-        self.cache = get_cache('api_cache')
+        config = api_cache_config()
+        self.not_found_ttl = config['NOT_FOUND_TTL']
+        self.revalidate_for = config['REVALIDATE_FOR']
+        self.stale_if_error = config['STALE_IF_ERROR']
+        self.cache = get_cache(config['L2_ALIAS'])
+        self.immutable_versions = config['IMMUTABLE_VERSIONS']
+        if self.immutable_versions is None:
+            self.immutable_versions = is_shared(self.cache)
+        self.l1 = l1_cache(config)
+        self.codec = cache_codecs.get_codec(config['CODEC'],
+                                            config['CODEC_OPTIONS'])
+
+    def lifetimes(self):
+        """Seconds an entry is fresh for and seconds it is kept for
+        (None: forever)"""
+        swr = swr_config()
+        if swr['ENABLED']:
+            return swr['API_SOFT_TTL'], swr['API_HARD_TTL']
+        return self.cache.default_timeout, self.cache.default_timeout
+
+    def _held(self, key):
+        """Whatever is held for `key`, even if expired, as a tuple of the
+        value, when it's fresh until, when it expires, its validators and
+        whether it's shared (i.e. L1's copy, which must not be handed out
+        as-is); or None"""
+        entry = self.l1.get(key)
+        if entry is not MISSING:
+            return entry + (True,)
+        stored = self.cache.get(key)
+        if stored is None:
+            l2_counters.incr('misses')
+            return None
+        fresh_until, expires_at, encoded = stored[:3]
+        validators = stored[3] if len(stored) > 3 else None
+        if expires_at is not None and expires_at < time.time():
+            l2_counters.incr('misses')
+        else:
+            l2_counters.incr('hits')
+        value = cache_codecs.decode(encoded)
+        self._set_l1(key, value, fresh_until, expires_at, validators)
+        return value, fresh_until, expires_at, validators, False
+
+    def _lookup(self, key):
+        """The cached value, whether it's stale and whether it's shared,
+        or None"""
+        entry = self._held(key)
+        if entry is None:
+            return None
+        value, fresh_until, expires_at, _, shared = entry
+        now = time.time()
+        if expires_at is not None and expires_at < now:
+            return None
+        stale = fresh_until is not None and fresh_until < now
+        return value, stale, shared
+
+    def held(self, key):
+        """The value held for `key`, though it may be stale or expired;
+        None if there isn't one"""
+        entry = self._held(key)
+        if entry is not None and entry[0] is not NOT_FOUND:
+            value, shared = entry[0], entry[4]
+            return copy_data(value) if shared else value
+
+    def revalidation(self, key):
+        """A pair of the value held for `key`, though it may be stale or
+        expired, and its validators; None if there's nothing to revalidate"""
+        entry = self._held(key)
+        if entry is not None and entry[3]:
+            value, _, _, validators, shared = entry
+            return (copy_data(value) if shared else value), validators
+
+    def get_entry(self, key):
+        """A pair of the cached value and whether it is stale, or None if
+        there's no such entry"""
+        entry = self._lookup(key)
+        if entry is not None:
+            value, stale, shared = entry
+            return (copy_data(value) if shared else value), stale
 
     def get(self, key):
-        return self.cache.get(key)
+        """The cached value, if present and fresh"""
+        entry = self.get_entry(key)
+        if entry is not None and not entry[1]:
+            return entry[0]
+
+    def has(self, key):
+        """Whether get() would return a value (or a remembered 404), without
+        copying it"""
+        entry = self._lookup(key)
+        return entry is not None and not entry[1]
+
+    def get_node(self, key, path):
+        """Like get(), for a cached tree, but return (a copy of) only the
+        node reached by following `path`, a list of child indexes"""
+        entry = self._lookup(key)
+        if entry is not None and not entry[1] and entry[0] is not NOT_FOUND:
+            node, _, shared = entry
+            for idx in path:
+                node = node['children'][idx]
+            return copy_data(node) if shared else node
+
+    def get_item(self, key, item):
+        """Like get(), for a cached dict, but return (a copy of) only its
+        value for `item`; None if it has none"""
+        entry = self._lookup(key)
+        if entry is not None and not entry[1] and entry[0]:
+            value, _, shared = entry
+            value = value.get(item)
+            return copy_data(value) if shared else value
+
+    def set(self, key, value, immutable=False, validators=None):
+        """Immutable values never go stale or time out; they're only evicted
+        under memory pressure or by invalidate(). `validators` are those the
+        API client reported for the value"""
+        now = time.time()
+        fresh_for, keep_for = self.lifetimes()
+        if immutable and self.immutable_versions:
+            fresh_for, keep_for = None, None
+        fresh_until = now + fresh_for if fresh_for is not None else None
+        expires_at = now + keep_for if keep_for is not None else None
+        encoded = self.codec.encode(value)
+        if keep_for is not None:
+            keep_for += self.hold_for(validators)
+        if validators:
+            stored = (fresh_until, expires_at, encoded, validators)
+        else:
+            stored = (fresh_until, expires_at, encoded)
+        self.cache.set(key, stored, keep_for)
+        l2_counters.incr('sets')
+        self._set_l1(key, value, fresh_until, expires_at, validators)
+
+    def set_not_found(self, key):
+        """Remember, briefly, that the API has no such resource. Not
+        subject to stale-while-revalidate or the immutable policy: the
+        resource may yet be published"""
+        if not self.not_found_ttl:
+            return
+        expires_at = time.time() + self.not_found_ttl
+        encoded = self.codec.encode(NOT_FOUND)
+        self.cache.set(key, (expires_at, expires_at, encoded),
+                       self.not_found_ttl)
+        not_found_counters.incr('stored')
+        self._set_l1(key, NOT_FOUND, expires_at, expires_at)
+
+    def hold_for(self, validators=None):
+        """Seconds to hold an entry past its expiry"""
+        if validators:
+            return max(self.revalidate_for, self.stale_if_error)
+        return self.stale_if_error
+
+    def _set_l1(self, key, value, fresh_until, expires_at, validators=None):
+        """Keep a copy of a decoded value in L1, charged for its footprint
+        in memory"""
+        timeout = None
+        if expires_at is not None:
+            timeout = expires_at - time.time() + self.hold_for(validators)
+            if timeout <= 0:
+                return
+        self.l1.set(key, (copy_data(value), fresh_until, expires_at,
+                          validators), footprint(value), timeout)
+
+    def get_local(self, key):
+        """A value stored by set_local(), if present and fresh"""
+        entry = self.l1.get(key)
+        if entry is not MISSING:
+            value, fresh_until = entry[:2]
+            if fresh_until is None or fresh_until >= time.time():
+                return value
 
-    def set(self, key, value):
-        self.cache.set(key, value)
+    def set_local(self, key, value, size, immutable=False):
+        """Keep a value derived from API data (e.g. a compiled layer) in L1
+        only, for as long as the data would be fresh. It isn't copied on
+        the way in or out, so mustn't be modified"""
+        fresh_for = self.lifetimes()[0]
+        if immutable and self.immutable_versions:
+            fresh_for = None
+        fresh_until = None
+        if fresh_for is not None:
+            fresh_until = time.time() + fresh_for
+        self.l1.set(key, (value, fresh_until), size, fresh_for)
+
+    def acquire_lock(self, key, timeout):
+        """Atomically claim a lock entry. Returns a token identifying this
+        claim (for release_lock()), or None if someone else holds it"""
+        token = uuid.uuid4().hex
+        if self.cache.add(self.generate_key(['lock', key]), token, timeout):
+            return token
+
+    def release_lock(self, key, token):
+        """Delete the lock entry if it's still ours: if we held it past its
+        timeout, it may since have been claimed by someone else. (Django's
+        cache API has no atomic compare-and-delete, so a claim made between
+        the check and the delete can still be lost)"""
+        lock_key = self.generate_key(['lock', key])
+        if self.cache.get(lock_key) == token:
+            self.cache.delete(lock_key)
+
+    def generation(self, scope):
+        """Current generation of a part or version (see invalidate()),
+        re-checked against L2 every GENERATION_CHECK_INTERVAL seconds"""
+        key = 'generation-' + scope
+        generation, checked_at = _generations.get(key, (None, 0))
+        interval = api_cache_config()['GENERATION_CHECK_INTERVAL']
+        if checked_at + interval < time.time():
+            generation = self.cache.get(key)
+            if generation is None:
+                self.cache.add(key, generation_seed(), None)
+                generation = self.cache.get(key)
+            _generations[key] = (generation, time.time())
+        return generation
+
+    def invalidate(self, part=None, version=None):
+        """Drop every cached immutable resource for a regulation part and/or
+        a version. Rather than enumerating keys, bump the part's or
+        version's generation, which is part of the key of each immutable
+        resource; old entries are then unreachable and age out. Mutable
+        resources for the part are deleted outright, as are this process's
+        rendered fragments. Requires a shared L2 to affect other
+        processes (see is_shared)."""
+        scopes = []
+        if part:
+            scopes.append('part-' + part)
+        if version:
+            scopes.append('version-' + version)
+        for scope in scopes:
+            key = 'generation-' + scope
+            if not self.cache.add(key, generation_seed(), None):
+                try:
+                    self.cache.incr(key)
+                except ValueError:  # dropped since
+                    self.cache.add(key, generation_seed(), None)
+            _generations.pop(key, None)
+        if part:
+            self.cache.delete_many([
+                self.generate_key(['regversions', part]),
+                self.generate_key(['notices', part]),
+                self.generate_key(['notices']),
+                self.generate_key(['all_regulations_versions'])])
+        self.l1.clear()
+        fragments.clear()
 
     def generate_key(self, cache_key_elements):
-        return '-'.join(cache_key_elements)
+        key = '-'.join(cache_key_elements)
+        scope = immutable_scope(cache_key_elements)
+        if scope:
+            part, versions = scope
+            generations = [self.generation('part-' + part)]
+            generations.extend(self.generation('version-' + v)
+                               for v in versions)
+            key += '-g' + '.'.join(str(g) for g in generations)
+        return key
 
 
 class ApiReader(object):
@@ -25,25 +486,66 @@ class ApiReader(object):
         self.cache = ApiCache()
         self.client = api_client.ApiClient()
 
+    def resource(self, endpoint, **params):
+        """Cache key elements and API path of the resource which the
+        `endpoint` method (one of BULK_ENDPOINTS) reads given `params`"""
+        if endpoint == 'all_regulations_versions':
+            return ['all_regulations_versions'], 'regulation'
+        elif endpoint == 'regversions':
+            return (['regversions', params['label']],
+                    'regulation/%s' % params['label'])
+        elif endpoint == 'regulation':
+            label, version = params['label'], params['version']
+            return (['regulation', label, version],
+                    'regulation/%s/%s' % (label, version))
+        elif endpoint == 'layer':
+            layer_name, version = params['layer_name'], params['version']
+            regulation_part = params['label'].split('-')[0]
+            return (['layer', layer_name, regulation_part, version],
+                    'layer/%s/%s/%s' % (layer_name, regulation_part,
+                                        version))
+        elif endpoint == 'diff':
+            label, older, newer = (params['label'], params['older'],
+                                   params['newer'])
+            return (['diff', label, older, newer],
+                    'diff/%s/%s/%s' % (label, older, newer))
+        elif endpoint == 'notices':
+            if params.get('part'):
+                return (['notices', params['part']],
+                        'notice/%s' % params['part'])
+            return ['notices'], 'notices'
+        elif endpoint == 'notice':
+            part, number = params['part'], params['fr_document_number']
+            return (['notice', part, number],
+                    'notice/%s/%s' % (part, number))
+        raise ValueError('Unknown endpoint %r' % endpoint)
+
     def all_regulations_versions(self):
         """ Get all versions, for all regulations. """
-        return self._get(['all_regulations_versions'], 'regulation')
+        return self._get(*self.resource('all_regulations_versions'))
 
     def regversions(self, label):
-        return self._get(
-            ['regversions', label],
-            'regulation/%s' % label)
+        return self._get(*self.resource('regversions', label=label))
 
-    def cache_root_and_interps(self, reg_tree, version, is_root=True):
+    def cache_root_and_interps(self, reg_tree, version, is_root=True,
+                               validators=None):
         """We will re-use the root tree at multiple points during page
         rendering, so cache it now. If caching an interpretation, also store
         child interpretations with titles (so that, when rendering slide-down
-        interpretations, we don't perform additional fetches)"""
+        interpretations, we don't perform additional fetches). Roots are
+        indexed by label so that any of their descendants can be served
+        without another fetch. `validators` belong to the root"""
         if is_root or reg_tree.get('title'):
             tree_id = '-'.join(reg_tree['label'])
             cache_key = self.cache.generate_key(['regulation', tree_id,
                                                  version])
-            self.cache.set(cache_key, reg_tree)
+            self.cache.set(cache_key, reg_tree, immutable=True,
+                           validators=validators if is_root else None)
+        if is_root:
+            self.cache.set(
+                self.cache.generate_key(['regulation-index', tree_id,
+                                         version]),
+                index_labels(reg_tree), immutable=True)
 
         for child in reg_tree['children']:
             if child.get('node_type') == 'interp':
@@ -51,58 +553,265 @@ class ApiReader(object):
 
     def regulation(self, label, version):
         cache_key = self.cache.generate_key(['regulation', label, version])
-        cached = self.cache.get(cache_key)
+        return self._cached(
+            cache_key, lambda: self._fetch_regulation(label, version))
 
-        if cached is not None:
-            return cached
+    def _fetch_regulation(self, label, version):
+        cache_key_elements, api_suffix = self.resource(
+            'regulation', label=label, version=version)
+        cache_key = self.cache.generate_key(cache_key_elements)
+        validators = None
+        regulation = self.from_cached_ancestor(label, version)
+        if regulation is not None:
+            tree_counters.incr('derived')
         else:
-            regulation = self.client.get('regulation/%s/%s' % (label, version))
-            #Add the tree to the cache
-            if regulation:
-                self.cache_root_and_interps(regulation, version)
-                return regulation
+            tree_counters.incr('fetched')
+            regulation, validators = self._conditional_get(cache_key,
+                                                           api_suffix)
+        #Add the tree to the cache
+        if regulation:
+            self.cache_root_and_interps(regulation, version,
+                                        validators=validators)
+            return regulation
+        self.cache.set_not_found(cache_key)
+
+    def ancestor_paths(self, label, version):
+        """The cache key of each cached ancestor tree which indexes `label`,
+        nearest first, with the path to its node"""
+        for ancestor in ancestor_labels(label):
+            path = self.cache.get_item(self.cache.generate_key(
+                ['regulation-index', ancestor, version]), label)
+            if path is not None:
+                yield (self.cache.generate_key(['regulation', ancestor,
+                                                version]),
+                       path)
+
+    def from_cached_ancestor(self, label, version):
+        """Find the nearest cached tree which contains `label` and pull the
+        node out of it"""
+        for cache_key, path in self.ancestor_paths(label, version):
+            node = self.cache.get_node(cache_key, path)
+            if node is not None:
+                return node
 
     def _get(self, cache_key_elements, api_suffix, api_params={}):
         """ Retrieve from the cache whenever possible, or get from the API """
 
         cache_key = self.cache.generate_key(cache_key_elements)
-        cached = self.cache.get(cache_key)
+        immutable = immutable_scope(cache_key_elements) is not None
+        return self._cached(
+            cache_key, lambda: self._fetch(cache_key, api_suffix, api_params,
+                                           immutable))
 
-        if cached is not None:
-            return cached
+    def _fetch(self, cache_key, api_suffix, api_params, immutable=False):
+        element, validators = self._conditional_get(cache_key, api_suffix,
+                                                    api_params)
+        if element is None:
+            self.cache.set_not_found(cache_key)
         else:
-            element = self.client.get(api_suffix, api_params)
-            self.cache.set(cache_key, element)
-            return element
+            self.cache.set(cache_key, element, immutable, validators)
+        return element
+
+    def _conditional_get(self, cache_key, api_suffix, api_params={}):
+        """Fetch from the API; if we still hold an earlier copy with
+        validators, only fetch it again if it's changed. Returns the data
+        and its (new) validators"""
+        held = self.cache.revalidation(cache_key)
+        validators = dict(held[1]) if held else {}
+        if held:
+            revalidation_counters.incr('conditional')
+        element = self.client.get(api_suffix, api_params,
+                                  validators=validators)
+        if element is api_client.NOT_MODIFIED:
+            revalidation_counters.incr('not_modified')
+            return held[0], validators
+        return element, validators
+
+    def _cached(self, cache_key, fetch):
+        """Serve from the cache if possible, falling back to `fetch`. Stale
+        entries are served immediately while a background thread refreshes
+        them. A remembered 404 is served as None"""
+        entry = self.cache.get_entry(cache_key)
+        if entry is None or entry[0] is None:
+            return self._coalesce(cache_key, fetch)
+
+        value, stale = entry
+        if value is NOT_FOUND:
+            not_found_counters.incr('hits')
+            return None
+        if stale:
+            refresher().refresh(cache_key,
+                                lambda: inflight.do(cache_key, fetch))
+        return value
+
+    def _coalesce(self, cache_key, fetch):
+        """Concurrent misses on the same key wait on a single upstream
+        fetch. Waiters re-read the cache so that, like any other cache hit,
+        they receive their own copy of the data. If the API is too slow,
+        fall back to any stale copy we still hold"""
+        try:
+            result, shared = inflight.do(
+                cache_key, lambda: self._fetch_with_lock(cache_key, fetch))
+        except BudgetExceeded:
+            budget_counters.incr('exceeded')
+            held = self.cache.held(cache_key)
+            if held is None:
+                raise
+            budget_counters.incr('served_stale')
+            degraded.mark(cache_key)
+            return held
+        if shared:
+            cached = self.cache.get(cache_key)
+            if cached is NOT_FOUND:
+                return None
+            if cached is not None:
+                return cached
+            return copy_data(result)
+        return result
+
+    def _fetch_with_lock(self, cache_key, fetch):
+        """If configured, coordinate with other processes via a lock entry
+        in the cache: whoever holds the lock fetches; everyone else polls the
+        cache until the value appears or the lock times out"""
+        config = dict(DEFAULT_COALESCE)
+        config.update(getattr(settings, 'EREGS_API_COALESCE', {}))
+        if not config['CACHE_LOCK']:
+            return fetch()
+
+        deadline = time.time() + config['LOCK_TIMEOUT']
+        while True:
+            token = self.cache.acquire_lock(cache_key, config['LOCK_TIMEOUT'])
+            if token:
+                break
+            time.sleep(config['POLL_INTERVAL'])
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                lock_counters.incr('lock_waits')
+                return None if cached is NOT_FOUND else cached
+            if time.time() > deadline:
+                lock_counters.incr('lock_timeouts')
+                return fetch()
+
+        lock_counters.incr('lock_acquired')
+        try:
+            return fetch()
+        finally:
+            self.cache.release_lock(cache_key, token)
 
     def layer(self, layer_name, label, version):
-        regulation_part = label.split('-')[0]
-        return self._get(
-            ['layer', layer_name, regulation_part, version],
-            'layer/%s/%s/%s' % (layer_name, regulation_part, version))
+        return self._get(*self.resource(
+            'layer', layer_name=layer_name, label=label, version=version))
+
+    def compiled_layer(self, layer_name, label, version):
+        """ The layer as a CompiledLayer, compiled from its JSON once and
+        then kept in this process. None if there's no such layer. """
+        cache_key_elements, _ = self.resource(
+            'layer', layer_name=layer_name, label=label, version=version)
+        cache_key = 'compiled-' + self.cache.generate_key(cache_key_elements)
+        compiled = self.cache.get_local(cache_key)
+        if compiled is not None:
+            compiled_counters.incr('reused')
+            return compiled
+
+        layer_json = self.layer(layer_name, label, version)
+        if layer_json is not None:
+            compiled = CompiledLayer(layer_json)
+            self.cache.set_local(
+                cache_key, compiled, compiled.nbytes,
+                immutable_scope(cache_key_elements) is not None)
+            compiled_counters.incr('compiled')
+            return compiled
 
     def diff(self, label, older, newer):
         """ End point for diffs. """
-        return self._get(
-            ['diff', label, older, newer],
-            "diff/%s/%s/%s" % (label, older, newer))
+        return self._get(*self.resource(
+            'diff', label=label, older=older, newer=newer))
 
     def notices(self, part=None):
         """ End point for notice searching. Right now just a list. """
-        if part:
-            return self._get(
-                ['notices', part],
-                'notice/%s' % part)
-        else:
-            return self._get(
-                ['notices'],
-                'notices')
+        return self._get(*self.resource('notices', part=part))
 
     def notice(self, part, fr_document_number):
         """ End point for retrieving a single notice. """
-        return self._get(
-            ['notice', part, fr_document_number],
-            'notice/%s/%s' % (part, fr_document_number))
+        return self._get(*self.resource(
+            'notice', part=part, fr_document_number=fr_document_number))
+
+    #   Endpoints which bulk() will fetch: each is cached
+    BULK_ENDPOINTS = ('all_regulations_versions', 'regversions', 'regulation',
+                      'layer', 'diff', 'notices', 'notice')
+
+    def bulk(self, items, **config):
+        """Fetch many (endpoint, params) pairs at once, e.g.
+        ('layer', {'layer_name': 'terms', 'label': '1005', 'version': 'v1'}),
+        via the same cache as individual reads. `config` overrides
+        settings.EREGS_BULK_FETCH. Returns a BulkResult per item, in order"""
+        items = [(endpoint, dict(params)) for endpoint, params in items]
+        for endpoint, _ in items:
+            if endpoint not in self.BULK_ENDPOINTS:
+                raise ValueError('Cannot bulk fetch %r' % endpoint)
+
+        def fetch(item):
+            endpoint, params = item
+            return getattr(self, endpoint)(**params)
+        return bulk.BulkFetcher(**config).run(fetch, items)
+
+    def prefetch(self, items):
+        """Fetch, up front, the (endpoint, params) pairs which a view will
+        need (see bulk()), skipping any already cached. When the API has a
+        bundle endpoint, they're fetched in one request; otherwise
+        concurrently. Either way, results are cached under the same keys as
+        individual reads, so the view's own calls are cache hits. Errors
+        are left for those calls to encounter"""
+        missing = []
+        for endpoint, params in items:
+            if endpoint not in self.BULK_ENDPOINTS:
+                raise ValueError('Cannot prefetch %r' % endpoint)
+            cache_key_elements, api_suffix = self.resource(endpoint,
+                                                           **params)
+            cache_key = self.cache.generate_key(cache_key_elements)
+            if (self.cache.has(cache_key)
+                    or (endpoint == 'regulation' and any(
+                        self.cache.has(ancestor_key)
+                        for ancestor_key, _ in self.ancestor_paths(
+                            params['label'], params['version'])))):
+                prefetch_counters.incr('cached')
+            else:
+                missing.append((endpoint, params, cache_key_elements,
+                                api_suffix))
+        if not missing:
+            return
+
+        try:
+            bundle = self.client.get_bundle(
+                [api_suffix for _, _, _, api_suffix in missing])
+        except Exception:
+            logger.warning('Bundle request failed', exc_info=True)
+            bundle = None
+        if not isinstance(bundle, dict):
+            bundle = {}
+
+        unbundled = []
+        for endpoint, params, cache_key_elements, api_suffix in missing:
+            if api_suffix in bundle:
+                prefetch_counters.incr('bundled')
+                self._store(endpoint, cache_key_elements, bundle[api_suffix])
+            else:
+                prefetch_counters.incr('fetched')
+                unbundled.append((endpoint, params))
+        if unbundled:
+            self.bulk(unbundled)
+
+    def _store(self, endpoint, cache_key_elements, element):
+        """Cache a resource fetched by some means other than its endpoint
+        method, as that method would have"""
+        cache_key = self.cache.generate_key(cache_key_elements)
+        if element is None:
+            self.cache.set_not_found(cache_key)
+        elif endpoint == 'regulation':
+            self.cache_root_and_interps(element, cache_key_elements[2])
+        else:
+            self.cache.set(cache_key, element,
+                           immutable_scope(cache_key_elements) is not None)
 
     def search(self, query, version=None, regulation=None, page=0):
         """Search via the API. Never cache these (that's the duty of the search
@@ -0,0 +1,95 @@
+"""Fetch many things at once, for batch jobs (cache warming, offline
+generation): bounded concurrency, retries with backoff and an optional rate
+limit, so that a batch job can't overwhelm the API (or the site).
+
+Unlike executor, which fans out within a single request, each batch gets a
+pool of its own."""
+from collections import namedtuple
+import logging
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+from django.conf import settings
+
+from regulations.generator.stats import Counters
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BULK = {
+    'CONCURRENCY': 8,
+    'RETRIES': 2,       # further attempts after a failure
+    'BACKOFF': 0.5,     # seconds before the first retry; doubles thereafter
+    'RATE': None,       # maximum attempts per second (None: unlimited)
+}
+
+
+def bulk_config(**overrides):
+    """DEFAULT_BULK, overridden by settings.EREGS_BULK_FETCH and then by
+    keyword arguments"""
+    config = dict(DEFAULT_BULK)
+    config.update(getattr(settings, 'EREGS_BULK_FETCH', {}))
+    config.update(overrides)
+    return config
+
+
+#   `value` is None if every attempt failed, in which case `error` is the
+#   last exception
+BulkResult = namedtuple('BulkResult', ['item', 'value', 'error', 'attempts'])
+
+
+class RateLimiter(object):
+    """Space out calls to wait() so that at most `rate` return per second"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_at = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            start_at = max(now, self.next_at)
+            self.next_at = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+
+class BulkFetcher(object):
+    def __init__(self, **config):
+        self.config = bulk_config(**config)
+        self.limiter = RateLimiter(self.config['RATE'])
+        self.counters = Counters('fetched', 'retried', 'failed')
+
+    def attempt(self, func, item):
+        attempts, backoff = 0, self.config['BACKOFF']
+        while True:
+            attempts += 1
+            self.limiter.wait()
+            try:
+                value = func(item)
+                self.counters.incr('fetched')
+                return BulkResult(item, value, None, attempts)
+            except Exception as e:
+                if attempts > self.config['RETRIES']:
+                    self.counters.incr('failed')
+                    logger.warning('Giving up on %r after %d attempts', item,
+                                   attempts, exc_info=True)
+                    return BulkResult(item, None, e, attempts)
+                self.counters.incr('retried')
+                time.sleep(backoff)
+                backoff *= 2
+
+    def run(self, func, items):
+        """Call func on each item; a BulkResult for each, in order"""
+        items = list(items)
+        if not items:
+            return []
+        pool = ThreadPool(min(self.config['CONCURRENCY'], len(items)))
+        try:
+            return pool.map(lambda item: self.attempt(func, item), items)
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,163 @@
+"""Serialization of values written to the API cache. Every encoded value
+starts with a one byte tag naming its format, so values written under one
+codec can always be read back, whichever codec is configured now."""
+import cPickle
+import marshal
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    import lz4.block as lz4
+except ImportError:     # pragma: no cover
+    lz4 = None
+
+
+PICKLE, COMPACT, COMPACT_ZLIB, COMPACT_LZ4 = 'P', 'C', 'Z', 'L'
+
+
+class PickleCodec(object):
+    """The same pickles Django would have written"""
+    tag = PICKLE
+
+    def encode(self, value):
+        return PICKLE + cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Packer(object):
+    """Rewrites JSON-like data (dicts, lists, strings, numbers, booleans,
+    None) into marshal-friendly tuples. Dicts become a reference to their
+    key tuple (their "shape"; tree nodes share just a few) followed by their
+    values. Labels which extend their parent node's label only store the
+    new parts. JSON has no tuples, so tuples unambiguously mark our
+    encodings: (shape_id >= 0, *values) or (-1 - shared_prefix, *suffix)"""
+    def __init__(self):
+        self.shapes = []
+        self.shape_ids = {}
+
+    def shape_id(self, keys):
+        shape_id = self.shape_ids.get(keys)
+        if shape_id is None:
+            shape_id = self.shape_ids[keys] = len(self.shapes)
+            self.shapes.append(keys)
+        return shape_id
+
+    def pack(self, value, parent_label=None):
+        value_type = type(value)
+        if value_type is dict:
+            keys = tuple(value)
+            label = value.get('label')
+            if type(label) is not list:
+                label = None
+            packed = [self.shape_id(keys)]
+            for key in keys:
+                if key == 'label' and label is not None:
+                    packed.append(self.pack_label(label, parent_label))
+                else:
+                    packed.append(self.pack(value[key], label))
+            return tuple(packed)
+        elif value_type is list:
+            return [self.pack(item, parent_label) for item in value]
+        elif value_type in (unicode, str, int, long, float, bool) \
+                or value is None:
+            return value
+        raise _Unsupported(value_type)
+
+    def pack_label(self, label, parent_label):
+        shared = 0
+        if parent_label:
+            for mine, theirs in zip(label, parent_label):
+                if mine != theirs:
+                    break
+                shared += 1
+        if not shared:
+            return [self.pack(part) for part in label]
+        return (-1 - shared,) + tuple(label[shared:])
+
+
+def _unpack(value, shapes, parent_label=None):
+    value_type = type(value)
+    if value_type is tuple:
+        keys = shapes[value[0]]
+        node = {}
+        label = None
+        if 'label' in keys:
+            label = value[keys.index('label') + 1]
+            if type(label) is tuple:
+                label = parent_label[:-1 - label[0]] + list(label[1:])
+            node['label'] = label
+            if type(label) is not list:
+                label = None
+        for key, item in zip(keys, value[1:]):
+            if key != 'label':
+                node[key] = _unpack(item, shapes, label)
+        return node
+    elif value_type is list:
+        return [_unpack(item, shapes, parent_label) for item in value]
+    return value
+
+
+class CompactCodec(object):
+    """A compact binary encoding for regulation trees, layers and the like:
+    shape (key-dictionary) and label-prefix compression, serialized with
+    marshal and optionally compressed with zlib or lz4. Values which aren't
+    JSON-like fall back to pickle. marshal's format is specific to the
+    Python version; fine for a cache, not for long-term storage."""
+    def __init__(self, compression=None, level=6):
+        if compression == 'lz4' and lz4 is None:
+            raise ImproperlyConfigured(
+                'The lz4 package is required for lz4 compression')
+        if compression not in (None, 'zlib', 'lz4'):
+            raise ImproperlyConfigured(
+                'Unknown compression: {}'.format(compression))
+        self.compression = compression
+        self.level = level
+
+    def encode(self, value):
+        packer = _Packer()
+        try:
+            packed = packer.pack(value)
+        except _Unsupported:
+            return PickleCodec().encode(value)
+        encoded = marshal.dumps((tuple(packer.shapes), packed), 2)
+        if self.compression == 'zlib':
+            return COMPACT_ZLIB + zlib.compress(encoded, self.level)
+        elif self.compression == 'lz4':
+            return COMPACT_LZ4 + lz4.compress(encoded)
+        return COMPACT + encoded
+
+
+CODECS = {
+    'pickle': PickleCodec,
+    'compact': CompactCodec,
+}
+
+
+def get_codec(name, options=None):
+    """Look up a codec by short name or dotted path"""
+    codec_class = CODECS.get(name)
+    if codec_class is None:
+        codec_class = import_string(name)
+    return codec_class(**(options or {}))
+
+
+def decode(encoded):
+    tag, body = encoded[:1], encoded[1:]
+    if tag == PICKLE:
+        return cPickle.loads(body)
+    if tag == COMPACT_ZLIB:
+        body = zlib.decompress(body)
+    elif tag == COMPACT_LZ4:
+        if lz4 is None:
+            raise ImproperlyConfigured(
+                'The lz4 package is required to read this cache entry')
+        body = lz4.decompress(body)
+    elif tag != COMPACT:
+        raise ValueError('Unknown cache encoding: {!r}'.format(tag))
+    shapes, packed = marshal.loads(body)
+    return _unpack(packed, shapes)
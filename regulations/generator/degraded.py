@@ -0,0 +1,26 @@
+"""Tracks, per thread (i.e. per request), whether we've had to serve stale
+API data because the API didn't answer within its latency budget. Such
+responses are flagged and kept out of page caches; see
+regulations.middleware.DegradedResponseMiddleware."""
+import threading
+
+
+_local = threading.local()
+
+
+def reset():
+    _local.reasons = []
+
+
+def mark(reason):
+    if not hasattr(_local, 'reasons'):
+        reset()
+    _local.reasons.append(reason)
+
+
+def reasons():
+    return list(getattr(_local, 'reasons', []))
+
+
+def is_degraded():
+    return bool(getattr(_local, 'reasons', None))
@@ -0,0 +1,68 @@
+"""A small, process-wide thread pool for fanning out I/O-bound work (mostly
+API fetches) within a single request."""
+from multiprocessing.pool import ThreadPool
+import threading
+
+from django.conf import settings
+
+from regulations.generator import degraded
+
+
+DEFAULT_WIDTH = 8
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+
+
+def width():
+    return getattr(settings, 'EREGS_FETCH_WORKERS', DEFAULT_WIDTH)
+
+
+def _pool(size, name='map'):
+    key = (name, size)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ThreadPool(size)
+    return pool
+
+
+def _in_worker(func):
+    """Run func in a worker, bringing back whether it had to serve stale
+    data, as that's tracked per thread"""
+    def wrapped(item):
+        _local.in_worker = True
+        degraded.reset()
+        try:
+            return func(item), degraded.reasons()
+        finally:
+            _local.in_worker = False
+    return wrapped
+
+
+def map_concurrently(func, items, size=None):
+    """Like map(func, items), but run on a bounded thread pool. Results are
+    returned in the order of `items`; the first exception raised is
+    re-raised here. Calls made from within a worker (or with a width of 1)
+    run inline so that nested fan-outs can't exhaust the pool and deadlock"""
+    items = list(items)
+    size = size or width()
+    if (len(items) < 2 or size < 2
+            or getattr(_local, 'in_worker', False)):
+        return [func(item) for item in items]
+    results = []
+    for result, reasons in _pool(size).map(_in_worker(func), items):
+        for reason in reasons:
+            degraded.mark(reason)
+        results.append(result)
+    return results
+
+
+def submit(func, args, size):
+    """Run func(*args) in the background, returning an AsyncResult. Uses a
+    pool of its own, so that a worker of map_concurrently's pool waiting on
+    it can't deadlock. func mustn't itself wait on work submitted here"""
+    return _pool(size, 'background').apply_async(func, args)
@@ -4,6 +4,7 @@ import re
 from django.conf import settings
 
 import api_reader
+import executor
 from layers.defined import DefinedLayer
 from layers.definitions import DefinitionsLayer
 from layers.external_citation import ExternalCitationLayer
@@ -12,6 +13,7 @@ from layers.internal_citation import InternalCitationLayer
 from layers.interpretations import InterpretationsLayer
 from layers.key_terms import KeyTermsLayer
 from layers.meta import MetaLayer
+from layers.compiled import COMPILED_LAYERS, CompiledLayer
 from layers.layers_applier import InlineLayersApplier
 from layers.layers_applier import ParagraphLayersApplier
 from layers.layers_applier import SearchReplaceLayersApplier
@@ -22,6 +24,12 @@ from layers.diff_applier import DiffApplier
 from layers.utils import convert_to_python
 from html_builder import HTMLBuilder
 import notices
+from stats import Counters
+
+
+#   Layer objects prepared for the registry, and those reused from it (see
+#   LayerCreator.build_layer)
+registry_counters = Counters('built', 'reused')
 
 
 class LayerCreator(object):
@@ -62,7 +70,10 @@ class LayerCreator(object):
         self.api = api_reader.ApiReader()
 
     def get_layer_json(self, api_name, regulation, version):
-        """ Hit the API to retrieve the regulation JSON. """
+        """ Hit the API to retrieve the regulation JSON. Layers which map
+        labels to elements come compiled (see layers.compiled). """
+        if api_name in COMPILED_LAYERS:
+            return self.api.compiled_layer(api_name, regulation, version)
         return self.api.layer(api_name, regulation, version)
 
     def add_layer(self, layer_name, regulation, version, sectional=False):
@@ -77,38 +88,81 @@ class LayerCreator(object):
                 logging.warning("No data for %s/%s/%s"
                                 % (api_name, regulation, version))
             else:
-                layer = layer_class(layer_json)
-
-                if sectional and hasattr(layer, 'sectional'):
-                    layer.sectional = sectional
-                if hasattr(layer, 'version'):
-                    layer.version = version
-
+                layer = self.build_layer(layer_name, layer_json, regulation,
+                                         version, sectional)
                 self.appliers[applier_type].add_layer(layer)
 
+    @staticmethod
+    def prepare_layer(layer_class, layer_json, version, sectional):
+        layer = layer_class(layer_json)
+
+        if sectional and hasattr(layer, 'sectional'):
+            layer.sectional = sectional
+        if hasattr(layer, 'version'):
+            layer.version = version
+        return layer
+
+    def build_layer(self, layer_name, layer_json, regulation, version,
+                    sectional=False):
+        """ The layer object for layer_json. Those built from a compiled
+        layer (see layers.compiled) are prepared once per (layer, part,
+        version, sectional) and shared by every request in this process, for
+        as long as the compiled layer is cached; each request gets its own
+        copy of any per-request state (for_request()). """
+        layer_class = LayerCreator.LAYERS[layer_name][2]
+        if not isinstance(layer_json, CompiledLayer):
+            return self.prepare_layer(layer_class, layer_json, version,
+                                      sectional)
+
+        key = ('layer-object', layer_name, regulation.split('-')[0], version,
+               bool(sectional))
+        entry = self.api.cache.get_local(key)
+        if entry is not None and entry[0] is layer_json:
+            registry_counters.incr('reused')
+            layer = entry[1]
+        else:
+            layer = self.prepare_layer(layer_class, layer_json, version,
+                                       sectional)
+            self.api.cache.set_local(key, (layer_json, layer),
+                                     layer_json.nbytes, immutable=True)
+            registry_counters.incr('built')
+
+        if hasattr(layer, 'for_request'):
+            layer = layer.for_request()
+        return layer
+
+    def get_layer_jsons(self, api_names, regulation, version):
+        """Fetch the JSON for several layers concurrently. Returns a dict
+        keyed by api_name"""
+        api_names = sorted(set(api_names))
+        layer_jsons = executor.map_concurrently(
+            lambda api_name: self.get_layer_json(api_name, regulation,
+                                                 version),
+            api_names)
+        return dict(zip(api_names, layer_jsons))
+
     def add_layers(self, layer_names, regulation, version, sectional=False):
         """Request a list of layers."""
         #This doesn't deal with sectional interpretations yet.
         #we'll have to do that.
-        layer_names = set(filter(lambda l: l.lower() in LayerCreator.LAYERS,
-                                 layer_names))
- 
-        #   Spawn threads
+        layer_names = sorted(set(
+            filter(lambda l: l.lower() in LayerCreator.LAYERS, layer_names)))
+
+        #   Fetch concurrently, but add to the appliers in a fixed order
+        layer_jsons = self.get_layer_jsons(
+            [LayerCreator.LAYERS[l][0] for l in layer_names],
+            regulation, version)
+
         for layer_name in layer_names:
             api_name, applier_type, layer_class = LayerCreator.LAYERS[layer_name]
-            layer_json = self.get_layer_json(api_name, regulation, version)
+            layer_json = layer_jsons[api_name]
 
             if layer_json is None:
                 logging.warning("No data for %s/%s/%s"
                                 % (api_name, regulation, version))
             else:
-                layer = layer_class(layer_json)
- 
-                if sectional and hasattr(layer, 'sectional'):
-                    layer.sectional = sectional
-                if hasattr(layer, 'version'):
-                    layer.version = version
- 
+                layer = self.build_layer(layer_name, layer_json, regulation,
+                                         version, sectional)
                 self.appliers[applier_type].add_layer(layer)
 
     def get_appliers(self):
@@ -146,6 +200,22 @@ class DiffLayerCreator(LayerCreator):
         layer_json = self.combine_layer_versions(older_layer, newer_layer)
         return layer_json
 
+    def get_layer_jsons(self, api_names, regulation, version):
+        """Fetch both the older and newer versions of every layer in one
+        concurrent batch, then combine them"""
+        api_names = sorted(set(api_names))
+        jobs = [(api_name, v) for api_name in api_names
+                for v in (version, self.newer_version)]
+        fetched = executor.map_concurrently(
+            lambda job: self.api.layer(job[0], regulation, job[1]), jobs)
+        fetched = dict(zip(jobs, fetched))
+
+        return dict(
+            (api_name, self.combine_layer_versions(
+                fetched[(api_name, version)],
+                fetched[(api_name, self.newer_version)]))
+            for api_name in api_names)
+
 
 def get_regulation(regulation, version):
     """ Get the regulation JSON tree. Manipulate the label a bit for easier
@@ -172,6 +242,25 @@ def get_tree_paragraph(paragraph_id, version):
     return api.regulation(paragraph_id, version)
 
 
+def prefetch_page(label_id, version):
+    """Fetch everything a regulation page (the tree, its layers, the
+    regulation's versions and notices) will need, up front and in as few
+    requests as possible, so that rendering it only hits the cache."""
+    if not version:
+        return
+    reg_part = label_id.split('-')[0]
+    layer_names = set(api_name for api_name, _, _
+                      in LayerCreator.LAYERS.values())
+    layer_names.add('analyses')     # for the sidebar
+    items = [('regversions', {'label': reg_part}),
+             ('notices', {'part': reg_part}),
+             ('regulation', {'label': label_id, 'version': version})]
+    items.extend(('layer', {'layer_name': name, 'label': reg_part,
+                            'version': version})
+                 for name in sorted(layer_names))
+    api_reader.ApiReader().prefetch(items)
+
+
 def get_builder(regulation, version, inline_applier, p_applier, s_applier):
     """ Returns an HTML builder with the appliers, and the regulation tree. """
     builder = HTMLBuilder(inline_applier, p_applier, s_applier)
@@ -4,8 +4,10 @@ import re
 
 from itertools import ifilter, ifilterfalse, takewhile
 
+import api_reader
+import node_cache
 from node_types import to_markup_id, APPENDIX, INTERP
-from layers.layers_applier import LayersApplier
+from layers.layers_applier import LayersApplier, to_locations
 from layers.internal_citation import InternalCitationLayer
 
 
@@ -23,6 +25,10 @@ class HTMLBuilder():
         self.p_applier = p_applier
         self.search_applier = search_applier
         self.diff_applier = diff_applier
+        #   Set to the tree's version to share nodes' marked up text with
+        #   other views, through the node cache
+        self.cache_version = None
+        self.node_cache_scope = None
 
     def generate_all_html(self):
         self.generate_html(self.tree[''])
@@ -30,6 +36,10 @@ class HTMLBuilder():
     def generate_html(self):
         if self.diff_applier:
             self.diff_applier.tree_changes(self.tree)
+        elif self.cache_version:
+            #   Includes the part's and version's generations
+            self.node_cache_scope = api_reader.ApiReader().cache.generate_key(
+                ['regulation', self.tree['label'][0], self.cache_version])
         for layer in self.p_applier.layers.values():
             if hasattr(layer, 'preprocess_root'):
                 layer.preprocess_root(self.tree)
@@ -104,38 +114,10 @@ class HTMLBuilder():
             return False
 
         if len(node['text']):
-            inline_elements = self.inline_applier.get_layer_pairs(
-                node['label_id'], node['text'])
-            search_elements = self.search_applier.get_layer_pairs(
-                node['label_id'])
-
-            if self.diff_applier:
-                node['marked_up'] = self.diff_applier.apply_diff(
-                    node['text'], node['label_id'])
-
-            layers_applier = LayersApplier()
-            layers_applier.enqueue_from_list(inline_elements)
-            layers_applier.enqueue_from_list(search_elements)
-
-            if 'marked_up' in node:
-                node['marked_up'] = layers_applier.apply_layers(
-                    node['marked_up'])
-            else:
-                node['marked_up'] = layers_applier.apply_layers(node['text'])
-            node['marked_up'] = HTMLBuilder.section_space(node['marked_up'])
-
+            self.process_node_text(node, self.mark_up_text)
         elif is_table(node['label_id'], format_layer_data):
             # if this is a table, render it anyway
-            layers_applier = LayersApplier()
-            search_elements = self.search_applier.get_layer_pairs(
-                node['label_id'])
-            layers_applier.enqueue_from_list(search_elements)
-            if 'marked_up' in node:
-                node['marked_up'] = layers_applier.apply_layers(
-                    node['marked_up'])
-            else:
-                node['marked_up'] = layers_applier.apply_layers(node['text'])
-            node['marked_up'] = HTMLBuilder.section_space(node['marked_up'])
+            self.process_node_text(node, self.mark_up_table)
 
         node = self.p_applier.apply_layers(node)
 
@@ -153,6 +135,64 @@ class HTMLBuilder():
         for c in node['children']:
             self.process_node(c)
 
+    def mark_up_text(self, node):
+        inline_elements = self.inline_applier.get_layer_pairs(
+            node['label_id'], node['text'])
+        search_elements = self.search_applier.get_layer_pairs(
+            node['label_id'])
+
+        if self.diff_applier:
+            node['marked_up'] = self.diff_applier.apply_diff(
+                node['text'], node['label_id'])
+            #   Offsets into the text don't carry over to the diff
+            inline_elements = to_locations(inline_elements, node['text'])
+
+        layers_applier = LayersApplier()
+        layers_applier.enqueue_from_list(inline_elements)
+        layers_applier.enqueue_from_list(search_elements)
+
+        if 'marked_up' in node:
+            marked_up = layers_applier.apply_layers(node['marked_up'])
+        else:
+            marked_up = layers_applier.apply_layers(node['text'])
+        return HTMLBuilder.section_space(marked_up)
+
+    def mark_up_table(self, node):
+        layers_applier = LayersApplier()
+        search_elements = self.search_applier.get_layer_pairs(
+            node['label_id'])
+        layers_applier.enqueue_from_list(search_elements)
+        if 'marked_up' in node:
+            marked_up = layers_applier.apply_layers(node['marked_up'])
+        else:
+            marked_up = layers_applier.apply_layers(node['text'])
+        return HTMLBuilder.section_space(marked_up)
+
+    def process_node_text(self, node, mark_up):
+        """ Set the node's marked_up text. With a node_cache_scope, it's
+        shared through the node cache, keyed by everything it depends on:
+        the scope (part, version and their generations), the node's label,
+        the layers applied, whether those layers with elements for this
+        node link within a section, and a hash of the text being marked up.
+        Layers link the same way in every view of a node without
+        citations, so those are shared between sectional and full
+        regulation views. """
+        if self.node_cache_scope is None:
+            node['marked_up'] = mark_up(node)
+            return
+
+        label_id = node['label_id']
+        sectional = tuple(sorted(
+            (name, layer.sectional)
+            for name, layer in self.inline_applier.layers.items()
+            if hasattr(layer, 'sectional')
+            and label_id in getattr(layer, 'layer', ())))
+        key = (self.node_cache_scope, label_id, mark_up.__name__,
+               tuple(sorted(self.inline_applier.layers)),
+               tuple(sorted(self.search_applier.layers)), sectional,
+               node_cache.content_hash(node.get('marked_up', node['text'])))
+        node['marked_up'] = node_cache.marked_up(key, lambda: mark_up(node))
+
     def modify_interp_node(self, node):
         """Add extra fields which only exist on interp nodes"""
         #   ['105', '22', 'Interp'] => section header
@@ -0,0 +1,71 @@
+"""Layer JSON compiled once per (layer, label, version) into an index of
+each label's elements and their offsets, rather than walked (and copied out
+of the API cache) on every request."""
+import sys
+
+from regulations.generator.lru import footprint
+
+
+#   API names of the layers whose JSON maps labels to lists of elements
+COMPILED_LAYERS = ('external-citations', 'formatting', 'graphics',
+                   'internal-citations', 'keyterms', 'paragraph-markers',
+                   'terms')
+#   An index row: a (start, end, element) tuple and its ints
+ROW_BYTES = sys.getsizeof((0, 0, None)) + 2 * sys.getsizeof(0)
+
+
+class CompiledLayer(object):
+    """Each label's elements, along with (start, end, element) for each
+    pair of offsets they have, converted to ints. Reads like the JSON dict
+    it was compiled from (`label in layer`, `layer[label]`,
+    `layer.get(label)`), so layer classes may be given either; entries
+    which aren't lists of elements (e.g. the terms layer's 'referenced') are
+    kept as they are. Shared between requests, so must not be modified."""
+
+    def __init__(self, layer_json):
+        self.extra = {}
+        self.elements = {}
+        self.index = {}     # label -> [(start, end, element)]
+        for label, elements in layer_json.iteritems():
+            if not isinstance(elements, list):
+                self.extra[label] = elements
+                continue
+            self.elements[label] = elements
+            self.index[label] = [
+                (int(start), int(end), element)
+                for element in elements if isinstance(element, dict)
+                for start, end in element.get('offsets') or []]
+        #   The JSON, plus the index's lists and rows (but not the elements
+        #   they share with the JSON)
+        self.nbytes = footprint(layer_json) + sum(
+            sys.getsizeof(offsets) + len(offsets) * ROW_BYTES
+            for offsets in self.index.itervalues())
+
+    def __contains__(self, key):
+        return key in self.elements or key in self.extra
+
+    def __getitem__(self, key):
+        if key in self.extra:
+            return self.extra[key]
+        return self.elements[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        return iter(list(self.elements) + list(self.extra))
+
+    def offsets(self, label):
+        """(start, end, element) for each pair of offsets of each of the
+        label's elements"""
+        return self.index.get(label, [])
+
+
+def element_offsets(layer, label):
+    """CompiledLayer.offsets(), for either a CompiledLayer or the layer's
+    JSON"""
+    if isinstance(layer, CompiledLayer):
+        return layer.offsets(label)
+    return [(int(start), int(end), element)
+            for element in layer.get(label, [])
+            for start, end in element['offsets']]
@@ -0,0 +1,175 @@
+"""The small templates layers render many times per page (citation links,
+paragraph markers, key terms, ...), compiled from Django's parsed nodes
+into plain Python renderers. Rendering one skips building a Context and
+walking the node tree, but converts and escapes values with Django's own
+render_value_in_context, so the output is identical.
+
+Only text, comments, variables (dict lookups, optionally `|safe`),
+`{% if variable %}`/`{% else %}` and constant `{% static %}` tags are
+supported. Any other template (e.g. a site's override of one of ours, using
+other tags or filters) is left to Django, as is any render with a value the
+compiled form can't resolve exactly (a missing key, an object, a
+callable)."""
+import weakref
+
+from django.template import Context
+from django.template.base import (
+    render_value_in_context, Template, TextNode, Variable, VariableNode)
+from django.template.context import BaseContext
+from django.template.defaultfilters import safe
+from django.template.defaulttags import (
+    CommentNode, IfNode, LoadNode, TemplateLiteral)
+from django.templatetags.static import StaticNode
+from django.utils.encoding import force_text
+from django.utils.safestring import EscapeData, mark_safe, SafeText
+
+
+TEXT, VAR, IF = range(3)
+MISSING = object()
+#   Only read, for its (default) autoescape, use_l10n and use_tz
+DEFAULT_CONTEXT = Context()
+
+#   Django template -> its compiled nodes, or None if it can't be compiled.
+#   Templates are compiled on first use; the cached loader keeps them
+_compiled = weakref.WeakKeyDictionary()
+
+
+def escape(text):
+    """django.utils.html.escape, without its lazy-string wrapper or marking
+    the result safe (the whole rendering is, once joined)"""
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;')
+            .replace("'", '&#39;'))
+
+
+class Unsupported(Exception):
+    """The template, or a value being rendered, needs Django"""
+
+
+def compile_expression(filter_expression):
+    """(lookups, whether |safe is applied) for a variable"""
+    var = filter_expression.var
+    if (not isinstance(var, Variable) or var.literal is not None
+            or var.translate):
+        raise Unsupported
+    for func, args in filter_expression.filters:
+        if func is not safe or args:
+            raise Unsupported
+    return var.lookups, bool(filter_expression.filters)
+
+
+def compile_nodes(nodelist):
+    nodes = []
+    for node in nodelist:
+        if isinstance(node, TextNode):
+            nodes.append((TEXT, node.s))
+        elif isinstance(node, (CommentNode, LoadNode)):
+            continue
+        elif (isinstance(node, StaticNode) and node.varname is None
+              and not isinstance(node.path.var, Variable)):
+            nodes.append((TEXT, force_text(node.render(Context()))))
+        elif isinstance(node, VariableNode):
+            nodes.append((VAR,) + compile_expression(node.filter_expression))
+        elif isinstance(node, IfNode):
+            branches = []
+            for condition, branch in node.conditions_nodelists:
+                lookups = None
+                if condition is not None:
+                    if not isinstance(condition, TemplateLiteral):
+                        raise Unsupported
+                    lookups, is_safe = compile_expression(condition.value)
+                    if is_safe:
+                        raise Unsupported
+                branches.append((lookups, compile_nodes(branch)))
+            nodes.append((IF, branches))
+        else:
+            raise Unsupported
+
+    merged = []
+    for node in nodes:
+        if merged and node[0] == TEXT and merged[-1][0] == TEXT:
+            merged[-1] = (TEXT, merged[-1][1] + node[1])
+        else:
+            merged.append(node)
+    return merged
+
+
+def lookup(context, lookups):
+    """The value Django would resolve, MISSING if a key isn't present"""
+    value = context
+    for bit in lookups:
+        if not isinstance(value, dict):
+            raise Unsupported
+        value = value.get(bit, MISSING)
+        if value is MISSING:
+            return value
+    if callable(value):
+        raise Unsupported
+    return value
+
+
+def render_nodes(nodes, context, pieces):
+    for node in nodes:
+        if node[0] == TEXT:
+            pieces.append(node[1])
+        elif node[0] == VAR:
+            value = lookup(context, node[1])
+            if value is MISSING or isinstance(value, EscapeData):
+                raise Unsupported
+            if node[2]:
+                value = safe(value)
+            #   What render_value_in_context does with text, directly
+            if type(value) is unicode:
+                pieces.append(escape(value))
+            elif type(value) is str:
+                pieces.append(escape(force_text(value)))
+            elif type(value) is SafeText:
+                pieces.append(value)
+            else:
+                pieces.append(render_value_in_context(value, DEFAULT_CONTEXT))
+        else:
+            for lookups, branch in node[1]:
+                if lookups is None:
+                    matched = True
+                else:
+                    value = lookup(context, lookups)
+                    matched = value is not MISSING and value
+                if matched:
+                    render_nodes(branch, context, pieces)
+                    break
+
+
+class CompiledTemplate(object):
+    """Renders like the Django template it was compiled from, given a dict
+    or a Context"""
+    def __init__(self, template, nodes):
+        self.template = template
+        self.nodes = nodes
+
+    def render(self, context=None):
+        if isinstance(context, BaseContext):
+            context = context.flatten()
+        context = context or {}
+        pieces = []
+        try:
+            render_nodes(self.nodes, context, pieces)
+        except Unsupported:
+            return self.template.render(Context(context))
+        return mark_safe(u''.join(pieces))
+
+
+def compile_template(template):
+    """A CompiledTemplate for a template returned by loader.get_template,
+    or the template itself if it can't be compiled"""
+    source = getattr(template, 'template', None)
+    if not isinstance(source, Template):
+        return template
+    if source not in _compiled:
+        try:
+            _compiled[source] = compile_nodes(source.nodelist)
+        except Unsupported:
+            _compiled[source] = None
+    nodes = _compiled[source]
+    if nodes is None:
+        return template
+    return CompiledTemplate(template, nodes)
@@ -1,12 +1,16 @@
 from django.template import loader, Context
 
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled_templates import compile_template
+
 
 class DefinedLayer(object):
     shorthand = 'defined'
 
     def __init__(self, layer):
         self.layer = layer
-        self.template = loader.get_template('regulations/layers/defining.html')
+        self.template = compile_template(
+            loader.get_template('regulations/layers/defining.html'))
 
     def apply_layer(self, text, text_index):
         """Catch all terms which are defined in this paragraph, replace them
@@ -16,8 +20,9 @@ class DefinedLayer(object):
             if text_index == ref_struct['reference']:
                 pos = tuple(ref_struct['position'])
                 original = text[pos[0]:pos[1]]
-                context = Context({'term': original})
-                replacement = self.template.render(context)
-                replacement = replacement.strip('\n')
+                replacement = fragments.rendered(
+                    (self.shorthand, original),
+                    lambda: self.template.render(
+                        Context({'term': original})).strip('\n'))
                 layer_pairs.append((original, replacement, pos))
         return layer_pairs
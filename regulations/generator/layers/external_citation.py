@@ -1,5 +1,9 @@
 import urllib
 from django.template import loader
+
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled import element_offsets
+from regulations.generator.layers.compiled_templates import compile_template
 import utils
 
 
@@ -20,8 +24,8 @@ class ExternalCitationLayer():
         fdsys_url_base = "http://api.fdsys.gov/link"
         fdsys_url = "%s?%s" % (fdsys_url_base, urllib.urlencode(parameters))
 
-        template = loader.get_template(
-            'regulations/layers/external_citation.html')
+        template = compile_template(loader.get_template(
+            'regulations/layers/external_citation.html'))
         context = {
             'citation': {
                 'url': fdsys_url,
@@ -76,18 +80,18 @@ class ExternalCitationLayer():
         return generator
 
     def create_link(self, text, layer_element):
-        generator = self.citation_type_to_generator(
-            layer_element['citation_type'])
-        return generator(text, layer_element['citation'])
+        citation_type = layer_element['citation_type']
+        citation = layer_element['citation']
+        generator = self.citation_type_to_generator(citation_type)
+        key = (self.shorthand, citation_type, tuple(citation), text)
+        return fragments.rendered(key, lambda: generator(text, citation))
 
     def apply_layer(self, text, text_index):
         if text_index in self.layer:
-            layer_elements = self.layer[text_index]
-
             layer_pairs = []
-            for layer_element in layer_elements:
-                for start, end in layer_element['offsets']:
-                    ot = text[int(start):int(end)]
-                    rt = self.create_link(ot, layer_element)
-                    layer_pairs.append((ot, rt, (start, end)))
+            for start, end, layer_element in element_offsets(self.layer,
+                                                             text_index):
+                ot = text[start:end]
+                rt = self.create_link(ot, layer_element)
+                layer_pairs.append((ot, rt, (start, end)))
             return layer_pairs
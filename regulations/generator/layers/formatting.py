@@ -3,6 +3,8 @@ import re
 
 from django.template import loader, Context
 
+from regulations.generator.layers.compiled_templates import compile_template
+
 
 class FormattingLayer(object):
     shorthand = 'formatting'
@@ -12,9 +14,11 @@ class FormattingLayer(object):
         self.table_tpl = loader.get_template('regulations/layers/table.html')
         self.note_tpl = loader.get_template('regulations/layers/note.html')
         self.code_tpl = loader.get_template('regulations/layers/code.html')
-        self.subscript_tpl = loader.get_template(
-            'regulations/layers/subscript.html')
-        self.dash_tpl = loader.get_template('regulations/layers/dash.html')
+        #   Those without loops render through compiled templates
+        self.subscript_tpl = compile_template(loader.get_template(
+            'regulations/layers/subscript.html'))
+        self.dash_tpl = compile_template(
+            loader.get_template('regulations/layers/dash.html'))
 
     def render_table(self, table):
         max_width = 0
@@ -26,11 +30,10 @@ class FormattingLayer(object):
         row_max = max(len(row) for row in table['rows'])
         max_width = max(max_width, row_max)
 
-        #  Now pad rows if needed
-        for row in table['rows']:
-            row.extend([''] * (max_width - len(row)))
+        #  Now pad rows if needed (in a copy; the layer may be shared)
+        rows = [row + [''] * (max_width - len(row)) for row in table['rows']]
 
-        context = Context(table)
+        context = Context(dict(table, rows=rows))
         #   Remove new lines so that they don't get escaped on display
         return self.table_tpl.render(context).replace('\n', '')
 
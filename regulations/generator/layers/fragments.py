@@ -0,0 +1,63 @@
+"""Rendered inline fragments (citation and definition links, key term and
+paragraph marker tags, graphics), shared by every request in this process.
+Each is keyed by the layer it comes from and everything its output depends
+on, e.g. (label, text, version, sectional) for an internal citation."""
+import threading
+
+from django.conf import settings
+
+from regulations.generator.lru import ByteLRU, footprint, MISSING
+
+
+DEFAULT_FRAGMENT_CACHE = {
+    'MAX_BYTES': 8 * 1024 * 1024,       # of memory per process
+    'MAX_ITEM_BYTES': 64 * 1024,        # larger fragments aren't kept
+    #   Seconds to keep a fragment, so that other processes' invalidations
+    #   (see ApiCache.invalidate) take effect here eventually. None: forever
+    'TIMEOUT': 60 * 60,
+}
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def fragment_cache_config():
+    config = dict(DEFAULT_FRAGMENT_CACHE)
+    config.update(getattr(settings, 'EREGS_FRAGMENT_CACHE', {}))
+    return config
+
+
+def fragment_cache(config=None):
+    """The LRU of fragments, shared by every layer in this process"""
+    config = config or fragment_cache_config()
+    key = (config['MAX_BYTES'], config['MAX_ITEM_BYTES'])
+    if key not in _caches:
+        with _lock:
+            if key not in _caches:
+                _caches[key] = ByteLRU(*key)
+    return _caches[key]
+
+
+def rendered(key, render):
+    """The fragment for key, calling render() (and keeping the result) if it
+    isn't cached"""
+    config = fragment_cache_config()
+    cache = fragment_cache(config)
+    fragment = cache.get(key)
+    if fragment is MISSING:
+        fragment = render()
+        cache.set(key, fragment, footprint(fragment), config['TIMEOUT'])
+    return fragment
+
+
+def clear():
+    for cache in _caches.values():
+        cache.clear()
+
+
+def fragment_stats():
+    """The LRU's counters, along with its hit rate"""
+    stats = fragment_cache().stats()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+    return stats
@@ -1,13 +1,17 @@
 from django.template import loader
 import utils
 
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled_templates import compile_template
+
 
 class GraphicsLayer(object):
     shorthand = 'graphics'
 
     def __init__(self, layer_data):
         self.layer_data = layer_data
-        self.template = loader.get_template('regulations/layers/graphics.html')
+        self.template = compile_template(
+            loader.get_template('regulations/layers/graphics.html'))
 
     def apply_layer(self, text_index):
         """Replace all instances of graphics with an img tag"""
@@ -23,7 +27,10 @@ class GraphicsLayer(object):
                 if 'thumb_url' in graphic_info:
                     context['thumb_url'] = graphic_info['thumb_url']
 
-                replacement = utils.render_template(self.template, context)
+                key = (self.shorthand, context['url'], context['alt'],
+                       context.get('thumb_url'))
+                replacement = fragments.rendered(
+                    key, lambda: utils.render_template(self.template, context))
                 layer_pairs.append((
                     graphic_info['text'], replacement,
                     graphic_info['locations']))
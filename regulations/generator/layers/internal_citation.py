@@ -1,7 +1,12 @@
+from copy import copy
+
 from django.template import loader, Context
 from django.core.urlresolvers import reverse, NoReverseMatch
 from ..node_types import to_markup_id
 
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled import element_offsets
+from regulations.generator.layers.compiled_templates import compile_template
 from regulations.generator.section_url import SectionUrl
 
 
@@ -13,29 +18,35 @@ class InternalCitationLayer():
         self.sectional = False
         self.version = None
         self.rev_urls = SectionUrl()
-        self.rendered = {}
+
+    def for_request(self):
+        """A copy for a single request, sharing the layer data but with its
+        own cache of section urls"""
+        layer = copy(self)
+        layer.rev_urls = SectionUrl()
+        return layer
 
     def render_url(
         self, label, text,
             template_name='regulations/layers/internal_citation.html'):
 
-        key = (tuple(label), text, template_name)
-        if key not in self.rendered:
+        def render():
             url = self.rev_urls.fetch(label, self.version, self.sectional)
             c = Context({'citation': {'url': url, 'label': text,
                 'label_id': self.rev_urls.view_label_id(label, self.version)}})
-            template = loader.get_template(template_name)
-            self.rendered[key] = template.render(c).strip('\n')
-        return self.rendered[key]
+            template = compile_template(loader.get_template(template_name))
+            return template.render(c).strip('\n')
+
+        key = (self.shorthand, tuple(label), text, template_name,
+               self.version, self.sectional)
+        return fragments.rendered(key, render)
 
     def apply_layer(self, text, text_index):
         if text_index in self.layer:
-            layer_elements = self.layer[text_index]
-
             layer_pairs = []
-            for layer_element in layer_elements:
-                for start, end in layer_element['offsets']:
-                    ot = text[int(start):int(end)]
-                    rt = self.render_url(layer_element['citation'], ot)
-                    layer_pairs.append((ot, rt, (start, end)))
+            for start, end, layer_element in element_offsets(self.layer,
+                                                             text_index):
+                ot = text[start:end]
+                rt = self.render_url(layer_element['citation'], ot)
+                layer_pairs.append((ot, rt, (start, end)))
             return layer_pairs
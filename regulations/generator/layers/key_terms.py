@@ -2,22 +2,31 @@ import string
 import utils
 from django.template import loader, Context
 
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled_templates import compile_template
+
+
+PUNCTUATION = dict((ord(c), None) for c in string.punctuation)
+
+
 class KeyTermsLayer(object):
     shorthand = 'keyterms'
 
     def __init__(self, layer):
         self.layer = layer
-        self.template = loader.get_template('regulations/layers/key_term.html')
+        self.template = compile_template(
+            loader.get_template('regulations/layers/key_term.html'))
 
     def remove_punctuation(self, punctuated):
-        translate_table = dict((ord(c), None) for c in string.punctuation)
-        return punctuated.translate(translate_table)
+        return punctuated.translate(PUNCTUATION)
 
     def generate_tag(self, key_term):
-        key_term = {'key_term':key_term,
-            'phrase':self.remove_punctuation(key_term)}
-        context = {'key_term':key_term}
-        return utils.render_template(self.template, context)
+        def render():
+            context = {'key_term': {
+                'key_term': key_term,
+                'phrase': self.remove_punctuation(key_term)}}
+            return utils.render_template(self.template, context)
+        return fragments.rendered((self.shorthand, key_term), render)
 
     def apply_layer(self, text_index):
         elements = []
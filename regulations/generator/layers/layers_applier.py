@@ -1,10 +1,41 @@
+from bisect import bisect_left
 from lxml import html
 from Queue import PriorityQueue
-from HTMLParser import HTMLParser
 
-from regulations.generator.layers.location_replace import LocationReplace
+from regulations.generator.layers.offset_replace import (
+    find_all, OffsetElement, OffsetReplace)
+from regulations.generator.layers.segments import Segments
+from regulations.generator.stats import Counters
+
+
+#   What became of inline layer elements: applied at their offsets, converted
+#   to occurrences of their original (when the text can't be handled by
+#   offsets), or dropped as misaligned or hidden by a longer replacement
+inline_counters = Counters('applied', 'converted', 'misaligned', 'hidden')
+
+
+def to_locations(elements, text):
+    """Convert OffsetElements to (original, replacement, [occurrence]), the
+    occurrence being which of original's appearances in text the offsets
+    point at. Other elements are passed through"""
+    found = {}
+    converted = []
+    for element in elements:
+        if not isinstance(element, OffsetElement):
+            converted.append(element)
+            continue
+        original, replacement, (start, end) = element
+        if original not in found:
+            found[original] = find_all(original, text) if original else []
+        starts = found[original]
+        idx = bisect_left(starts, start)
+        if idx < len(starts) and starts[idx] == start:
+            inline_counters.incr('converted')
+            converted.append((original, replacement, [idx]))
+        else:
+            inline_counters.incr('misaligned')
+    return converted
 
-import logging
 
 class LayersApplier(object):
     """ Most layers replace content. We try to do this intelligently here,
@@ -12,7 +43,25 @@ class LayersApplier(object):
 
     def __init__(self):
         self.queue = PriorityQueue()
-        self.text = None
+        self.unsplit = None
+        self.segments = None
+
+    @property
+    def text(self):
+        if self.segments is not None:
+            return self.segments.text()
+        return self.unsplit
+
+    @text.setter
+    def text(self, text):
+        self.unsplit = text
+        self.segments = None
+
+    def split(self):
+        """ The text's Segments, built once they are needed. """
+        if self.segments is None:
+            self.segments = Segments(self.unsplit)
+        return self.segments
 
     def enqueue_from_list(self, elements_list):
         for le in elements_list:
@@ -21,7 +70,10 @@ class LayersApplier(object):
     def enqueue(self, layer_element):
         original, replacement, locations = layer_element
         priority = len(original)
-        item = (original, replacement, locations)
+        if isinstance(layer_element, OffsetElement):
+            item = layer_element
+        else:
+            item = (original, replacement, locations)
         self.queue.put((-priority, item))
 
     def replace(self, xml_node, original, replacement):
@@ -38,48 +90,72 @@ class LayersApplier(object):
 
         return xml_node
 
-    def location_replace(self, xml_node, original, replacement, locations):
-        LocationReplace().location_replace(xml_node, original, replacement,
-                                           locations)
-
     def unescape_text(self):
         """ Because of the way we do replace_all(), we need to unescape HTML
         entities.  """
-        self.text = HTMLParser().unescape(self.text)
+        self.split().unescape()
 
     def replace_all(self, original, replacement):
         """ Replace all occurrences of original with replacement. This is HTML
-        aware. """
-
+        aware: markup is left alone. Text which a DOM wouldn't round trip
+        unchanged (see Segments.dom_safe: entities such as &amp;, block or
+        unclosed tags, leading whitespace, ...) still goes through lxml, so
+        that its output is as it always was. """
+        if not self.split().replace_all(original, replacement):
+            self.replace_in_dom(original, replacement)
+
+    def replace_in_dom(self, original, replacement):
+        """ replace_all() for markup which Segments can't be sure of
+        treating as a DOM would. """
         htmlized = html.fragment_fromstring(self.text, create_parent='div')
         htmlized = self.replace(htmlized, original, replacement)
 
-        self.text = html.tostring(htmlized)
-        self.text = self.text.replace("<div>", "", 1)
-        self.text = self.text[:self.text.rfind("</div>")]
+        text = html.tostring(htmlized)
+        text = text.replace("<div>", "", 1)
+        self.text = text[:text.rfind("</div>")]
         self.unescape_text()
 
     def replace_at(self, original, replacement, locations):
         """ Replace the occurrences of original at all the locations with
-        replacement. """
+        replacement. Locations may be shared layer data; don't sort them in
+        place. """
 
-        locations.sort()
-        self.text = LocationReplace().location_replace_text(
-            self.text, original, replacement, locations)
+        locations = sorted(locations)
+        self.split().replace_at(original, replacement, locations)
         self.unescape_text()
 
     def apply_layers(self, original_text):
-        self.text = original_text
-
+        """ Apply every queued element, longest original first. Where
+        possible, do so in one pass over offsets into the original text;
+        otherwise, rewrite the text once per element. OffsetElements' offsets
+        must be into original_text. """
+        elements = []
         while not self.queue.empty():
             priority, layer_element = self.queue.get()
-            original, replacement, locations = layer_element
+            elements.append(layer_element)
+
+        replacer = OffsetReplace(original_text)
+        self.text = replacer.apply(elements)
+        if self.text is None:
+            self.replace_each(original_text,
+                              to_locations(elements, original_text))
+        else:
+            placed = sum(1 for e in elements if isinstance(e, OffsetElement))
+            placed -= replacer.misaligned + replacer.hidden
+            inline_counters.incr('applied', placed)
+            inline_counters.incr('misaligned', replacer.misaligned)
+            inline_counters.incr('hidden', replacer.hidden)
+        return self.text
 
+    def replace_each(self, original_text, elements):
+        """ Apply elements one at a time, in order, rewriting the parts of
+        the text each touches. """
+        self.text = original_text
+        for original, replacement, locations in elements:
             if not locations:
                 self.replace_all(original, replacement)
             else:
                 self.replace_at(original, replacement, locations)
-
         return self.text
 
 
@@ -117,24 +193,18 @@ class InlineLayersApplier(LayersBase):
         self.modified_text = None
 
     def get_layer_pairs(self, text_index, original_text):
-        layer_pairs = []
-        for layer in self.layers.values():
-            applied = layer.apply_layer(original_text, text_index)
-            if applied:
-                layer_pairs += applied
-
-        #convert from offset-based to a search and replace layer.
+        """ OffsetElements for each inline layer's pairs, dropping (and
+        counting) those whose offsets don't hold their original text. Use
+        to_locations() to apply them to anything but original_text. """
         layer_elements = []
-
-        for o, r, offset in layer_pairs:
-            offset_locations = LocationReplace.find_all_offsets(o,
-                                                                original_text)
-            try:
-                locations = [offset_locations.index(offset)]
-                layer_elements.append((o, r, locations))
-            except Exception as ex:
-                logging.info('{0!s}'.format(ex))
-                logging.info('Problem interpolating offsets: {0}, {1}'.format(offset_locations, offset))
+        for layer in self.layers.values():
+            for o, r, (start, end) in layer.apply_layer(
+                    original_text, text_index) or []:
+                start, end = int(start), int(end)
+                if o and start >= 0 and original_text[start:end] == o:
+                    layer_elements.append(OffsetElement(o, r, (start, end)))
+                else:
+                    inline_counters.incr('misaligned')
         return layer_elements
 
 
@@ -0,0 +1,254 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from HTMLParser import HTMLParser
+import re
+
+
+#   What HTMLParser.unescape replaces
+ENTITY = re.compile(r"&(#?[xX]?(?:[0-9a-fA-F]+|\w{1,8}));")
+#   An entity which following text could complete
+PARTIAL_ENTITY = re.compile(r"&#?[xX]?\w*$")
+
+
+#   A layer element located by offsets into the text (as inline layers
+#   provide them) rather than by which occurrences of original to replace
+OffsetElement = namedtuple('OffsetElement',
+                           ['original', 'replacement', 'offsets'])
+
+
+def visible_runs(text):
+    """(start, end) of each stretch of text outside of tags, found the way
+    LocationReplace.update_offsets finds them. Returns None if a tag isn't
+    closed"""
+    runs = []
+    gt = -1
+    lt = text.find('<')
+    while lt != -1:
+        runs.append((gt + 1, lt))
+        gt = text.find('>', lt)
+        if gt == -1:
+            return None
+        lt = text.find('<', gt)
+    runs.append((gt + 1, len(text)))
+    return runs
+
+
+def find_all(pattern, text):
+    """Start of every (possibly overlapping) occurrence of pattern"""
+    starts = []
+    start = text.find(pattern)
+    while start != -1:
+        starts.append(start)
+        start = text.find(pattern, start + 1)
+    return starts
+
+
+class Span(object):
+    """A replaced stretch [start, end) of the original text. A transparent
+    replacement wraps the original in tags (prefix + original + suffix), so
+    later replacements may nest within it; any other replacement is
+    opaque"""
+    def __init__(self, start, end, replacement, original, order):
+        self.start, self.end, self.order = start, end, order
+        self.replacement = replacement
+        self.prefix = self.suffix = None
+        self.children = []
+
+        runs = [(s, e) for s, e in visible_runs(replacement) if s != e]
+        if len(runs) == 1 and replacement[runs[0][0]:runs[0][1]] == original:
+            self.prefix = replacement[:runs[0][0]]
+            self.suffix = replacement[runs[0][1]:]
+        self.runs = [replacement[s:e] for s, e in runs]
+
+    @property
+    def opaque(self):
+        return self.prefix is None
+
+    def phantoms(self, original):
+        """Occurrences of `original` in the replacement's own text, which
+        count towards locations but aren't original text"""
+        return sum(len(find_all(original, run)) for run in self.runs)
+
+
+class OffsetReplace(object):
+    """Applies layer elements (original, replacement, locations) to text in
+    a single pass over offsets into the original text, rather than
+    rewriting the text once per element as LayersApplier's legacy path
+    does. The result is identical to the legacy path's: elements are
+    resolved in the same order (longest original first), counting
+    occurrences the same way (skipping tags and any which straddle an
+    earlier replacement, but including those within a replacement's text).
+    OffsetElements are placed at their offsets directly; those whose text
+    doesn't match (misaligned) or has been hidden by an earlier replacement
+    are dropped and counted.
+
+    Some inputs can't be resolved on offsets without diverging from the
+    legacy path: text which already contains markup or HTML entities,
+    elements without locations (replace everywhere), replacements which
+    aren't self-contained markup, or locations which fall within an earlier
+    replacement's own text. For these, apply() returns None."""
+
+    def __init__(self, text):
+        self.text = text
+        self.spans = []
+        #   original -> [occurrences, number of spans accounted for]
+        self.found = {}
+        #   Sorted, to check OffsetElements against the spans quickly
+        self.bounds = []
+        self.opaque_spans = []
+        #   opaque replacement -> [a span with it, the start of each]
+        self.by_replacement = {}
+        self.misaligned = self.hidden = 0
+
+    @staticmethod
+    def supported_text(text):
+        return ('<' not in text and '>' not in text
+                and not ENTITY.search(text))
+
+    @staticmethod
+    def prepare(replacement):
+        """The replacement as it will appear in the output (the legacy path
+        unescapes HTML entities after each replacement), or None if it
+        can't be treated as a self-contained unit"""
+        if '&' in replacement:
+            replacement = HTMLParser().unescape(replacement)
+            if (ENTITY.search(replacement)
+                    or PARTIAL_ENTITY.search(replacement)):
+                return None
+        if not replacement.startswith('<') or not replacement.endswith('>'):
+            return None
+        runs = visible_runs(replacement)
+        if runs is None or runs[-1] != (len(replacement), len(replacement)):
+            return None
+        return replacement
+
+    @staticmethod
+    def invalidates(span, start, length):
+        """Does `span` hide the occurrence at `start` (by straddling it, or
+        by replacing it with text of its own)?"""
+        end = start + length
+        return (start < span.start < end or start < span.end < end
+                or (span.opaque and span.start <= start < span.end))
+
+    def occurrences(self, original):
+        """Each occurrence of `original` in the current text, in order, as
+        (offset into the original text, False), or (offset of the
+        replacement, True) for one within an opaque replacement's text.
+        Kept up to date as spans are added, rather than recounted"""
+        if original not in self.found:
+            self.found[original] = [self.locate(original), len(self.spans)]
+        entries, seen = self.found[original]
+        length = len(original)
+        for span in self.spans[seen:]:
+            lo = bisect_left(entries, (span.start - length + 1,))
+            hi = bisect_left(entries, (span.end,))
+            entries[lo:hi] = [
+                entry for entry in entries[lo:hi]
+                if entry[1] or not self.invalidates(span, entry[0], length)]
+            if span.opaque:
+                idx = bisect_left(entries, (span.start, True))
+                entries[idx:idx] = ([(span.start, True)]
+                                    * span.phantoms(original))
+        self.found[original][1] = len(self.spans)
+        return entries
+
+    def locate(self, original):
+        """occurrences(), from scratch: those in the original text which no
+        span hides, along with those within opaque replacements' text. Uses
+        the sorted spans, rather than considering each span in turn"""
+        length = len(original)
+        entries = [(start, False) for start in find_all(original, self.text)
+                   if not self.is_hidden(start, start + length)]
+        phantoms = []
+        for span, starts in self.by_replacement.values():
+            count = span.phantoms(original)
+            if count:
+                phantoms.extend((start, True) for start in starts
+                                for _ in range(count))
+        if phantoms:
+            entries = sorted(entries + phantoms)
+        return entries
+
+    def apply(self, elements):
+        """Elements must be in the order the legacy path applies them"""
+        if not self.supported_text(self.text):
+            return None
+        for order, element in enumerate(elements):
+            original, replacement, locations = element
+            if not original or not locations:
+                return None
+            replacement = self.prepare(replacement)
+            if replacement is None:
+                return None
+            if isinstance(element, OffsetElement):
+                self.place(original, replacement, locations, order)
+                continue
+            found = self.occurrences(original)
+            chosen = sorted(set(l for l in locations if 0 <= l < len(found)))
+            if any(found[l][1] for l in chosen):
+                return None
+            starts = [found[l][0] for l in chosen]
+            for first, second in zip(starts, starts[1:]):
+                if second < first + len(original):
+                    return None     # overlapping replacements
+            for start in starts:
+                self.add(Span(start, start + len(original), replacement,
+                              original, order))
+        return self.render()
+
+    def place(self, original, replacement, offsets, order):
+        """Add a span at an OffsetElement's offsets, if they still hold its
+        original"""
+        start, end = offsets
+        if self.text[start:end] != original:
+            self.misaligned += 1
+        elif self.is_hidden(start, end):
+            self.hidden += 1
+        else:
+            self.add(Span(start, end, replacement, original, order))
+
+    def is_hidden(self, start, end):
+        """invalidates(), against every span. Spans nest rather than
+        overlap, and opaque spans hold none of the others"""
+        if bisect_right(self.bounds, start) < bisect_left(self.bounds, end):
+            return True
+        idx = bisect_right(self.opaque_spans, (start, float('inf'))) - 1
+        return idx >= 0 and self.opaque_spans[idx][1] > start
+
+    def add(self, span):
+        self.spans.append(span)
+        insort(self.bounds, span.start)
+        insort(self.bounds, span.end)
+        if span.opaque:
+            insort(self.opaque_spans, (span.start, span.end))
+            self.by_replacement.setdefault(
+                span.replacement, [span, []])[1].append(span.start)
+
+    def render(self):
+        #   Outer spans first; where two cover the same text, the one
+        #   applied first encloses the other
+        spans = sorted(self.spans, key=lambda s: (s.start, -s.end, s.order))
+        root = Span(0, len(self.text), '<>', '', -1)
+        stack = [root]
+        for span in spans:
+            while span.start >= stack[-1].end:
+                stack.pop()
+            stack[-1].children.append(span)
+            stack.append(span)
+
+        pieces = []
+        self.render_span(root, pieces)
+        return ''.join(pieces)
+
+    def render_span(self, span, pieces):
+        position = span.start
+        for child in span.children:
+            pieces.append(self.text[position:child.start])
+            if child.opaque:
+                pieces.append(child.replacement)
+            else:
+                pieces.append(child.prefix)
+                self.render_span(child, pieces)
+                pieces.append(child.suffix)
+            position = child.end
+        pieces.append(self.text[position:span.end])
@@ -1,13 +1,16 @@
 from django.template import loader
 import utils
 
+from regulations.generator.layers import fragments
+from regulations.generator.layers.compiled_templates import compile_template
+
 class ParagraphMarkersLayer(object):
     shorthand = 'paragraph'
 
     def __init__(self, layer):
         self.layer = layer
-        self.template = loader.get_template(
-            'regulations/layers/paragraph_markers.html')
+        self.template = compile_template(loader.get_template(
+            'regulations/layers/paragraph_markers.html'))
 
     def apply_layer(self, text_index):
         elements = []
@@ -19,7 +22,9 @@ class ParagraphMarkersLayer(object):
 
                 context = {'paragraph': to_replace,
                            'paragraph_stripped': stripped}
-                replace_with = utils.render_template(self.template, context)
+                replace_with = fragments.rendered(
+                    (self.shorthand, to_replace),
+                    lambda: utils.render_template(self.template, context))
                 elements.append(
                     (to_replace, replace_with, layer_element['locations']))
         return elements
@@ -0,0 +1,175 @@
+from HTMLParser import HTMLParser
+import re
+
+from regulations.generator.layers.location_replace import LocationReplace
+
+
+#   Markup which lxml parses and serializes back unchanged, when properly
+#   nested (see Segments.dom_safe)
+INLINE_TAGS = frozenset([
+    'a', 'abbr', 'b', 'cite', 'code', 'del', 'dfn', 'em', 'i', 'ins', 'kbd',
+    'mark', 'q', 's', 'samp', 'small', 'span', 'strong', 'sub', 'sup', 'u',
+    'var'])
+VOID_TAGS = frozenset(['br', 'img', 'wbr'])
+OPEN_TAG = re.compile(
+    r'^<([a-z][a-z0-9]*)(?: [a-z_:][-a-z0-9_:.]*="[^"<>]*")*>$')
+CLOSE_TAG = re.compile(r'^</([a-z][a-z0-9]*)>$')
+#   Text which lxml might decode, or drop
+AMBIGUOUS_TEXT = re.compile(u'&[#0-9A-Za-z]|[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def tokenize(text):
+    """Split text into text runs and markup runs (which start with '<'), the
+    way LocationReplace.update_offsets scans it. None if a tag isn't
+    closed"""
+    parts = []
+    gt = -1
+    lt = text.find('<')
+    while lt != -1:
+        if lt > gt + 1:
+            parts.append(text[gt + 1:lt])
+        gt = text.find('>', lt)
+        if gt == -1:
+            return None
+        parts.append(text[lt:gt + 1])
+        lt = text.find('<', gt)
+    if gt + 1 < len(text):
+        parts.append(text[gt + 1:])
+    return parts
+
+
+def is_markup(part):
+    return part[:1] == '<'
+
+
+class Segments(object):
+    """A node's HTML as a list of text runs and markup runs, kept across
+    all of the replacements made to it. Replacements only rewrite the text
+    runs they touch, where LayersApplier used to rescan (or parse into a
+    DOM and re-serialize) the whole text for each one.
+
+    Text with an unclosed tag can't be split this way; it's kept whole (as
+    `raw`) and replaced within as a string."""
+
+    def __init__(self, text):
+        self.reset(text)
+
+    def reset(self, text):
+        self.parts = tokenize(text)
+        self.raw = text if self.parts is None else None
+
+    def text(self):
+        if self.parts is None:
+            return self.raw
+        return ''.join(self.parts)
+
+    def splice(self, idx, new_text):
+        """Replace the text run at idx with new_text, which may contain
+        markup"""
+        tokens = tokenize(new_text)
+        if tokens is None:
+            parts = list(self.parts)
+            parts[idx] = new_text
+            self.reset(''.join(parts))
+        else:
+            #   Text runs are bounded by markup, so the tokens can't merge
+            #   with their neighbors
+            self.parts[idx:idx + 1] = tokens
+
+    def replace_at(self, original, replacement, locations):
+        """Replace the occurrences of original at the given locations
+        (indices among every occurrence outside of markup)"""
+        if self.parts is None:
+            self.raw = LocationReplace().location_replace_text(
+                self.raw, original, replacement, locations)
+            return
+
+        wanted = set(locations)
+        last = max(locations) if locations else -1
+        count = 0
+        edits = []
+        for idx, part in enumerate(self.parts):
+            if count > last:
+                break
+            if is_markup(part) or original not in part:
+                continue
+            starts = []
+            for start, end in LocationReplace.find_all_offsets(original,
+                                                               part):
+                if count in wanted:
+                    starts.append((start, end))
+                count += 1
+            if starts:
+                edits.append((idx, starts))
+
+        for idx, starts in reversed(edits):
+            part = self.parts[idx]
+            pieces = []
+            text_begin = 0
+            for start, end in starts:
+                pieces.append(part[text_begin:start])
+                pieces.append(replacement)
+                text_begin = end
+            pieces.append(part[text_begin:])
+            self.splice(idx, ''.join(pieces))
+
+    def dom_safe(self):
+        """Would parsing this into a DOM and serializing it again (as
+        LayersApplier did to replace text) leave it as it is, apart from
+        decoding entities? True for text and properly nested inline
+        markup"""
+        if self.parts is None:
+            return False
+        if (self.parts and not is_markup(self.parts[0])
+                and not self.parts[0].strip() and len(self.parts) > 1):
+            return False    # leading whitespace is dropped
+        if len(self.parts) == 1 and not self.parts[0].strip():
+            return False
+        stack = []
+        for part in self.parts:
+            if AMBIGUOUS_TEXT.search(part):
+                return False
+            if not is_markup(part):
+                continue
+            match = OPEN_TAG.match(part)
+            if match:
+                tag = match.group(1)
+                if tag in VOID_TAGS:
+                    continue
+                if tag not in INLINE_TAGS or (tag == 'a' and 'a' in stack):
+                    return False
+                stack.append(tag)
+                continue
+            match = CLOSE_TAG.match(part)
+            if not match or not stack or stack.pop() != match.group(1):
+                return False
+        return not stack
+
+    def replace_all(self, original, replacement):
+        """Replace every occurrence of original outside of markup. Like
+        replacing text in a DOM, the replacement is inserted verbatim (its
+        entities aren't decoded). Returns False, changing nothing, if this
+        can't be done without diverging from a DOM-based replacement (see
+        dom_safe)"""
+        if not self.dom_safe():
+            return False
+        for idx in reversed(range(len(self.parts))):
+            part = self.parts[idx]
+            if not is_markup(part) and original in part:
+                self.splice(idx, part.replace(original, replacement))
+        return True
+
+    def unescape(self):
+        """Decode HTML entities, as if across the whole text"""
+        if self.parts is None:
+            self.raw = HTMLParser().unescape(self.raw)
+            return
+        rescan = False
+        for idx, part in enumerate(self.parts):
+            if '&' in part:
+                unescaped = HTMLParser().unescape(part)
+                if unescaped != part:
+                    self.parts[idx] = unescaped
+                    rescan = rescan or '<' in unescaped or '>' in unescaped
+        if rescan:
+            self.reset(''.join(self.parts))
@@ -6,6 +6,8 @@ from django.core import cache
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.template import Context
 
+from regulations.generator.layers.compiled_templates import (
+    CompiledTemplate)
 from regulations.generator.node_types import to_markup_id
 
 
@@ -30,5 +32,6 @@ def convert_to_python(data):
 
 
 def render_template(template, context):
-    c = Context(context)
-    return template.render(c).strip('\n')
+    if not isinstance(template, CompiledTemplate):
+        context = Context(context)
+    return template.render(context).strip('\n')
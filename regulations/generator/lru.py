@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+from regulations.generator.stats import Counters
+
+
+MISSING = object()
+
+
+def footprint(value):
+    """Approximate bytes of memory held by a value: JSON-like data (dicts,
+    lists, tuples and their leaves) or text. Objects referenced more than
+    once are counted each time, so this errs on the high side"""
+    size = sys.getsizeof(value)
+    value_type = type(value)
+    if value_type is dict:
+        for key, item in value.iteritems():
+            size += sys.getsizeof(key)
+            if type(item) in (dict, list, tuple):
+                size += footprint(item)
+            else:
+                size += sys.getsizeof(item)
+    elif value_type in (list, tuple):
+        for item in value:
+            if type(item) in (dict, list, tuple):
+                size += footprint(item)
+            else:
+                size += sys.getsizeof(item)
+    return size
+
+
+class ByteLRU(object):
+    """An in-process, thread-safe LRU mapping bounded by the total size (in
+    bytes) of its values rather than by the number of entries. Sizes are
+    supplied by the caller, and should be what the value occupies in memory
+    (see footprint()), not e.g. the length of its serialized form. Entries
+    larger than max_item_bytes are never stored, so a single huge value
+    can't flush everything else; the sizes recorded never total more than
+    max_bytes."""
+    def __init__(self, max_bytes, max_item_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes or max_bytes, max_bytes)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> (value, size, expires_at)
+        self.bytes = 0
+        self.counters = Counters('hits', 'misses', 'sets', 'evictions',
+                                 'expirations', 'rejections')
+
+    def get(self, key, default=MISSING):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[2] and entry[2] < time.time():
+                self.bytes -= entry[1]
+                self.counters.incr('expirations')
+                entry = None
+            if entry is None:
+                self.counters.incr('misses')
+                return default
+            self.entries[key] = entry   # most recently used
+        self.counters.incr('hits')
+        return entry[0]
+
+    def set(self, key, value, size, timeout=None):
+        """Store value under key. timeout is in seconds; None means the
+        entry never expires (though it may still be evicted)"""
+        expires_at = time.time() + timeout if timeout is not None else None
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_item_bytes:
+                self.counters.incr('rejections')
+                return False
+            while self.entries and self.bytes + size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.counters.incr('evictions')
+            self.entries[key] = (value, size, expires_at)
+            self.bytes += size
+        self.counters.incr('sets')
+        return True
+
+    def delete(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        stats = self.counters.snapshot()
+        stats['bytes'] = self.bytes
+        stats['max_bytes'] = self.max_bytes
+        stats['entries'] = len(self.entries)
+        return stats
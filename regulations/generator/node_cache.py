@@ -0,0 +1,70 @@
+"""Nodes' marked up text (their text with the inline and search/replace
+layers applied), shared by every view in this process: a section rendered
+as part of the whole regulation needn't have its layers applied again when
+it's viewed alone, or inlined as an interpretation. See
+HTMLBuilder.process_node_text for what the keys hold."""
+import hashlib
+import threading
+
+from django.conf import settings
+
+from regulations.generator.lru import ByteLRU, footprint, MISSING
+
+
+DEFAULT_NODE_CACHE = {
+    'MAX_BYTES': 32 * 1024 * 1024,      # of memory per process
+    'MAX_ITEM_BYTES': 1024 * 1024,      # larger nodes aren't kept
+    #   Seconds to keep a node. Keys include the part's and version's
+    #   generation (see ApiCache.invalidate), but versions' data only
+    #   changes in place without IMMUTABLE_VERSIONS. None: forever
+    'TIMEOUT': 60 * 60,
+}
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def node_cache_config():
+    config = dict(DEFAULT_NODE_CACHE)
+    config.update(getattr(settings, 'EREGS_NODE_CACHE', {}))
+    return config
+
+
+def node_cache(config=None):
+    """The LRU of marked up nodes, shared by every view in this process"""
+    config = config or node_cache_config()
+    key = (config['MAX_BYTES'], config['MAX_ITEM_BYTES'])
+    if key not in _caches:
+        with _lock:
+            if key not in _caches:
+                _caches[key] = ByteLRU(*key)
+    return _caches[key]
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def marked_up(key, mark_up):
+    """The marked up text for key, calling mark_up() (and keeping the
+    result) if it isn't cached"""
+    config = node_cache_config()
+    cache = node_cache(config)
+    text = cache.get(key)
+    if text is MISSING:
+        text = mark_up()
+        cache.set(key, text, footprint(text), config['TIMEOUT'])
+    return text
+
+
+def clear():
+    for cache in _caches.values():
+        cache.clear()
+
+
+def node_cache_stats():
+    """The LRU's counters, along with its hit rate"""
+    stats = node_cache().stats()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+    return stats
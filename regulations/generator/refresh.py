@@ -0,0 +1,75 @@
+import logging
+import threading
+
+from django.conf import settings
+
+from regulations.generator.stats import Counters
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SWR = {
+    'ENABLED': False,
+    'API_SOFT_TTL': 60 * 60,                # serve without refreshing
+    'API_HARD_TTL': 60 * 60 * 24 * 7,       # serve stale (and refresh)
+    'PAGE_SOFT_TTL': 60 * 60 * 24,
+    'PAGE_HARD_TTL': 60 * 60 * 24 * 30,
+    'REFRESH_CONCURRENCY': 4,               # background refresh threads
+}
+
+
+def swr_config():
+    """DEFAULT_SWR, overridden by settings.EREGS_STALE_WHILE_REVALIDATE"""
+    config = dict(DEFAULT_SWR)
+    config.update(getattr(settings, 'EREGS_STALE_WHILE_REVALIDATE', {}))
+    return config
+
+
+class Refresher(object):
+    """Runs refresh functions in background threads: at most one at a time
+    per key and at most `concurrency` overall. Refreshes which can't be
+    scheduled are dropped; the next stale read will try again."""
+    def __init__(self, concurrency):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.counters = Counters('scheduled', 'skipped', 'completed',
+                                 'failed')
+
+    def refresh(self, key, fn):
+        with self.lock:
+            if key in self.pending or not self.slots.acquire(False):
+                self.counters.incr('skipped')
+                return False
+            self.pending.add(key)
+        self.counters.incr('scheduled')
+        thread = threading.Thread(target=self._run, args=(key, fn))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _run(self, key, fn):
+        try:
+            fn()
+            self.counters.incr('completed')
+        except Exception:
+            self.counters.incr('failed')
+            logger.exception('Background refresh of %s failed', key)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+            self.slots.release()
+
+
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+def refresher():
+    """The process-wide Refresher for the configured concurrency"""
+    concurrency = swr_config()['REFRESH_CONCURRENCY']
+    if concurrency not in _refreshers:
+        with _refreshers_lock:
+            if concurrency not in _refreshers:
+                _refreshers[concurrency] = Refresher(concurrency)
+    return _refreshers[concurrency]
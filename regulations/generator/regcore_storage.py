@@ -0,0 +1,67 @@
+"""Answer API requests by calling regcore's storage layer in this process,
+skipping the view, JSON serialization and json.loads round trip that
+ApiClient.get_from_regcore otherwise makes for data which is already here.
+
+The storage adapter is configured via settings.EREGS_REGCORE_STORAGE, a
+dotted path to a class with any of the methods named in ENDPOINTS. Each is
+called with the named groups of the matching API path and returns Python
+data, or None if there's no such resource. Requests for other endpoints (or
+with query parameters) aren't ours to answer; ApiClient falls back to its
+usual path for those."""
+import re
+
+
+#   (adapter method, API path)
+ENDPOINTS = [
+    ('regulation',
+     re.compile(r'^regulation/(?P<label>[^/]+)/(?P<version>[^/]+)$')),
+    ('layer', re.compile(
+        r'^layer/(?P<name>[^/]+)/(?P<label>[^/]+)/(?P<version>[^/]+)$')),
+    ('diff', re.compile(
+        r'^diff/(?P<label>[^/]+)/(?P<older>[^/]+)/(?P<newer>[^/]+)$')),
+    ('notice', re.compile(
+        r'^notice/(?P<part>[^/]+)/(?P<document_number>[^/]+)$')),
+]
+
+
+class Unknown(object):
+    """Returned by StorageBackend.get for requests it can't answer"""
+    def __repr__(self):
+        return 'UNKNOWN'
+
+UNKNOWN = Unknown()
+
+
+class StorageBackend(object):
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get(self, suffix, params={}):
+        if params:
+            return UNKNOWN
+        for name, pattern in ENDPOINTS:
+            method = getattr(self.storage, name, None)
+            match = pattern.match(suffix)
+            if method and match:
+                return method(**match.groupdict())
+        return UNKNOWN
+
+
+class RegcoreStorage(object):
+    """Adapter for cfpb/regulations-core's `regcore.db.storage`. Like the
+    API, return None when there's no such resource"""
+    def __init__(self):
+        from regcore.db import storage
+        self.storage = storage
+
+    def regulation(self, label, version):
+        return self.storage.for_regulations.get(label, version)
+
+    def layer(self, name, label, version):
+        return self.storage.for_layers.get(name, label, version)
+
+    def diff(self, label, older, newer):
+        return self.storage.for_diffs.get(label, older, newer)
+
+    def notice(self, part, document_number):
+        return self.storage.for_notices.get(document_number)
@@ -0,0 +1,48 @@
+import sys
+import threading
+
+from regulations.generator.stats import Counters
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls which share a key: the first caller (the
+    leader) runs the function while everyone else waits for and shares its
+    result (or exception)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.counters = Counters('leaders', 'coalesced')
+
+    def do(self, key, fn):
+        """Returns a pair of the result and whether that result was shared
+        with (i.e. produced by) another caller"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        self.counters.incr('leaders' if leader else 'coalesced')
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
@@ -0,0 +1,170 @@
+"""A local, single-file copy of the API's data, used as an ApiClient backend
+by setting API_BASE to 'sqlite:///path/to/file.db'. Populate it with
+`manage.py import_sqlite_store`.
+
+Regulation trees are stored a node per row, keyed by label and version with
+a pointer to the parent, so that any subtree can be read without loading
+the rest of the tree. Layers are stored a row per labeled entry, keyed by
+(name, part, version, label). Every other response (version lists, notices,
+diffs) is stored whole, keyed by its API path."""
+import json
+import sqlite3
+import threading
+
+from regulations.generator.regcore_storage import StorageBackend, UNKNOWN
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    version TEXT NOT NULL,
+    label TEXT NOT NULL,
+    parent TEXT,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (version, label)
+);
+CREATE INDEX IF NOT EXISTS nodes_by_parent ON nodes (version, parent);
+CREATE TABLE IF NOT EXISTS layers (
+    name TEXT NOT NULL,
+    part TEXT NOT NULL,
+    version TEXT NOT NULL,
+    label TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (name, part, version, label)
+);
+CREATE TABLE IF NOT EXISTS layer_versions (
+    name TEXT NOT NULL,
+    part TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (name, part, version)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+SUBTREE = """
+WITH RECURSIVE subtree(label, parent, position, data) AS (
+    SELECT label, parent, position, data FROM nodes
+    WHERE version = ? AND label = ?
+    UNION ALL
+    SELECT nodes.label, nodes.parent, nodes.position, nodes.data
+    FROM nodes JOIN subtree ON nodes.parent = subtree.label
+    WHERE nodes.version = ?
+)
+SELECT label, parent, position, data FROM subtree
+"""
+
+
+class SqliteStore(object):
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        """sqlite3 connections mustn't be shared between threads"""
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = sqlite3.connect(self.path)
+            self.local.connection.executescript(SCHEMA)
+            #   Labels such as 1005-2-a and 1005-2-A are distinct
+            self.local.connection.execute('PRAGMA case_sensitive_like = ON')
+        return self.local.connection
+
+    def add_tree(self, tree, version):
+        rows = []
+        to_visit = [(tree, None, 0)]
+        while to_visit:
+            node, parent, position = to_visit.pop()
+            label = '-'.join(node['label'])
+            data = dict((k, v) for k, v in node.items() if k != 'children')
+            rows.append((version, label, parent, position, json.dumps(data)))
+            for idx, child in enumerate(node.get('children', [])):
+                to_visit.append((child, label, idx))
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?)', rows)
+
+    def add_layer(self, name, part, version, layer):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO layer_versions VALUES (?, ?, ?)',
+            (name, part, version))
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO layers VALUES (?, ?, ?, ?, ?)',
+            [(name, part, version, label, json.dumps(data))
+             for label, data in layer.items()])
+
+    def add_document(self, path, data):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO documents VALUES (?, ?)',
+            (path, json.dumps(data)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def regulation(self, label, version):
+        """The tree rooted at `label`, or None"""
+        rows = self.connection.execute(SUBTREE, (version, label, version))
+        nodes, children = {}, {}
+        for node_label, parent, position, data in rows:
+            node = json.loads(data)
+            nodes[node_label] = node
+            children.setdefault(parent, []).append((position, node))
+        if label not in nodes:
+            return None
+        for node_label, node in nodes.items():
+            node['children'] = [
+                child for _, child in sorted(children.get(node_label, []),
+                                             key=lambda pair: pair[0])]
+        return nodes[label]
+
+    def layer(self, name, label, version):
+        """The layer's entries for `label` and everything beneath it (by
+        label prefix); the whole layer when given a part. Entries which
+        aren't keyed by a label in the part (e.g. the terms layer's
+        'referenced') apply to every slice, so are always included. None if
+        there's no such layer"""
+        part = label.split('-')[0]
+        exists = self.connection.execute(
+            'SELECT 1 FROM layer_versions '
+            'WHERE name = ? AND part = ? AND version = ?',
+            (name, part, version)).fetchone()
+        if not exists:
+            return None
+        query = ('SELECT label, data FROM layers '
+                 'WHERE name = ? AND part = ? AND version = ?')
+        params = [name, part, version]
+        if label != part:
+            query += (' AND (label = ? OR label LIKE ?'
+                      ' OR NOT (label = ? OR label LIKE ?))')
+            params.extend([label, label + '-%', part, part + '-%'])
+        return dict((row_label, json.loads(data)) for row_label, data
+                    in self.connection.execute(query, params))
+
+    def document(self, path):
+        row = self.connection.execute(
+            'SELECT data FROM documents WHERE path = ?', (path,)).fetchone()
+        if row:
+            return json.loads(row[0])
+
+    def get(self, suffix, params={}):
+        """Answer an API request, or None if we've no such resource"""
+        result = StorageBackend(self).get(suffix, params)
+        if result is UNKNOWN:
+            if params:
+                return None
+            result = self.document(suffix)
+        return result
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(path):
+    """One SqliteStore per file per process"""
+    if path not in _stores:
+        with _stores_lock:
+            if path not in _stores:
+                _stores[path] = SqliteStore(path)
+    return _stores[path]
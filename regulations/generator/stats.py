@@ -0,0 +1,25 @@
+import threading
+
+
+class Counters(object):
+    """A thread-safe set of named counters, used to expose how often the
+    various caching and fetching shortcuts kick in."""
+    def __init__(self, *names):
+        self.lock = threading.Lock()
+        self.counts = dict((name, 0) for name in names)
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def __getitem__(self, name):
+        return self.counts.get(name, 0)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            for name in self.counts:
+                self.counts[name] = 0
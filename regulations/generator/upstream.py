@@ -0,0 +1,258 @@
+"""Client-side load balancing across several replicas of the API.
+
+Each request goes to the replica with the fewest requests outstanding. With
+hedging enabled, if that replica hasn't answered within a percentile of
+recent latencies, the same request is also sent to another replica and
+whichever answers first wins. Hedged attempts run on a bounded, process-wide
+pool (see executor.submit). Requests which fail outright are retried on the
+remaining replicas, unless the failure is final (e.g. the request's latency
+budget ran out, which another replica can't give back). Latencies are
+recorded per replica in coarse histograms; see upstream_stats()."""
+import bisect
+import logging
+import Queue
+import threading
+import time
+
+from django.conf import settings
+
+from regulations.generator import executor
+from regulations.generator.stats import Counters
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPSTREAM = {
+    'HEDGE': False,
+    'HEDGE_PERCENTILE': 95,     # of latencies across all replicas
+    'HEDGE_MIN_SAMPLES': 20,    # before which HEDGE_INITIAL_DELAY is used
+    'HEDGE_INITIAL_DELAY': 0.5,     # seconds
+    'HEDGE_MIN_DELAY': 0.01,        # seconds
+    #   Threads (per process) running the attempts of hedged requests
+    'HEDGE_WORKERS': 16,
+    #   Seconds to prefer other replicas after a replica fails
+    'FAILURE_COOLDOWN': 5,
+}
+
+
+def upstream_config():
+    """DEFAULT_UPSTREAM, overridden by settings.EREGS_API_UPSTREAM"""
+    config = dict(DEFAULT_UPSTREAM)
+    config.update(getattr(settings, 'EREGS_API_UPSTREAM', {}))
+    return config
+
+
+class Histogram(object):
+    """Latencies, counted in roughly logarithmic buckets. Percentiles are
+    reported as the upper bound of the bucket they fall in"""
+    BOUNDS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5,
+              10, 30, 60]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+
+    def observe(self, seconds):
+        idx = bisect.bisect_left(self.BOUNDS, seconds)
+        with self.lock:
+            self.buckets[idx] += 1
+            self.count += 1
+
+    def merge(self, other):
+        with self.lock:
+            for idx, count in enumerate(other.buckets):
+                self.buckets[idx] += count
+            self.count += other.count
+
+    def percentile(self, pct):
+        """Upper bound on the `pct`th percentile; None without samples"""
+        with self.lock:
+            buckets, count = list(self.buckets), self.count
+        if not count:
+            return None
+        threshold = count * pct / 100.0
+        seen = 0
+        for idx, bucket in enumerate(buckets):
+            seen += bucket
+            if seen >= threshold:
+                break
+        if idx < len(self.BOUNDS):
+            return self.BOUNDS[idx]
+        return float('inf')
+
+    def snapshot(self):
+        """Counts keyed by bucket upper bound (in ms), plus p50/p95/p99"""
+        with self.lock:
+            buckets = list(self.buckets)
+        labels = ['%g' % (bound * 1000) for bound in self.BOUNDS] + ['inf']
+        stats = {'buckets': dict(zip(labels, buckets)), 'count': sum(buckets)}
+        for pct in (50, 95, 99):
+            stats['p%d' % pct] = self.percentile(pct)
+        return stats
+
+
+class Replica(object):
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.failed_at = None
+        self.latency = Histogram()
+        self.counters = Counters('requests', 'errors')
+
+    def call(self, fn):
+        with self.lock:
+            self.outstanding += 1
+        self.counters.incr('requests')
+        start = time.time()
+        try:
+            return fn(self.base_url)
+        except Exception:
+            self.counters.incr('errors')
+            self.failed_at = time.time()
+            raise
+        finally:
+            self.latency.observe(time.time() - start)
+            with self.lock:
+                self.outstanding -= 1
+
+    def stats(self):
+        stats = self.counters.snapshot()
+        stats['outstanding'] = self.outstanding
+        stats['latency'] = self.latency.snapshot()
+        return stats
+
+
+class Upstream(object):
+    """A set of interchangeable replicas"""
+    def __init__(self, base_urls):
+        self.replicas = [Replica(base_url) for base_url in base_urls]
+        self.lock = threading.Lock()
+        self.next_idx = 0
+        self.counters = Counters('hedged', 'hedge_wins', 'failovers')
+
+    def choose(self, exclude=()):
+        """The replica with the fewest outstanding requests, avoiding those
+        which failed recently and rotating through ties so that idle
+        replicas share the load"""
+        with self.lock:
+            start = self.next_idx
+            if not exclude:
+                self.next_idx = (start + 1) % len(self.replicas)
+        candidates = [self.replicas[(start + i) % len(self.replicas)]
+                      for i in range(len(self.replicas))]
+        candidates = [r for r in candidates if r not in exclude]
+        cooled_down = time.time() - upstream_config()['FAILURE_COOLDOWN']
+        if candidates:
+            return min(candidates, key=lambda r: (
+                r.failed_at is not None and r.failed_at > cooled_down,
+                r.outstanding))
+
+    def hedge_delay(self, config):
+        combined = Histogram()
+        for replica in self.replicas:
+            combined.merge(replica.latency)
+        if combined.count < config['HEDGE_MIN_SAMPLES']:
+            return config['HEDGE_INITIAL_DELAY']
+        return max(config['HEDGE_MIN_DELAY'],
+                   combined.percentile(config['HEDGE_PERCENTILE']))
+
+    def call(self, fn, final=()):
+        """Call fn(base_url) against one replica or, when hedging, more
+        than one; return the first successful result. Exceptions of the
+        types in `final` are raised without trying other replicas"""
+        config = upstream_config()
+        if config['HEDGE'] and len(self.replicas) > 1:
+            return self._hedged(fn, self.hedge_delay(config), final,
+                                config['HEDGE_WORKERS'])
+
+        tried = []
+        while True:
+            replica = self.choose(exclude=tried)
+            tried.append(replica)
+            try:
+                return replica.call(fn)
+            except final:
+                raise
+            except Exception:
+                if len(tried) == len(self.replicas):
+                    raise
+                self.counters.incr('failovers')
+                logger.warning('Request to %s failed; retrying elsewhere',
+                               replica.base_url, exc_info=True)
+
+    def _hedged(self, fn, delay, final=(), workers=1):
+        """Attempts run on the executor's background pool and report back
+        through a queue. A final error stops further attempts, but those
+        already under way may still succeed"""
+        results = Queue.Queue()
+        tried = []
+
+        def attempt(replica):
+            try:
+                results.put((replica, True, replica.call(fn)))
+            except Exception as e:
+                results.put((replica, False, e))
+
+        def launch():
+            replica = self.choose(exclude=tried)
+            tried.append(replica)
+            executor.submit(attempt, (replica,), workers)
+
+        launch()
+        pending, hedged, error, final_error = 1, False, None, None
+        while pending:
+            try:
+                timeout = None if hedged else delay
+                replica, ok, value = results.get(timeout=timeout)
+            except Queue.Empty:
+                # Slower than usual; ask another replica too
+                hedged = True
+                if final_error is None and len(tried) < len(self.replicas):
+                    self.counters.incr('hedged')
+                    launch()
+                    pending += 1
+                continue
+            pending -= 1
+            if ok:
+                if hedged and replica is not tried[0]:
+                    self.counters.incr('hedge_wins')
+                return value
+            error = value
+            if isinstance(error, final) and final_error is None:
+                final_error = error
+            if (final_error is None and not pending
+                    and len(tried) < len(self.replicas)):
+                self.counters.incr('failovers')
+                launch()
+                pending += 1
+        raise final_error or error
+
+    def stats(self):
+        stats = self.counters.snapshot()
+        stats['replicas'] = dict((r.base_url, r.stats())
+                                 for r in self.replicas)
+        return stats
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(base_urls):
+    """The process-wide Upstream for this set of replicas, so that load and
+    latency are tracked across ApiClients"""
+    key = tuple(base_urls)
+    if key not in _upstreams:
+        with _upstreams_lock:
+            if key not in _upstreams:
+                _upstreams[key] = Upstream(base_urls)
+    return _upstreams[key]
+
+
+def upstream_stats():
+    """Hedging/failover counters and per-replica load and latency, keyed by
+    each set of replicas"""
+    return dict((', '.join(key), value.stats())
+                for key, value in list(_upstreams.items()))
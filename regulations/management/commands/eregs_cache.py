@@ -1,9 +1,10 @@
 from BeautifulSoup import BeautifulSoup
+from django.conf import settings
 import requests
 from urlparse import urlparse
-import threading
 import sys
-import time
+
+from regulations.generator.bulk import BulkFetcher
 
 
 class EregsCache():
@@ -84,36 +85,18 @@ class EregsCache():
             else:
                 regulations_links = regulations.split(",")
 
+            #process 5 web pages at a time, at most 2 a second. Some servers
+            #hate a lot of requests at once
+            fetcher = BulkFetcher(CONCURRENCY=5, RATE=2, RETRIES=0)
             for link in regulations_links:
                 self.write("Getting NAV links from " + self.base_url + link)
 
                 reg_nav = requests.get(self.base_url+link).text
                 soup = BeautifulSoup(reg_nav)
-                reg_soup = soup.findAll("a")
-
-                for a in reg_soup:
-                    if a.has_key('data-section-id'):
-                        partial = self.get_partial_url(a["href"])
-
-                        thread_count = len(threading.enumerate())
-
-                        #process 5 web pages at time. Some servers hate a lot of requests at once.
-                        #slow it down so the threads can catch up
-                        #if there are too many threads being processed, end process and exit out
-                        if thread_count <= 5:
-                            threading.Thread(target=self.access_url, args=(partial, )).start()
-                        elif thread_count >= 12:
-                            self.write("URLs currently at " + str(thread_count) + ". Server too slow")
-                            self.write("Shutting down")
-                            raise Exception("Thread Count Too High")
-                        else:
-                            self.write("Currently Processing " + str(thread_count) + " Urls")
-                            self.write("Waiting...")
-                            time.sleep(thread_count * 2)
-
-                #let the threads catch up before doing the next batch
-                if len(threading.enumerate()) > 1:
-                    time.sleep(len(threading.enumerate()) * 2)
+                partials = [self.get_partial_url(a["href"])
+                            for a in soup.findAll("a")
+                            if a.has_key('data-section-id')]
+                fetcher.run(self.access_url, partials)
 
         except Exception, errtxt:
             self.write_error(str(errtxt))
@@ -124,4 +107,6 @@ if __name__ == "__main__":
     if len(sys.argv) > 3:
         regulations_arg = sys.argv[3]
 
+    if not settings.configured:
+        settings.configure()
     EregsCache(sys.argv[1],regulations_arg)
\ No newline at end of file
@@ -10,6 +10,7 @@ from optparse import make_option
 
 from regulations.generator import generator 
 from regulations.generator import notices
+from regulations.generator.api_reader import ApiReader
 from regulations.views.chrome import ChromeRegulationView
 
 class Command(BaseCommand):
@@ -42,8 +43,25 @@ class Command(BaseCommand):
             raise CommandError(usage_string)
         return (regulation_part, regulation_version)
 
+    def prefetch(self, part, version):
+        """ Warm the API cache with everything rendering will need, fetching
+        it concurrently rather than one request at a time. """
+        layer_names = sorted(set(api_name for api_name, _, _
+                                 in generator.LayerCreator.LAYERS.values()))
+        items = [('regulation', {'label': part, 'version': version}),
+                 ('regversions', {'label': part}),
+                 ('notices', {'part': part})]
+        items.extend(('layer', {'layer_name': name, 'label': part,
+                                'version': version})
+                     for name in layer_names)
+        for result in ApiReader().bulk(items):
+            if result.error:
+                self.stderr.write('Could not prefetch {0}: {1}'.format(
+                    result.item, result.error))
+
     def handle(self, *args, **options):
         part, version = self.get_regulation_version(**options)
+        self.prefetch(part, version)
 
         view = ChromeRegulationView()
         view.request = HttpRequest()
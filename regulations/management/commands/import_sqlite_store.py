@@ -0,0 +1,98 @@
+import json
+import os
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from regulations.generator.api_client import ApiClient
+from regulations.generator.generator import LayerCreator
+from regulations.generator.sqlite_store import SqliteStore
+
+
+class Command(BaseCommand):
+    args = "--source <dummy_api directory or API URL> --db <sqlite file>"
+    help = ('Copy API data into a SQLite file, which API_BASE can then '
+            'point to (sqlite:///path/to/file.db). Everything in a '
+            'directory is imported; from an API, all versions of every '
+            'regulation, with their layers and notices (but not diffs).')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--source',
+            action='store',
+            dest='source',
+            help='dummy_api-style directory or base URL of the API'),
+        make_option('--db',
+            action='store',
+            dest='db',
+            help='SQLite file to write to'))
+
+    def handle(self, *args, **options):
+        source, db = options.get('source'), options.get('db')
+        if not source or not db:
+            raise CommandError(
+                "Usage: python manage.py import_sqlite_store %s\n"
+                % Command.args)
+
+        store = SqliteStore(db)
+        if os.path.isdir(source):
+            paths = self.import_directory(store, source)
+        else:
+            paths = self.import_api(store, source)
+        store.commit()
+        self.stdout.write('Imported {} resources into {}'.format(paths, db))
+
+    def add(self, store, path, data):
+        """Store an API response according to its path"""
+        parts = path.split('/')
+        if parts[0] == 'regulation' and len(parts) == 3:
+            store.add_tree(data, parts[2])
+        elif parts[0] == 'layer' and len(parts) == 4:
+            store.add_layer(parts[1], parts[2], parts[3], data)
+        else:
+            store.add_document(path, data)
+
+    def import_directory(self, store, root):
+        count = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(full_path, root).replace(os.sep, '/')
+                if filename == 'index.html':
+                    path = os.path.dirname(path)
+                try:
+                    with open(full_path) as f:
+                        data = json.load(f)
+                except ValueError:
+                    continue    # not API data (e.g. start.sh)
+                self.add(store, path, data)
+                count += 1
+        return count
+
+    def import_api(self, store, base_url):
+        client = ApiClient()
+        client.base_url = base_url.rstrip('/') + '/'
+        layer_names = sorted(set(api_name for api_name, _, _
+                                 in LayerCreator.LAYERS.values()))
+        fetched = []
+
+        def fetch(path):
+            data = client.get(path)
+            if data is not None:
+                self.add(store, path, data)
+                fetched.append(path)
+            return data
+
+        listing = fetch('regulation') or {'versions': []}
+        parts = sorted(set(v['regulation'] for v in listing['versions']))
+        for part in parts:
+            versions = fetch('regulation/' + part) or {'versions': []}
+            for version in [v['version'] for v in versions['versions']]:
+                self.stdout.write('Importing {} version {}'.format(
+                    part, version))
+                fetch('regulation/{}/{}'.format(part, version))
+                for name in layer_names:
+                    fetch('layer/{}/{}/{}'.format(name, part, version))
+            notices = fetch('notice/' + part) or {'results': []}
+            for notice in notices['results']:
+                fetch('notice/{}/{}'.format(part, notice['document_number']))
+        return len(fetched)
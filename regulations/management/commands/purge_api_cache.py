@@ -0,0 +1,38 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from regulations.generator.api_reader import ApiCache, is_shared
+
+
+class Command(BaseCommand):
+    args = "--regulation <regulation part> --reg_version=<regulation version>"
+    help = ('Invalidate cached API data (trees, layers, diffs) for a '
+            'regulation part and/or version.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--regulation',
+            action='store',
+            dest='regulation_part',
+            help='Regulation part to purge'),
+        make_option('--reg_version',
+            action='store',
+            dest='regulation_version',
+            help='Regulation version to purge'))
+
+    def handle(self, *args, **options):
+        part = options.get('regulation_part')
+        version = options.get('regulation_version')
+        if not part and not version:
+            raise CommandError(
+                "Usage: python manage.py purge_api_cache %s\n" % Command.args)
+
+        cache = ApiCache()
+        if not is_shared(cache.cache):
+            self.stderr.write(
+                'Warning: the API cache ({}) is local to each process; this '
+                'purges nothing in the running web server. Restart it '
+                'instead.'.format(type(cache.cache).__name__))
+        cache.invalidate(part=part, version=version)
+        self.stdout.write('Purged cached API data for {}'.format(
+            ' '.join(filter(None, [part, version]))))
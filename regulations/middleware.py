@@ -0,0 +1,22 @@
+from django.utils.cache import add_never_cache_headers
+
+from regulations.generator import degraded
+
+
+class DegradedResponseMiddleware(object):
+    """Flag responses built from stale API data (see generator.degraded)
+    with a Warning header and make them uncacheable, so that they're
+    replaced as soon as the API recovers. Place after UpdateCacheMiddleware
+    so that it sees the headers."""
+    def process_request(self, request):
+        degraded.reset()
+
+    def process_response(self, request, response):
+        if degraded.is_degraded():
+            mark_degraded(response)
+        return response
+
+
+def mark_degraded(response):
+    response['Warning'] = '110 eregs "Response is Stale"'
+    add_never_cache_headers(response)
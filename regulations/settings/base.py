@@ -114,6 +114,7 @@ TEMPLATES = [{
 # https://docs.djangoproject.com/en/1.8/topics/cache/#the-per-site-cache
 MIDDLEWARE_CLASSES = (
     'django.middleware.cache.UpdateCacheMiddleware',
+    'regulations.middleware.DegradedResponseMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.cache.FetchFromCacheMiddleware',
@@ -129,8 +130,122 @@ INSTALLED_APPS = (
 # eregs specific settings
 
 # The base URL for the API that we use to access layers and the regulation.
+# May also be a list of base URLs for several replicas of the API, or
+# 'sqlite:///path/to/file.db' to run from a local copy of the API's data (see
+# `manage.py import_sqlite_store`).
 API_BASE = os.environ.get('EREGS_API_BASE', '')
 
+# With several replicas, requests go to the one with the fewest outstanding
+# and fail over to the others. With HEDGE, a request which hasn't been
+# answered within the HEDGE_PERCENTILE of recent latencies is also sent to
+# another replica; such requests' attempts run on a pool of HEDGE_WORKERS
+# threads per process. See regulations.generator.upstream.DEFAULT_UPSTREAM.
+EREGS_API_UPSTREAM = {
+    'HEDGE': False,
+    'HEDGE_PERCENTILE': 95,
+}
+
+# HTTP requests to the API share a keep-alive connection pool per process.
+# POOL_CONNECTIONS is the number of upstream hosts to keep pools for and
+# POOL_MAXSIZE the number of connections kept per host. Timeouts are in
+# seconds. See regulations.generator.api_client.DEFAULT_POOL for defaults.
+EREGS_API_POOL = {
+    'POOL_MAXSIZE': 16,
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 60,
+}
+
+# Latency budgets (read timeouts, in seconds) by API path: a list of (regex,
+# seconds), the first match applying; others get READ_TIMEOUT. If a budget is
+# exceeded and a stale copy of the data is cached, it's served instead and the
+# response flagged (and not cached). See
+# regulations.generator.api_client.DEFAULT_BUDGETS for the defaults.
+# EREGS_API_BUDGETS = [(r'^layer/', 5), (r'^regulation/', 30)]
+
+# Pages declare the API resources they need up front; over HTTP these are
+# requested together from the API's bundle endpoint (GET
+# <PATH>?path=...&path=..., answered with a JSON object keyed by path). If the
+# API lacks one, they are fetched concurrently instead and the endpoint isn't
+# tried again for RECHECK_INTERVAL seconds. See
+# regulations.generator.api_client.DEFAULT_BUNDLE for the defaults.
+# EREGS_API_BUNDLE = {'ENABLED': True, 'PATH': 'bundle'}
+
+# Number of threads used to fetch independent API resources (e.g. all of the
+# layers for a page) concurrently. Set to 1 to fetch serially.
+EREGS_FETCH_WORKERS = 8
+
+# Concurrent cache misses for the same API resource share a single upstream
+# fetch within a process. With a shared api_cache (e.g. memcached), setting
+# CACHE_LOCK also coalesces across processes via a lock entry in the cache.
+# The lock expires after LOCK_TIMEOUT seconds, after which another process
+# may fetch too; set it above the slowest expected API response.
+EREGS_API_COALESCE = {
+    'CACHE_LOCK': False,
+    'LOCK_TIMEOUT': 10,
+}
+
+# API responses are cached in two tiers: an in-process LRU of decoded
+# objects bounded by size in bytes (L1), in front of a Django cache (L2).
+# L1_MAX_BYTES bounds the estimated memory held by L1's decoded objects per
+# process (a tree takes several times its serialized size); values larger
+# than L1_MAX_ITEM_BYTES in memory are only stored in L2. CODEC determines
+# how values are serialized for L2: 'pickle', or 'compact' (optionally with
+# CODEC_OPTIONS {'compression': 'zlib'} or, with the lz4 package, 'lz4').
+# With IMMUTABLE_VERSIONS, published versions of regulation trees, layers and
+# diffs never time out; use `manage.py purge_api_cache` to invalidate them.
+# That only reaches the web server's processes through a shared L2 (e.g.
+# memcached), so by default (None) it's enabled only with one, and not with
+# the per-process LocMemCache below.
+# API 404s are remembered for NOT_FOUND_TTL seconds (0 to disable).
+# Entries whose responses carried validators (ETag, Last-Modified) are held
+# REVALIDATE_FOR seconds past expiry and then re-fetched conditionally.
+EREGS_API_CACHE = {
+    'L2_ALIAS': 'api_cache',
+    'L1_MAX_BYTES': 64 * 1024 * 1024,
+    'L1_MAX_ITEM_BYTES': 16 * 1024 * 1024,
+    'CODEC': 'pickle',
+    'IMMUTABLE_VERSIONS': None,
+    'NOT_FOUND_TTL': 60,
+}
+
+# Stale-while-revalidate: once an API cache entry or long-term page cache
+# entry is older than its SOFT_TTL, it is still served immediately while a
+# background thread refreshes it; it is only dropped after HARD_TTL. At most
+# REFRESH_CONCURRENCY refreshes run at once. Times are in seconds. Pages
+# are keyed and skipped as Django's cache_page would (Vary, cookies), and
+# also aren't cached if private. Whether pages use this or cache_page is
+# decided when urls.py is imported: changing ENABLED takes a restart.
+EREGS_STALE_WHILE_REVALIDATE = {
+    'ENABLED': False,
+    'API_SOFT_TTL': 60 * 60,
+    'API_HARD_TTL': 60 * 60 * 24 * 7,
+    'PAGE_SOFT_TTL': 60 * 60 * 24,
+    'PAGE_HARD_TTL': 60 * 60 * 24 * 30,
+    'REFRESH_CONCURRENCY': 4,
+}
+
+# Rendered inline fragments (citation and definition links, key term tags,
+# etc.) are kept in an in-process LRU shared by every request, bounded by
+# MAX_BYTES; fragments larger than MAX_ITEM_BYTES aren't kept. Each is held
+# at most TIMEOUT seconds (None: until evicted). See
+# regulations.generator.layers.fragments.DEFAULT_FRAGMENT_CACHE.
+# EREGS_FRAGMENT_CACHE = {'MAX_BYTES': 8 * 1024 * 1024, 'TIMEOUT': 60 * 60}
+
+# Nodes' marked up text (with inline and search/replace layers applied) is
+# shared between views of the same version (e.g. a section, and the whole
+# regulation) through an in-process LRU bounded by MAX_BYTES; nodes larger
+# than MAX_ITEM_BYTES aren't kept. Each is held at most TIMEOUT seconds
+# (None: until evicted). See
+# regulations.generator.node_cache.DEFAULT_NODE_CACHE.
+# EREGS_NODE_CACHE = {'MAX_BYTES': 32 * 1024 * 1024, 'TIMEOUT': 60 * 60}
+
+# Batch jobs (e.g. generate_regulation, which warms the API cache before
+# rendering) fetch with at most CONCURRENCY requests in flight, retrying
+# failures up to RETRIES times after BACKOFF seconds (doubling each time). A
+# RATE limits attempts per second. See
+# regulations.generator.bulk.DEFAULT_BULK for the defaults.
+# EREGS_BULK_FETCH = {'CONCURRENCY': 4, 'RATE': 20}
+
 # When we generate an full HTML version of the regulation, we want to write it
 # out somewhere. This is where.
 OFFLINE_OUTPUT_DIR = ''
@@ -15,6 +15,7 @@ STATICFILES_DIRS += tuple(
 CACHES['default']['BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
 CACHES['eregs_longterm_cache']['BACKEND'] = 'django.core.cache.backends.dummy.DummyCache'
 CACHES['api_cache']['TIMEOUT'] = 5  # roughly per request
+EREGS_API_CACHE['IMMUTABLE_VERSIONS'] = False
 
 OFFLINE_OUTPUT_DIR = '/tmp/'
 
@@ -5,7 +5,11 @@ import tempfile
 from django.conf import settings
 from django.test import TestCase, override_settings
 
-from regulations.generator.api_client import ApiClient
+from regulations.generator.api_client import (
+    ApiClient, BudgetExceeded, DEFAULT_POOL, NOT_MODIFIED, budget_for,
+    pool_stats)
+from regulations.tests.local_api_server import LocalApiServer
+from regulations.tests.mock_regcore_storage import MockStorage
 
 
 class ClientTest(TestCase):
@@ -23,6 +27,25 @@ class ClientTest(TestCase):
         shutil.rmtree(tmp_root)
         self.assertEqual(["example"], results['results'])
 
+    def test_local_filesystem_validators(self):
+        tmp_root = tempfile.mkdtemp() + os.sep
+        with open(tmp_root + "notice", 'w') as f:
+            f.write('{"results": ["example"]}')
+        client = ApiClient()
+        client.base_url = tmp_root
+        validators = {}
+        self.assertEqual(["example"],
+                         client.get('notice', validators=validators)['results'])
+        self.assertTrue(validators['etag'])
+        self.assertIs(NOT_MODIFIED,
+                      client.get('notice', validators=dict(validators)))
+
+        with open(tmp_root + "notice", 'w') as f:
+            f.write('{"results": ["changed again"]}')
+        results = client.get('notice', validators=validators)
+        shutil.rmtree(tmp_root)
+        self.assertEqual(["changed again"], results['results'])
+
 
 @override_settings(EREGS_REGCORE_URLS='regulations.tests.mock_regcore_urls')
 class ClientUsingRegCoreTests(TestCase):
@@ -63,3 +86,113 @@ class ClientUsingRegCoreTests(TestCase):
 
     def test_unresolvable_request_returns_none(self):
         self.assertIsNone(ApiClient().get('this-doesnt-resolve'))
+
+    def test_validators_hash_the_content(self):
+        validators = {}
+        self.assertEqual(ApiClient().get('returns-200', validators=validators),
+                         {'foo': 'bar'})
+        self.assertIs(NOT_MODIFIED, ApiClient().get(
+            'returns-200', validators=dict(validators)))
+        self.assertEqual(ApiClient().get(
+            'returns-get', params={'zap': 'boom'}, validators=validators),
+            {'zap': 'boom'})
+
+
+@override_settings(
+    EREGS_REGCORE_URLS='regulations.tests.mock_regcore_urls',
+    EREGS_REGCORE_STORAGE='regulations.tests.mock_regcore_storage.MockStorage')
+class ClientUsingRegCoreStorageTests(TestCase):
+    def setUp(self):
+        MockStorage.calls = []
+
+    def test_known_endpoints_use_storage(self):
+        self.assertEqual(ApiClient().get('regulation/1005-2/v1'),
+                         {'label': ['1005', '2'], 'version': 'v1'})
+        self.assertEqual(ApiClient().get('layer/terms/1005/v1'),
+                         {'1005': [{'name': 'terms'}]})
+        self.assertEqual(MockStorage.calls, [
+            ('regulation', '1005-2', 'v1'), ('layer', 'terms', '1005', 'v1')])
+
+    def test_missing_resources_are_none(self):
+        self.assertIsNone(ApiClient().get('regulation/missing/v1'))
+
+    def test_falls_back_to_regcore_urls(self):
+        self.assertEqual(ApiClient().get('returns-200'), {'foo': 'bar'})
+        #   MockStorage has no diffs
+        self.assertIsNone(ApiClient().get('diff/1005/v1/v2'))
+        self.assertEqual(
+            ApiClient().get('returns-get', params={'zap': 'boom'}),
+            {'zap': 'boom'})
+        self.assertEqual(MockStorage.calls, [])
+
+    def test_invalid_setting_raises_import_error(self):
+        with override_settings(EREGS_REGCORE_STORAGE='does.not.Exist'):
+            with self.assertRaises(ImportError):
+                ApiClient()
+
+
+class ClientUsingHttpTests(TestCase):
+    def setUp(self):
+        self.server = LocalApiServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def api_client(self):
+        client = ApiClient()
+        client.base_url = self.server.url
+        return client
+
+    def test_get_from_http(self):
+        notice = self.api_client().get('notice/1005/2011-11111')
+        self.assertEqual(notice['document_number'], '2011-11111')
+
+    def test_get_from_http_conditionally(self):
+        validators = {}
+        notice = self.api_client().get('notice/1005/2011-11111',
+                                       validators=validators)
+        self.assertEqual(notice['document_number'], '2011-11111')
+        self.assertTrue(validators['etag'])
+        self.assertIs(NOT_MODIFIED, self.api_client().get(
+            'notice/1005/2011-11111', validators=validators))
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_get_from_http_404(self):
+        self.assertIsNone(self.api_client().get('notice/not-there'))
+
+    def test_session_is_shared(self):
+        self.assertIs(self.api_client().session, self.api_client().session)
+
+    @override_settings(EREGS_API_POOL={'POOL_MAXSIZE': 3})
+    def test_pool_configuration(self):
+        adapter = self.api_client().session.get_adapter('http://example.com')
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(self.api_client().timeout, (
+            DEFAULT_POOL['CONNECT_TIMEOUT'], DEFAULT_POOL['READ_TIMEOUT']))
+
+    def test_budgets(self):
+        self.assertEqual(5, budget_for('layer/terms/1005/v1'))
+        self.assertEqual(5, budget_for('regulation/1005'))
+        self.assertEqual(30, budget_for('regulation/1005/v1'))
+        self.assertEqual(DEFAULT_POOL['READ_TIMEOUT'], budget_for('other'))
+        with override_settings(EREGS_API_BUDGETS=[(r'^other', 1)]):
+            self.assertEqual(1, budget_for('other'))
+            self.assertEqual(DEFAULT_POOL['READ_TIMEOUT'],
+                             budget_for('layer/terms/1005/v1'))
+
+    @override_settings(EREGS_API_BUDGETS=[(r'^notice', 0.1)])
+    def test_budget_exceeded(self):
+        self.server.delay = 0.5
+        with self.assertRaises(BudgetExceeded):
+            self.api_client().get('notice/1005/2011-11111')
+
+    @override_settings(EREGS_API_POOL={'POOL_MAXSIZE': 2})
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.api_client().get('notice/1005/2011-11111')
+        host = self.server.url.rstrip('/')
+        stats = pool_stats()[host]
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['maxsize'], 2)
@@ -1,11 +1,19 @@
 import os
 import shutil
 import tempfile
+import threading
+import time
+from StringIO import StringIO
 from unittest import TestCase
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, override_settings
 from mock import patch
 
-from regulations.generator.api_reader import ApiReader
+from regulations.generator import api_reader, degraded
+from regulations.generator.api_client import BudgetExceeded
+from regulations.generator.api_reader import ApiCache, ApiReader
 
 
 class ClientTest(TestCase):
@@ -51,6 +59,21 @@ class ClientTest(TestCase):
         self.assertTrue('lablab' in param)
         self.assertTrue('date-here' in param)
 
+    @patch('regulations.generator.api_reader.api_client')
+    def test_compiled_layer(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'1005-2': [{'offsets': [[0, 4]]}]}
+        reader = ApiReader()
+        layer = reader.compiled_layer('terms', '1005-2', 'v1')
+        self.assertEqual([(0, 4, {'offsets': [[0, 4]]})],
+                         layer.offsets('1005-2'))
+        self.assertTrue(
+            layer is reader.compiled_layer('terms', '1005-2', 'v1'))
+        self.assertEqual(1, get.call_count)
+
+        get.return_value = None
+        self.assertEqual(None, reader.compiled_layer('terms', '1005', 'v2'))
+
     @patch('regulations.generator.api_reader.api_client')
     def test_notices(self, api_client):
         to_return = {'example': 1}
@@ -137,13 +160,14 @@ class ClientTest(TestCase):
         reader.regulation('923-a-Interp', 'ver')
         self.assertEqual(1, get.call_count)
 
-        get.return_value = child2
-        reader.regulation('923-Interp-1', 'ver')
-        self.assertEqual(2, get.call_count)
+        #   Untitled descendants are found via the parent's label index
+        self.assertEqual(child2, reader.regulation('923-Interp-1', 'ver'))
+        self.assertEqual(child3, reader.regulation('923-b-Interp', 'ver'))
+        self.assertEqual(1, get.call_count)
 
-        get.return_value = child3
-        reader.regulation('923-b-Interp', 'ver')
-        self.assertEqual(3, get.call_count)
+        get.return_value = None
+        self.assertIsNone(reader.regulation('923-c-Interp', 'ver'))
+        self.assertEqual(2, get.call_count)
 
         child = {
             'text': 'child',
@@ -159,9 +183,63 @@ class ClientTest(TestCase):
         get.return_value = to_return
         reader.regulation('923-1', 'ver')
         reader.regulation('923-1', 'ver')
-        reader.regulation('923-1-a', 'ver')
+        self.assertEqual(child, reader.regulation('923-1-a', 'ver'))
         get = api_client.ApiClient.return_value.get
-        self.assertEqual(2, get.call_count)
+        self.assertEqual(1, get.call_count)
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_derived_from_nearest_ancestor(self, api_client):
+        paragraph = {'text': 'p', 'label': ['924', '2', 'a'],
+                     'children': [{'text': 'c', 'children': [],
+                                   'label': ['924', '2', 'a', '1']}]}
+        tree = {'text': 'root', 'label': ['924'], 'children': [
+            {'text': 'subpart', 'label': ['924', 'Subpart', 'A'],
+             'children': [{'text': 's', 'label': ['924', '2'],
+                           'children': [paragraph]}]},
+            {'text': 'interp', 'label': ['924', 'Interp'], 'children': [
+                {'text': 'i', 'label': ['924', '2', 'Interp'],
+                 'children': [{'text': 'ia', 'children': [],
+                               'label': ['924', '2', 'a', 'Interp']}]}]}]}
+        get = api_client.ApiClient.return_value.get
+        get.return_value = tree
+        reader = ApiReader()
+        derived = api_reader.tree_counters['derived']
+
+        reader.regulation('924', 'ver')
+        self.assertEqual(paragraph, reader.regulation('924-2-a', 'ver'))
+        self.assertEqual(
+            ['924', '2', 'a', 'Interp'],
+            reader.regulation('924-2-a-Interp', 'ver')['label'])
+        self.assertEqual(1, get.call_count)
+        self.assertEqual(derived + 2, api_reader.tree_counters['derived'])
+
+        #   The derived paragraph is itself cached and indexed
+        reader.cache.l1.clear()
+        reader.cache.cache.delete(reader.cache.generate_key(
+            ['regulation', '924', 'ver']))
+        self.assertEqual(paragraph['children'][0],
+                         reader.regulation('924-2-a-1', 'ver'))
+        self.assertEqual(1, get.call_count)
+
+    def test_ancestor_labels(self):
+        self.assertEqual(
+            ['1005-2-a', '1005-2', '1005'],
+            list(api_reader.ancestor_labels('1005-2-a-1')))
+        self.assertEqual([], list(api_reader.ancestor_labels('1005')))
+        self.assertEqual(
+            ['1005-2-a-Interp', '1005-2-Interp', '1005-Interp', '1005'],
+            list(api_reader.ancestor_labels('1005-2-a-Interp-1')))
+        self.assertEqual(
+            ['1005'], list(api_reader.ancestor_labels('1005-Interp')))
+
+    def test_index_labels(self):
+        tree = {'label': ['1'], 'children': [
+            {'label': ['1', 'a'], 'children': []},
+            {'label': ['1', 'b'], 'children': [
+                {'label': ['1', 'b', '1'], 'children': []}]}]}
+        self.assertEqual(
+            {'1': [], '1-a': [0], '1-b': [1], '1-b-1': [1, 0]},
+            api_reader.index_labels(tree))
 
     @patch('regulations.generator.api_reader.api_client')
     def test_cache_mutability(self, api_client):
@@ -187,3 +265,447 @@ class ClientTest(TestCase):
         self.assertEqual(1, get.call_count)
         self.assertEqual(second, {'text': 'parent', 'label': ['1024'],
                                   'children': []})
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_concurrent_misses_coalesce(self, api_client):
+        release = threading.Event()
+
+        def slow_get(suffix, params={}, validators=None):
+            release.wait(2)
+            return {'layer': 'data'}
+        get = api_client.ApiClient.return_value.get
+        get.side_effect = slow_get
+        coalesced = api_reader.inflight.counters['coalesced']
+
+        results = []
+
+        def fetch():
+            results.append(ApiReader().layer('coalesce', '1', 'ver'))
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while api_reader.inflight.counters['coalesced'] - coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, get.call_count)
+        self.assertEqual([{'layer': 'data'}] * 4, results)
+        #   Each caller has its own copy
+        self.assertEqual(4, len(set(id(r) for r in results)))
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_coalesced_errors_propagate(self, api_client):
+        release = threading.Event()
+
+        def failing_get(suffix, params={}, validators=None):
+            release.wait(2)
+            raise ValueError('upstream')
+        api_client.ApiClient.return_value.get.side_effect = failing_get
+        coalesced = api_reader.inflight.counters['coalesced']
+
+        errors = []
+
+        def fetch():
+            try:
+                ApiReader().notice('coalesce', 'error')
+            except ValueError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=fetch) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while api_reader.inflight.counters['coalesced'] - coalesced < 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, len(errors))
+
+    @override_settings(EREGS_API_COALESCE={'CACHE_LOCK': True,
+                                           'LOCK_TIMEOUT': 2,
+                                           'POLL_INTERVAL': 0.01})
+    @patch('regulations.generator.api_reader.api_client')
+    def test_cache_lock_waits_for_other_process(self, api_client):
+        """Another process holds the lock; we pick up its result from the
+        cache instead of fetching"""
+        get = api_client.ApiClient.return_value.get
+        reader = ApiReader()
+        key = reader.cache.generate_key(['notice', 'lock', 'doc'])
+        token = reader.cache.acquire_lock(key, 2)
+        self.assertTrue(token)
+        threading.Timer(
+            0.05, reader.cache.set, (key, {'from': 'elsewhere'})).start()
+
+        self.assertEqual({'from': 'elsewhere'}, reader.notice('lock', 'doc'))
+        self.assertFalse(get.called)
+        reader.cache.release_lock(key, token)
+
+    @override_settings(EREGS_API_COALESCE={'CACHE_LOCK': True,
+                                           'LOCK_TIMEOUT': 0.05,
+                                           'POLL_INTERVAL': 0.01})
+    @patch('regulations.generator.api_reader.api_client')
+    def test_cache_lock_times_out(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'fetched': 'anyway'}
+        reader = ApiReader()
+        key = reader.cache.generate_key(['notice', 'lock', 'stuck'])
+        token = reader.cache.acquire_lock(key, 10)
+        self.assertTrue(token)
+        timeouts = api_reader.lock_counters['lock_timeouts']
+
+        self.assertEqual({'fetched': 'anyway'},
+                         reader.notice('lock', 'stuck'))
+        self.assertEqual(timeouts + 1,
+                         api_reader.lock_counters['lock_timeouts'])
+        reader.cache.release_lock(key, token)
+
+    def test_cache_lock_released_only_by_holder(self):
+        cache = ApiCache()
+        key = cache.generate_key(['notice', 'lock', 'expired'])
+        first = cache.acquire_lock(key, 10)
+        self.assertIsNone(cache.acquire_lock(key, 10))
+        #   The first holder's lock expires, and someone else claims it
+        cache.cache.delete(cache.generate_key(['lock', key]))
+        second = cache.acquire_lock(key, 10)
+        self.assertNotEqual(first, second)
+
+        cache.release_lock(key, first)
+        self.assertIsNone(cache.acquire_lock(key, 10))
+        cache.release_lock(key, second)
+        self.assertTrue(cache.acquire_lock(key, 10))
+        cache.cache.delete(cache.generate_key(['lock', key]))
+
+
+class ApiCacheTest(TestCase):
+    def test_l1_hit_skips_l2(self):
+        cache = api_reader.ApiCache()
+        cache.set('tiers-l1', {'a': [1, 2]})
+        with patch.object(cache, 'cache') as l2:
+            self.assertEqual({'a': [1, 2]}, cache.get('tiers-l1'))
+            self.assertFalse(l2.get.called)
+
+    def test_l2_hit_populates_l1(self):
+        cache = api_reader.ApiCache()
+        cache.set('tiers-l2', {'a': [1, 2]})
+        cache.l1.delete('tiers-l2')
+        l2_hits = api_reader.l2_counters['hits']
+
+        self.assertEqual({'a': [1, 2]}, cache.get('tiers-l2'))
+        self.assertEqual(l2_hits + 1, api_reader.l2_counters['hits'])
+        self.assertEqual({'a': [1, 2]}, cache.get('tiers-l2'))
+        self.assertEqual(l2_hits + 1, api_reader.l2_counters['hits'])
+
+    def test_values_are_copied(self):
+        cache = api_reader.ApiCache()
+        value = {'children': [{'label': ['1']}]}
+        cache.set('tiers-copy', value)
+        value['children'].append('mutated')
+        fetched = cache.get('tiers-copy')
+        self.assertEqual({'children': [{'label': ['1']}]}, fetched)
+        fetched['children'][0]['label'].append('mutated')
+        self.assertEqual({'children': [{'label': ['1']}]},
+                         cache.get('tiers-copy'))
+
+    def test_get_item(self):
+        cache = api_reader.ApiCache()
+        cache.set('tiers-index', {'1-a': [0], '1-b': [1]})
+        with patch('regulations.generator.api_reader.copy_data') as copy:
+            copy.side_effect = lambda value: list(value)
+            self.assertEqual([1], cache.get_item('tiers-index', '1-b'))
+            copy.assert_called_once_with([1])
+        fetched = cache.get_item('tiers-index', '1-a')
+        fetched.append('mutated')
+        self.assertEqual([0], cache.get_item('tiers-index', '1-a'))
+        self.assertIsNone(cache.get_item('tiers-index', '1-c'))
+        self.assertIsNone(cache.get_item('tiers-missing', '1-a'))
+        cache.set_not_found('tiers-not-found')
+        self.assertIsNone(cache.get_item('tiers-not-found', '1-a'))
+
+    @override_settings(EREGS_API_CACHE={'L1_MAX_BYTES': 2000,
+                                        'L1_MAX_ITEM_BYTES': 1500})
+    def test_l1_byte_budget(self):
+        cache = api_reader.ApiCache()
+        cache.l1.clear()
+        cache.set('tiers-big', 'x' * 1600)
+        self.assertEqual(0, len(cache.l1))
+        cache.set('tiers-1', 'x' * 900)
+        cache.set('tiers-2', 'x' * 900)
+        cache.set('tiers-3', 'x' * 900)
+        self.assertEqual(2, len(cache.l1))
+        self.assertTrue(cache.l1.bytes <= 2000)
+        #   Still available from L2
+        self.assertEqual('x' * 1600, cache.get('tiers-big'))
+        self.assertEqual('x' * 900, cache.get('tiers-1'))
+
+    def test_copy_data(self):
+        data = {'a': [{'b': 'c'}, 1], 'd': None}
+        copied = api_reader.copy_data(data)
+        self.assertEqual(data, copied)
+        self.assertIsNot(data['a'], copied['a'])
+        self.assertIsNot(data['a'][0], copied['a'][0])
+
+
+@override_settings(EREGS_STALE_WHILE_REVALIDATE={
+    'ENABLED': True, 'API_SOFT_TTL': 10, 'API_HARD_TTL': 100,
+    'REFRESH_CONCURRENCY': 2})
+class StaleWhileRevalidateTest(SimpleTestCase):
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_stale_served_and_refreshed(self, api_client, time_mod):
+        time_mod.time.return_value = 1000
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'version': 1}
+        reader = ApiReader()
+        self.assertEqual({'version': 1}, reader.notice('swr', 'doc'))
+
+        time_mod.time.return_value = 1005
+        get.return_value = {'version': 2}
+        self.assertEqual({'version': 1}, reader.notice('swr', 'doc'))
+        self.assertEqual(1, get.call_count)
+
+        time_mod.time.return_value = 1011
+        self.assertEqual({'version': 1}, reader.notice('swr', 'doc'))
+        for _ in range(200):
+            if reader.cache.get('notice-swr-doc') == {'version': 2}:
+                break
+            time.sleep(0.01)
+        self.assertEqual(2, get.call_count)
+        self.assertEqual({'version': 2}, reader.notice('swr', 'doc'))
+
+    def test_lifetimes(self):
+        self.assertEqual((10, 100), api_reader.ApiCache().lifetimes())
+
+
+class ApiCacheCodecTest(SimpleTestCase):
+    @override_settings(EREGS_API_CACHE={
+        'CODEC': 'compact', 'CODEC_OPTIONS': {'compression': 'zlib'}})
+    def test_configured_codec(self):
+        cache = api_reader.ApiCache()
+        tree = {'label': ['1'], 'children': [{'label': ['1', 'a'],
+                                              'children': []}]}
+        cache.set('codec-compact', tree)
+        fresh_until, expires_at, encoded = cache.cache.get('codec-compact')
+        self.assertEqual('Z', encoded[0])
+        cache.l1.delete('codec-compact')
+        self.assertEqual(tree, cache.get('codec-compact'))
+
+
+@override_settings(EREGS_API_CACHE={'GENERATION_CHECK_INTERVAL': 0,
+                                   'IMMUTABLE_VERSIONS': True})
+class ImmutableVersionsTest(SimpleTestCase):
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_versions_never_expire(self, api_client, time_mod):
+        time_mod.time.return_value = 1000
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'layer': 'data'}
+        reader = ApiReader()
+        reader.layer('immutable', '926', 'v1')
+        reader.regversions('926')
+
+        time_mod.time.return_value = 1000 + 60 * 60 * 24 * 365
+        reader.cache.l1.clear()
+        reader.layer('immutable', '926', 'v1')
+        self.assertEqual(2, get.call_count)
+        reader.regversions('926')
+        self.assertEqual(3, get.call_count)
+
+    def test_immutable_scope(self):
+        self.assertEqual(('1005', ['v']), api_reader.immutable_scope(
+            ['regulation', '1005-2-a', 'v']))
+        self.assertEqual(('1005', ['v']), api_reader.immutable_scope(
+            ['layer', 'terms', '1005', 'v']))
+        self.assertEqual(('1005', ['old', 'new']), api_reader.immutable_scope(
+            ['diff', '1005-2', 'old', 'new']))
+        self.assertIsNone(api_reader.immutable_scope(['regversions', '1005']))
+        self.assertIsNone(api_reader.immutable_scope(['notices']))
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_invalidate_part(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'text': 'p', 'label': ['927'], 'children': []}
+        reader = ApiReader()
+        reader.regulation('927', 'v1')
+        reader.layer('terms', '927', 'v1')
+        reader.regversions('927')
+        reader.layer('terms', '928', 'v1')
+        self.assertEqual(4, get.call_count)
+
+        call_command('purge_api_cache', regulation_part='927',
+                     stderr=StringIO(), stdout=StringIO())
+        reader.regulation('927', 'v1')
+        reader.layer('terms', '927', 'v1')
+        reader.regversions('927')
+        self.assertEqual(7, get.call_count)
+        reader.layer('terms', '928', 'v1')
+        self.assertEqual(7, get.call_count)
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_invalidate_version(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'diff': 'data'}
+        reader = ApiReader()
+        reader.diff('929', 'v1', 'v2')
+        reader.layer('terms', '929', 'v3')
+
+        ApiCache().invalidate(version='v2')
+        reader.diff('929', 'v1', 'v2')
+        reader.layer('terms', '929', 'v3')
+        self.assertEqual(3, get.call_count)
+
+    def test_command_requires_an_argument(self):
+        with self.assertRaises(CommandError):
+            call_command('purge_api_cache')
+
+    def test_command_warns_about_local_caches(self):
+        stderr = StringIO()
+        call_command('purge_api_cache', regulation_part='927',
+                     stderr=stderr, stdout=StringIO())
+        self.assertIn('local to each process', stderr.getvalue())
+
+    @patch('regulations.generator.api_reader.time')
+    def test_generations_never_regress(self, time_mod):
+        time_mod.time.return_value = 1000
+        cache = ApiCache()
+        cache.cache.delete('generation-part-930')
+        cache.invalidate(part='930')
+        cache.invalidate(part='930')
+        self.assertEqual(1000001, cache.generation('part-930'))
+
+        cache.cache.delete('generation-part-930')     # e.g. culled
+        time_mod.time.return_value = 1001
+        self.assertEqual(1001000, cache.generation('part-930'))
+
+    @override_settings(EREGS_API_CACHE={'IMMUTABLE_VERSIONS': None})
+    def test_immutable_only_with_shared_cache(self):
+        self.assertFalse(ApiCache().immutable_versions)
+        with patch('regulations.generator.api_reader.is_shared') as shared:
+            shared.return_value = True
+            self.assertTrue(ApiCache().immutable_versions)
+
+
+class NotFoundTest(TestCase):
+    def setUp(self):
+        api_reader.not_found_counters.reset()
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_remembers_404s(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = None
+        reader = ApiReader()
+        self.assertIsNone(reader.notice('930', 'missing'))
+        self.assertIsNone(reader.notice('930', 'missing'))
+        self.assertIsNone(reader.regulation('930-1', 'missing'))
+        self.assertIsNone(reader.regulation('930-1', 'missing'))
+        self.assertEqual(2, get.call_count)
+        self.assertEqual({'stored': 2, 'hits': 2},
+                         api_reader.not_found_counters.snapshot())
+
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_expires(self, api_client, time_mod):
+        time_mod.time.return_value = 1000
+        get = api_client.ApiClient.return_value.get
+        get.return_value = None
+        reader = ApiReader()
+        reader.notice('931', 'missing')
+
+        time_mod.time.return_value = 1000 + 61
+        get.return_value = {'notice': 'published'}
+        self.assertEqual({'notice': 'published'},
+                         reader.notice('931', 'missing'))
+        self.assertEqual(2, get.call_count)
+
+    def test_distinguishable_from_miss(self):
+        cache = ApiCache()
+        cache.set_not_found('not-found-key')
+        cache.l1.clear()
+        self.assertIs(api_reader.NOT_FOUND, cache.get('not-found-key'))
+        self.assertIsNone(cache.get('never-set-key'))
+
+    @override_settings(EREGS_API_CACHE={'NOT_FOUND_TTL': 0})
+    @patch('regulations.generator.api_reader.api_client')
+    def test_disabled(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = None
+        reader = ApiReader()
+        reader.notice('932', 'missing')
+        reader.notice('932', 'missing')
+        self.assertEqual(2, get.call_count)
+
+
+class RevalidationTest(TestCase):
+    def setUp(self):
+        api_reader.revalidation_counters.reset()
+
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_revalidates_expired_entries(self, api_client, time_mod):
+        def conditional_get(suffix, params={}, validators=None):
+            if validators.get('etag') == '"v1"':
+                return api_client.NOT_MODIFIED
+            validators['etag'] = '"v1"'
+            return {'notices': ['a']}
+        api_client.NOT_MODIFIED = object()
+        get = api_client.ApiClient.return_value.get
+        get.side_effect = conditional_get
+        time_mod.time.return_value = 1000
+        reader = ApiReader()
+        self.assertEqual({'notices': ['a']}, reader.notices('933'))
+
+        time_mod.time.return_value = 1000 + 60 * 60
+        self.assertEqual({'notices': ['a']}, reader.notices('933'))
+        self.assertEqual({'notices': ['a']}, reader.notices('933'))
+        self.assertEqual(2, get.call_count)
+        self.assertEqual({'conditional': 1, 'not_modified': 1},
+                         api_reader.revalidation_counters.snapshot())
+
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_no_validators(self, api_client, time_mod):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'notices': ['b']}
+        time_mod.time.return_value = 1000
+        reader = ApiReader()
+        reader.notices('934')
+
+        time_mod.time.return_value = 1000 + 60 * 60
+        reader.notices('934')
+        self.assertEqual(2, get.call_count)
+        self.assertEqual({}, get.call_args[1]['validators'])
+        self.assertEqual(0, api_reader.revalidation_counters['conditional'])
+
+
+class LatencyBudgetTest(TestCase):
+    def setUp(self):
+        api_reader.budget_counters.reset()
+        degraded.reset()
+
+    def tearDown(self):
+        degraded.reset()
+
+    @patch('regulations.generator.api_reader.time')
+    @patch('regulations.generator.api_reader.api_client')
+    def test_serves_stale_data(self, api_client, time_mod):
+        get = api_client.ApiClient.return_value.get
+        get.return_value = {'notices': ['c']}
+        time_mod.time.return_value = 1000
+        reader = ApiReader()
+        reader.notices('935')
+        self.assertFalse(degraded.is_degraded())
+
+        time_mod.time.return_value = 1000 + 60 * 60
+        get.side_effect = BudgetExceeded
+        self.assertEqual({'notices': ['c']}, reader.notices('935'))
+        self.assertTrue(degraded.is_degraded())
+        self.assertEqual({'exceeded': 1, 'served_stale': 1},
+                         api_reader.budget_counters.snapshot())
+
+    @patch('regulations.generator.api_reader.api_client')
+    def test_nothing_stale(self, api_client):
+        get = api_client.ApiClient.return_value.get
+        get.side_effect = BudgetExceeded
+        with self.assertRaises(BudgetExceeded):
+            ApiReader().notices('936')
+        self.assertFalse(degraded.is_degraded())
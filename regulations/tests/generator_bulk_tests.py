@@ -0,0 +1,193 @@
+import threading
+import time
+
+from django.test import SimpleTestCase, override_settings
+from mock import patch
+
+from regulations.generator import api_client, generator
+from regulations.generator.api_reader import ApiReader
+from regulations.generator.bulk import BulkFetcher, RateLimiter
+from regulations.tests.local_api_server import LocalApiServer
+
+
+class BulkFetcherTests(SimpleTestCase):
+    def test_results_in_order(self):
+        def square(item):
+            time.sleep(0.01 * (5 - item))
+            return item * item
+        results = BulkFetcher(CONCURRENCY=5).run(square, range(5))
+        self.assertEqual([0, 1, 4, 9, 16], [r.value for r in results])
+        self.assertEqual(range(5), [r.item for r in results])
+        self.assertEqual([], BulkFetcher().run(square, []))
+
+    def test_bounded_concurrency(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max': 0}
+
+        def track(item):
+            with lock:
+                state['running'] += 1
+                state['max'] = max(state['max'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+        BulkFetcher(CONCURRENCY=3).run(track, range(12))
+        self.assertEqual(3, state['max'])
+
+    def test_retries(self):
+        failures = {'flaky': 2, 'broken': 10}
+
+        def fetch(item):
+            if failures.get(item):
+                failures[item] -= 1
+                raise IOError(item)
+            return item
+        fetcher = BulkFetcher(RETRIES=2, BACKOFF=0.001)
+        flaky, broken, fine = fetcher.run(fetch, ['flaky', 'broken', 'fine'])
+        self.assertEqual(('flaky', None, 3), (flaky.value, flaky.error,
+                                              flaky.attempts))
+        self.assertIsNone(broken.value)
+        self.assertTrue(isinstance(broken.error, IOError))
+        self.assertEqual(3, broken.attempts)
+        self.assertEqual(('fine', 1), (fine.value, fine.attempts))
+        self.assertEqual({'fetched': 2, 'retried': 4, 'failed': 1},
+                         fetcher.counters.snapshot())
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(50)
+        start = time.time()
+        for _ in range(6):
+            limiter.wait()
+        self.assertTrue(time.time() - start >= 0.1)
+
+        start = time.time()
+        BulkFetcher(CONCURRENCY=4, RATE=100).run(lambda i: i, range(11))
+        self.assertTrue(time.time() - start >= 0.1)
+
+
+@override_settings(EREGS_API_CACHE={'IMMUTABLE_VERSIONS': True})
+class ApiReaderBulkTests(SimpleTestCase):
+    def setUp(self):
+        self.server = LocalApiServer().start()
+        reader = ApiReader()
+        reader.cache.l1.clear()
+        reader.cache.cache.clear()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_bulk_fills_cache(self):
+        items = [
+            ('regulation', {'label': '1005', 'version': '2011-11111'}),
+            ('layer', {'layer_name': 'terms', 'label': '1005',
+                       'version': '2011-11111'}),
+            ('layer', {'layer_name': 'meta', 'label': '1005',
+                       'version': '2011-11111'}),
+            ('notice', {'part': '1005', 'fr_document_number': 'missing'}),
+            ('diff', {'label': '1005', 'older': '2012-12121',
+                      'newer': '2011-11111'})]
+        with self.settings(API_BASE=self.server.url):
+            results = ApiReader().bulk(items, CONCURRENCY=3)
+            self.assertEqual(['1005'], results[0].value['label'])
+            self.assertIsNotNone(results[1].value)
+            self.assertIsNone(results[3].value)
+            self.assertIsNone(results[3].error)
+            self.assertEqual(5, len(self.server.requests))
+
+            #   Everything is now served from the cache
+            reader = ApiReader()
+            self.assertEqual(results[1].value,
+                             reader.layer('terms', '1005-2', '2011-11111'))
+            self.assertIsNone(reader.notice('1005', 'missing'))
+            self.assertIsNotNone(reader.regulation('1005-2', '2011-11111'))
+            reader.bulk(items)
+            self.assertEqual(5, len(self.server.requests))
+
+    def test_unknown_endpoint(self):
+        self.assertRaises(ValueError, ApiReader().bulk,
+                          [('search', {'query': 'q'})])
+
+
+@override_settings(EREGS_API_CACHE={'IMMUTABLE_VERSIONS': True})
+class PrefetchTests(SimpleTestCase):
+    items = [
+        ('regulation', {'label': '1005', 'version': '2011-11111'}),
+        ('layer', {'layer_name': 'terms', 'label': '1005-2',
+                   'version': '2011-11111'}),
+        ('layer', {'layer_name': 'toc', 'label': '1005-2',
+                   'version': '2011-11111'}),
+        ('notice', {'part': '1005', 'fr_document_number': 'missing'})]
+
+    def setUp(self):
+        api_client._unbundled.clear()
+        reader = ApiReader()
+        reader.cache.l1.clear()
+        reader.cache.cache.clear()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start(self, bundle):
+        server = LocalApiServer(bundle=bundle).start()
+        self.servers.append(server)
+        return server
+
+    def assert_cached(self, server):
+        requests = len(server.requests)
+        reader = ApiReader()
+        self.assertEqual(['1005', '2'],
+                         reader.regulation('1005-2', '2011-11111')['label'])
+        self.assertIsNotNone(reader.layer('terms', '1005', '2011-11111'))
+        self.assertIsNotNone(reader.layer('toc', '1005', '2011-11111'))
+        self.assertIsNone(reader.notice('1005', 'missing'))
+        self.assertEqual(requests, len(server.requests))
+
+    def test_bundled(self):
+        server = self.start(bundle=True)
+        with self.settings(API_BASE=server.url):
+            ApiReader().prefetch(self.items)
+            self.assertEqual(1, len(server.requests))
+            self.assertTrue(server.requests[0].startswith('/bundle?'))
+            self.assert_cached(server)
+
+            #   Nothing left to fetch, nor copied to find that out
+            items = self.items + [
+                ('regulation', {'label': '1005-2', 'version': '2011-11111'})]
+            with patch('regulations.generator.api_reader.copy_data') as copy:
+                copy.side_effect = lambda value: value
+                ApiReader().prefetch(items)
+                for (value,), _ in copy.call_args_list:
+                    self.assertFalse(isinstance(value, dict))
+            self.assertEqual(1, len(server.requests))
+
+    def test_without_bundle_endpoint(self):
+        server = self.start(bundle=False)
+        with self.settings(API_BASE=server.url):
+            ApiReader().prefetch(self.items)
+            self.assertEqual(5, len(server.requests))
+            self.assert_cached(server)
+
+            #   The missing endpoint is remembered
+            ApiReader().prefetch([('layer', {
+                'layer_name': 'meta', 'label': '1005',
+                'version': '2011-11111'})])
+            self.assertEqual(['/layer/meta/1005/2011-11111'],
+                             server.requests[5:])
+
+    def test_prefetch_page(self):
+        server = self.start(bundle=True)
+        with self.settings(API_BASE=server.url):
+            generator.prefetch_page('1005', '2011-11111')
+            self.assertEqual(1, len(server.requests))
+            reader = ApiReader()
+            #   Not in dummy_api, so remembered as missing
+            self.assertIsNone(reader.regversions('1005'))
+            self.assertIsNotNone(reader.layer('analyses', '1005-2',
+                                              '2011-11111'))
+            self.assertEqual(1, len(server.requests))
+
+    def test_unknown_endpoint(self):
+        self.assertRaises(ValueError, ApiReader().prefetch,
+                          [('search', {'query': 'q'})])
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from django.core.exceptions import ImproperlyConfigured
+
+from regulations.generator import cache_codecs
+
+
+TREE = {
+    'label': ['1005'], 'node_type': 'regtext', 'text': u'', 'title': None,
+    'children': [{
+        'label': ['1005', '1'], 'node_type': 'regtext', 'text': u'\xa7 1',
+        'children': [{'label': ['1005', '1', 'a'], 'text': u'(a) Text',
+                      'children': [], 'node_type': 'regtext'}]
+    }, {
+        'label': ['1005', 'Interp'], 'node_type': 'interp', 'text': '',
+        'children': [{'label': ['1005', '1', 'Interp'], 'text': 'Interp',
+                      'children': [], 'node_type': 'interp'}]
+    }, {
+        'label': 'not-a-list', 'children': [], 'count': 3, 'ratio': 1.5,
+        'flag': True, 'big': 2 ** 70,
+    }]
+}
+
+
+class CacheCodecsTests(TestCase):
+    def test_round_trips(self):
+        for codec in (cache_codecs.PickleCodec(),
+                      cache_codecs.CompactCodec(),
+                      cache_codecs.CompactCodec('zlib')):
+            for value in (TREE, None, [], {}, u'text', 5,
+                          {'1005-1': [{'offsets': [[0, 4]], 'ref': 'x'}]}):
+                self.assertEqual(value,
+                                 cache_codecs.decode(codec.encode(value)))
+
+    def test_tags(self):
+        self.assertEqual('P', cache_codecs.PickleCodec().encode(TREE)[0])
+        self.assertEqual('C', cache_codecs.CompactCodec().encode(TREE)[0])
+        self.assertEqual('Z',
+                         cache_codecs.CompactCodec('zlib').encode(TREE)[0])
+
+    def test_compact_falls_back_to_pickle(self):
+        value = {'tuple': (1, 2), 'set': set([1])}
+        encoded = cache_codecs.CompactCodec().encode(value)
+        self.assertEqual('P', encoded[0])
+        self.assertEqual(value, cache_codecs.decode(encoded))
+
+    def test_compact_is_smaller(self):
+        tree = {'label': ['1'], 'node_type': 'regtext', 'text': 'Root',
+                'children': []}
+        for i in range(50):
+            tree['children'].append({
+                'label': ['1', str(i)], 'node_type': 'regtext',
+                'text': 'Section %d' % i, 'title': 'Title %d' % i,
+                'children': [{'label': ['1', str(i), c], 'children': [],
+                              'node_type': 'regtext', 'text': c}
+                             for c in 'abcdef']})
+        pickled = cache_codecs.PickleCodec().encode(tree)
+        compact = cache_codecs.CompactCodec().encode(tree)
+        compressed = cache_codecs.CompactCodec('zlib').encode(tree)
+        self.assertTrue(len(compact) < len(pickled))
+        self.assertTrue(len(compressed) < len(compact))
+
+    def test_get_codec(self):
+        self.assertTrue(isinstance(cache_codecs.get_codec('pickle'),
+                                   cache_codecs.PickleCodec))
+        codec = cache_codecs.get_codec(
+            'regulations.generator.cache_codecs.CompactCodec',
+            {'compression': 'zlib'})
+        self.assertEqual('zlib', codec.compression)
+        with self.assertRaises(ImproperlyConfigured):
+            cache_codecs.get_codec('compact', {'compression': 'rar'})
+
+    def test_unknown_tag(self):
+        with self.assertRaises(ValueError):
+            cache_codecs.decode('?stuff')
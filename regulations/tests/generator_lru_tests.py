@@ -0,0 +1,79 @@
+import pickle
+import sys
+from unittest import TestCase
+
+from mock import patch
+
+from regulations.generator.lru import ByteLRU, footprint, MISSING
+
+
+class ByteLRUTests(TestCase):
+    def test_get_set(self):
+        lru = ByteLRU(100)
+        self.assertIs(MISSING, lru.get('a'))
+        self.assertEqual('default', lru.get('a', 'default'))
+        lru.set('a', {'some': 'value'}, 10)
+        self.assertEqual({'some': 'value'}, lru.get('a'))
+        self.assertEqual(10, lru.bytes)
+        stats = lru.stats()
+        self.assertEqual((1, 2, 1), (stats['hits'], stats['misses'],
+                                     stats['sets']))
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        lru = ByteLRU(100)
+        lru.set('a', 'a', 40)
+        lru.set('b', 'b', 40)
+        lru.get('a')
+        lru.set('c', 'c', 40)
+        self.assertIs(MISSING, lru.get('b'))
+        self.assertEqual('a', lru.get('a'))
+        self.assertEqual('c', lru.get('c'))
+        self.assertEqual(80, lru.bytes)
+        self.assertEqual(1, lru.stats()['evictions'])
+
+    def test_replacing_adjusts_size(self):
+        lru = ByteLRU(100)
+        lru.set('a', 'a', 40)
+        lru.set('a', 'aa', 60)
+        self.assertEqual(60, lru.bytes)
+        self.assertEqual(1, len(lru))
+
+    def test_rejects_large_items(self):
+        lru = ByteLRU(100, max_item_bytes=50)
+        lru.set('a', 'a', 40)
+        self.assertFalse(lru.set('b', 'b', 51))
+        self.assertIs(MISSING, lru.get('b'))
+        self.assertEqual('a', lru.get('a'))
+        self.assertEqual(1, lru.stats()['rejections'])
+
+    @patch('regulations.generator.lru.time')
+    def test_expiration(self, time):
+        time.time.return_value = 1000
+        lru = ByteLRU(100)
+        lru.set('a', 'a', 10, timeout=5)
+        lru.set('b', 'b', 10)
+        time.time.return_value = 1006
+        self.assertIs(MISSING, lru.get('a'))
+        self.assertEqual('b', lru.get('b'))
+        self.assertEqual(10, lru.bytes)
+        self.assertEqual(1, lru.stats()['expirations'])
+
+    def test_delete_clear(self):
+        lru = ByteLRU(100)
+        lru.set('a', 'a', 10)
+        lru.set('b', 'b', 10)
+        lru.delete('a')
+        self.assertIs(MISSING, lru.get('a'))
+        self.assertEqual(10, lru.bytes)
+        lru.clear()
+        self.assertEqual(0, lru.bytes)
+        self.assertEqual(0, len(lru))
+
+
+class FootprintTests(TestCase):
+    def test_counts_contents(self):
+        self.assertEqual(sys.getsizeof(u'text'), footprint(u'text'))
+        node = {'label': ['1005', '2'], 'text': u'Some text',
+                'children': [{'label': ['1005', '2', 'a'], 'children': []}]}
+        self.assertTrue(footprint(node) > footprint(node['children']) > 0)
+        self.assertTrue(footprint(node) > len(pickle.dumps(node, 2)))
@@ -0,0 +1,112 @@
+from cStringIO import StringIO
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from regulations.generator.api_client import ApiClient
+from regulations.generator.sqlite_store import SqliteStore
+from regulations.tests.local_api_server import DUMMY_API, LocalApiServer
+
+
+def fixture(*path):
+    with open(os.path.join(DUMMY_API, *path)) as f:
+        return json.load(f)
+
+
+def find_node(tree, label):
+    if tree['label'] == label:
+        return tree
+    for child in tree['children']:
+        found = find_node(child, label)
+        if found:
+            return found
+
+
+class SqliteStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp_dir, 'eregs.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def api_client(self):
+        client = ApiClient()
+        client.base_url = 'sqlite://' + self.db
+        return client
+
+    def test_import_directory(self):
+        call_command('import_sqlite_store', source=DUMMY_API, db=self.db,
+                     stdout=StringIO())
+        client = self.api_client()
+        tree = fixture('regulation', '1005', '2011-11111')
+        self.assertEqual(tree, client.get('regulation/1005/2011-11111'))
+        self.assertEqual(find_node(tree, ['1005', '2']),
+                         client.get('regulation/1005-2/2011-11111'))
+        self.assertEqual(fixture('layer', 'terms', '1005', '2012-12121'),
+                         client.get('layer/terms/1005/2012-12121'))
+        self.assertEqual(fixture('notice', '1005', '2011-11111'),
+                         client.get('notice/1005/2011-11111'))
+        self.assertEqual(fixture('diff', '1005', '2012-12121', '2011-11111'),
+                         client.get('diff/1005/2012-12121/2011-11111'))
+
+        self.assertIsNone(client.get('regulation/1005-2/not-a-version'))
+        self.assertIsNone(client.get('layer/terms/1005/not-a-version'))
+        self.assertIsNone(client.get('notice/1005/not-a-notice'))
+        self.assertIsNone(client.get('search', {'q': 'offline'}))
+
+    def test_layer_slices(self):
+        store = SqliteStore(self.db)
+        store.add_layer('terms', '1005', 'v1', {
+            '1005-2': [1], '1005-2-a': [2], '1005-20': [3], '1005-2-A': [4],
+            'referenced': {'a:1005-2': {}}})
+        store.add_layer('empty', '1005', 'v1', {})
+        store.commit()
+        referenced = {'a:1005-2': {}}
+        self.assertEqual({'1005-2': [1], '1005-2-a': [2], '1005-2-A': [4],
+                          'referenced': referenced},
+                         store.layer('terms', '1005-2', 'v1'))
+        self.assertEqual({'1005-2-a': [2], 'referenced': referenced},
+                         store.layer('terms', '1005-2-a', 'v1'))
+        self.assertEqual(5, len(store.layer('terms', '1005', 'v1')))
+        self.assertEqual({}, store.layer('empty', '1005', 'v1'))
+
+    def test_import_api(self):
+        root = os.path.join(self.tmp_dir, 'api')
+        shutil.copytree(DUMMY_API, root)
+
+        def write(data, *path):
+            with open(os.path.join(root, *path), 'w') as f:
+                json.dump(data, f)
+        write({'versions': [{'regulation': '1005', 'version': '2011-11111'}]},
+              'regulation', 'index.html')
+        write({'versions': [{'version': '2011-11111'}]},
+              'regulation', '1005', 'index.html')
+        write({'results': [{'document_number': '2011-11111'}]},
+              'notice', '1005', 'index.html')
+        write(fixture('notice', '1005', '2011-11111'),
+              'notice', '1005', '2011-11111')
+
+        with LocalApiServer(root) as server:
+            call_command('import_sqlite_store', source=server.url,
+                         db=self.db, stdout=StringIO())
+        client = self.api_client()
+        self.assertEqual(fixture('regulation', '1005', '2011-11111'),
+                         client.get('regulation/1005/2011-11111'))
+        self.assertEqual(
+            fixture('layer', 'internal-citations', '1005', '2011-11111'),
+            client.get('layer/internal-citations/1005/2011-11111'))
+        self.assertEqual({'versions': [{'version': '2011-11111'}]},
+                         client.get('regulation/1005'))
+        self.assertEqual(fixture('notice', '1005', '2011-11111'),
+                         client.get('notice/1005/2011-11111'))
+        self.assertIsNone(client.get('regulation/1005/2012-12121'))
+
+    def test_command_requires_arguments(self):
+        with self.assertRaises(CommandError):
+            call_command('import_sqlite_store', source=DUMMY_API)
@@ -1,8 +1,11 @@
+import threading
 from unittest import TestCase
 
+from django.test import override_settings
 from mock import patch
 
-from regulations.generator import generator
+from regulations.generator import degraded, generator
+from regulations.generator.layers.compiled import CompiledLayer
 from regulations.generator.layers.layers_applier import InlineLayersApplier
 from regulations.generator.layers.layers_applier import ParagraphLayersApplier
 from regulations.generator.layers.layers_applier\
@@ -125,3 +128,109 @@ class GeneratorTest(TestCase):
         internal_citation_layer = i.layers['internal']
         self.assertTrue(internal_citation_layer.sectional)
         self.assertEquals(internal_citation_layer.version, 'verver')
+
+    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
+    def test_add_layers_shares_prepared_layers(self, get_layer_json):
+        compiled = CompiledLayer({
+            '4040-1': [{'ref': 'a:4040-2', 'offsets': [[0, 1]]}],
+            'referenced': {'a:4040-2': {'term': 'a', 'reference': '4040-2',
+                                        'position': [0, 1]}}})
+        get_layer_json.return_value = compiled
+
+        def layers(sectional=False):
+            creator = generator.LayerCreator()
+            creator.add_layers(['graphics', 'terms'], '4040-1', 'v1',
+                               sectional=sectional)
+            i, p, s = creator.get_appliers()
+            return s.layers['graphics'], i.layers['terms']
+
+        graphics, terms = layers()
+        again_graphics, again_terms = layers()
+        self.assertTrue(graphics is again_graphics)
+        #   Per-request state isn't shared
+        self.assertFalse(terms is again_terms)
+        self.assertFalse(terms.rev_urls is again_terms.rev_urls)
+        self.assertTrue(
+            terms.reference_splits is again_terms.reference_splits)
+        self.assertFalse(
+            'reference_split' in compiled['referenced']['a:4040-2'])
+
+        self.assertFalse(graphics is layers(sectional=True)[0])
+        self.assertTrue(layers(sectional=True)[1].sectional)
+
+        #   Rebuilt once the layer has been recompiled
+        get_layer_json.return_value = CompiledLayer({'referenced': {}})
+        self.assertFalse(graphics is layers()[0])
+
+    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
+    def test_add_layers_fetches_each_api_name_once(self, get_layer_json):
+        get_layer_json.return_value = {'referenced': {}}
+        creator = generator.LayerCreator()
+        creator.add_layers(['defined', 'terms', 'graphics'], '205', 'verver')
+        fetched = sorted(c[0][0] for c in get_layer_json.call_args_list)
+        self.assertEqual(['graphics', 'terms'], fetched)
+        i, p, s = creator.get_appliers()
+        self.assertEqual(['defined', 'terms'], sorted(i.layers.keys()))
+
+    @override_settings(EREGS_FETCH_WORKERS=4)
+    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
+    def test_add_layers_concurrently(self, get_layer_json):
+        """Layers are fetched in parallel; all fetches must be in flight
+        before any of them can finish"""
+        names = ['graphics', 'internal', 'keyterms', 'paragraph']
+        arrived, timed_out = [], []
+        all_arrived = threading.Event()
+
+        def get_layer_json_fn(api_name, regulation, version):
+            arrived.append(api_name)
+            if len(arrived) == len(names):
+                all_arrived.set()
+            if not all_arrived.wait(2):
+                timed_out.append(api_name)
+            return {}
+        get_layer_json.side_effect = get_layer_json_fn
+
+        creator = generator.LayerCreator()
+        creator.add_layers(names, '205', 'verver')
+        self.assertEqual([], timed_out)
+        self.assertEqual(4, get_layer_json.call_count)
+
+    @override_settings(EREGS_FETCH_WORKERS=4)
+    @patch('regulations.generator.generator.LayerCreator.get_layer_json')
+    def test_add_layers_degraded_in_worker(self, get_layer_json):
+        """Stale data served in a worker thread marks the request"""
+        def get_layer_json_fn(api_name, regulation, version):
+            if api_name == 'keyterms':
+                degraded.mark(api_name)
+            return {}
+        get_layer_json.side_effect = get_layer_json_fn
+
+        degraded.reset()
+        creator = generator.LayerCreator()
+        creator.add_layers(['graphics', 'keyterms'], '205', 'verver')
+        self.assertEqual(['keyterms'], degraded.reasons())
+        degraded.reset()
+
+    @patch('regulations.generator.generator.api_reader')
+    def test_diff_add_layers_fetches_both_versions(self, api_reader):
+        layers = {
+            ('graphics', 'old'): {'1-a': [1]},
+            ('graphics', 'new'): {'1-a': [2], '1-b': [3]},
+            ('keyterms', 'old'): {},
+            ('keyterms', 'new'): {'1-c': [4]}}
+        api_reader.ApiReader.return_value.layer.side_effect = \
+            lambda name, reg, version: layers[(name, version)]
+
+        creator = generator.DiffLayerCreator('new')
+        creator.add_layers(['graphics', 'keyterms'], '1', 'old')
+        fetched = sorted(
+            c[0] for c in
+            api_reader.ApiReader.return_value.layer.call_args_list)
+        self.assertEqual(
+            [('graphics', '1', 'new'), ('graphics', '1', 'old'),
+             ('keyterms', '1', 'new'), ('keyterms', '1', 'old')], fetched)
+
+        i, p, s = creator.get_appliers()
+        self.assertEqual({'1-a': [1], '1-b': [3]},
+                         s.layers['graphics'].layer_data)
+        self.assertEqual({'1-c': [4]}, s.layers['keyterms'].layer)
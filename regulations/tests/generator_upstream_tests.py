@@ -0,0 +1,151 @@
+import time
+
+from django.test import SimpleTestCase, override_settings
+from mock import patch
+
+from regulations.generator import executor
+from regulations.generator.api_client import ApiClient, BudgetExceeded
+from regulations.generator.upstream import Histogram, Upstream, upstream
+from regulations.tests.local_api_server import LocalApiServer
+
+
+class HistogramTests(SimpleTestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        for _ in range(90):
+            histogram.observe(0.003)
+        for _ in range(10):
+            histogram.observe(0.4)
+        self.assertEqual(0.005, histogram.percentile(50))
+        self.assertEqual(0.005, histogram.percentile(90))
+        self.assertEqual(0.5, histogram.percentile(95))
+        histogram.observe(100)
+        self.assertEqual(float('inf'), histogram.percentile(100))
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(101, snapshot['count'])
+        self.assertEqual(90, snapshot['buckets']['5'])
+        self.assertEqual(1, snapshot['buckets']['inf'])
+
+
+class UpstreamTests(SimpleTestCase):
+    def test_least_outstanding(self):
+        replicas = Upstream(['a', 'b', 'c'])
+        replicas.replicas[0].outstanding = 2
+        replicas.replicas[1].outstanding = 1
+        for _ in range(3):
+            self.assertEqual('c', replicas.choose().base_url)
+        self.assertEqual('b', replicas.choose(
+            exclude=[replicas.replicas[2]]).base_url)
+
+    def test_ties_rotate(self):
+        replicas = Upstream(['a', 'b'])
+        chosen = [replicas.choose().base_url for _ in range(4)]
+        self.assertEqual(['a', 'b', 'a', 'b'], chosen)
+
+    def test_failover(self):
+        def fn(base_url):
+            if base_url == 'down':
+                raise IOError(base_url)
+            return base_url
+        replicas = Upstream(['down', 'up'])
+        self.assertEqual(['up', 'up'], [replicas.call(fn) for _ in range(2)])
+        self.assertEqual(1, replicas.counters['failovers'])
+        self.assertEqual(1, replicas.replicas[0].counters['errors'])
+
+        replicas = Upstream(['down'])
+        self.assertRaises(IOError, replicas.call, fn)
+
+    def test_final_errors_not_retried(self):
+        calls = []
+
+        def fn(base_url):
+            calls.append(base_url)
+            raise BudgetExceeded(base_url)
+        replicas = Upstream(['a', 'b'])
+        self.assertRaises(BudgetExceeded, replicas.call, fn,
+                          final=(BudgetExceeded,))
+        self.assertEqual(['a'], calls)
+        self.assertEqual(0, replicas.counters['failovers'])
+
+        with self.settings(EREGS_API_UPSTREAM={'HEDGE': True}):
+            self.assertRaises(BudgetExceeded, replicas.call, fn,
+                              final=(BudgetExceeded,))
+        self.assertEqual(['a', 'b'], calls)
+        self.assertEqual(0, replicas.counters['failovers'])
+
+    @override_settings(EREGS_API_UPSTREAM={'HEDGE': True,
+                                           'HEDGE_INITIAL_DELAY': 0.02})
+    def test_pending_hedge_outlives_final_error(self):
+        def fn(base_url):
+            if base_url == 'a':
+                time.sleep(0.1)
+                raise BudgetExceeded(base_url)
+            time.sleep(0.15)
+            return base_url
+        replicas = Upstream(['a', 'b'])
+        with patch('regulations.generator.upstream.executor.submit',
+                   wraps=executor.submit) as submit:
+            self.assertEqual('b', replicas.call(fn, final=(BudgetExceeded,)))
+        self.assertEqual(2, submit.call_count)
+        self.assertEqual(1, replicas.counters['hedged'])
+
+
+class ReplicatedApiTests(SimpleTestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start(self, delay=0):
+        server = LocalApiServer(delay=delay).start()
+        self.servers.append(server)
+        return server
+
+    def api_client(self, *servers):
+        client = ApiClient()
+        client.base_url = [server.url for server in servers]
+        return client
+
+    def test_balanced_across_replicas(self):
+        servers = [self.start() for _ in range(3)]
+        client = self.api_client(*servers)
+        for _ in range(6):
+            notice = client.get('notice/1005/2011-11111')
+            self.assertEqual(notice['document_number'], '2011-11111')
+        self.assertEqual([2, 2, 2], [len(s.requests) for s in servers])
+
+        stats = upstream(client.base_urls).stats()['replicas']
+        self.assertEqual(2, stats[servers[0].url]['requests'])
+        self.assertEqual(2, stats[servers[0].url]['latency']['count'])
+
+    def test_unreachable_replica(self):
+        down, up = self.start(), self.start()
+        down.stop()
+        self.servers.remove(down)
+        client = self.api_client(down, up)
+        for _ in range(2):
+            self.assertIsNotNone(client.get('notice/1005/2011-11111'))
+        self.assertEqual(2, len(up.requests))
+
+    @override_settings(EREGS_API_UPSTREAM={'HEDGE': True,
+                                           'HEDGE_INITIAL_DELAY': 0.05})
+    def test_hedged_around_slow_replica(self):
+        slow, fast = self.start(delay=1), self.start()
+        client = self.api_client(slow, fast)
+        start = time.time()
+        for _ in range(2):
+            validators = {}
+            notice = client.get('notice/1005/2011-11111',
+                                validators=validators)
+            self.assertEqual(notice['document_number'], '2011-11111')
+            self.assertTrue(validators['etag'])
+        self.assertTrue(time.time() - start < 0.5)
+        #   One request went to the slow replica first, then was hedged
+        counters = upstream(client.base_urls).counters
+        self.assertEqual(1, counters['hedged'])
+        self.assertEqual(1, counters['hedge_wins'])
+        self.assertEqual(2, len(fast.requests))
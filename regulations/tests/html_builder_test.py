@@ -7,6 +7,7 @@ from regulations.generator.layers.layers_applier import InlineLayersApplier
 from regulations.generator.layers.layers_applier import ParagraphLayersApplier
 from regulations.generator.node_types import REGTEXT, APPENDIX, INTERP
 from regulations.generator.layers import diff_applier
+from regulations.generator.layers.offset_replace import OffsetElement
 
 
 class HTMLBuilderTest(TestCase):
@@ -39,6 +40,35 @@ class HTMLBuilderTest(TestCase):
         self.assertTrue(par.apply_layers.called)
         self.assertEqual(node, par.apply_layers.call_args[0][0])
 
+    def test_process_node_inline_diff(self):
+        """Inline elements are placed at their offsets into the text, or by
+        occurrence once a diff has been applied to it"""
+        node = {
+            "text": "ab ab",
+            "children": [],
+            "label": ["123", "aaa"],
+            'node_type': REGTEXT
+        }
+        inline = Mock()
+        inline.get_layer_pairs.return_value = [
+            OffsetElement('ab', '<i>ab</i>', (3, 5))]
+        par = Mock()
+        par.apply_layers.side_effect = lambda n: n
+        sr = Mock()
+        sr.get_layer_pairs.return_value = []
+        sr.layers = {}
+
+        builder = HTMLBuilder(inline, par, sr)
+        builder.process_node(dict(node))
+        self.assertEqual('ab <i>ab</i>', par.apply_layers.call_args[0][0][
+            'marked_up'])
+
+        diff = {'123-aaa': {'text': [('insert', 0, 'ab ')], 'op': ''}}
+        builder.diff_applier = diff_applier.DiffApplier(diff, None)
+        builder.process_node(dict(node))
+        self.assertEqual('<ins>ab </ins><i>ab</i> ab',
+                         par.apply_layers.call_args[0][0]['marked_up'])
+
     def test_header_parsing(self):
         builder = HTMLBuilder(None, None, None)
 
@@ -280,3 +310,43 @@ class HTMLBuilderTest(TestCase):
         self.assertTrue(exex.preprocess_root.called)
         self.assertEqual(exex.preprocess_root.call_args[0][0],
                          builder.tree)
+
+    def test_node_cache(self):
+        """Nodes' marked up text is shared between builders for the same
+        version, unless their layers link differently"""
+        node_cache.clear()
+        self.addCleanup(node_cache.clear)
+
+        class Citations(object):
+            sectional = False
+            layer = {'123-aaa': []}
+
+        def marked_up(label, version='v1', sectional=False, text='a b'):
+            citations = Citations()
+            citations.sectional = sectional
+            inline = Mock()
+            inline.get_layer_pairs.return_value = []
+            inline.layers = {'internal': citations}
+            par = Mock()
+            par.layers = {}
+            par.apply_layers.side_effect = lambda n: n
+            sr = Mock()
+            sr.get_layer_pairs.return_value = [('b', '<b>b</b>', [0])]
+            sr.layers = {}
+            builder = HTMLBuilder(inline, par, sr)
+            builder.cache_version = version
+            builder.tree = {'text': text, 'children': [], 'label': label,
+                            'node_type': REGTEXT}
+            builder.generate_html()
+            return builder.tree['marked_up'], sr.get_layer_pairs.called
+
+        self.assertEqual(('a <b>b</b>', True), marked_up(['123', 'bbb']))
+        self.assertEqual(('a <b>b</b>', False), marked_up(['123', 'bbb']))
+        #   No citations here, so sectional links make no difference
+        self.assertFalse(marked_up(['123', 'bbb'], sectional=True)[1])
+        self.assertTrue(marked_up(['123', 'bbb'], version='v2')[1])
+        self.assertTrue(marked_up(['123', 'bbb'], text='a b.')[1])
+
+        self.assertTrue(marked_up(['123', 'aaa'])[1])
+        self.assertFalse(marked_up(['123', 'aaa'])[1])
+        self.assertTrue(marked_up(['123', 'aaa'], sectional=True)[1])
@@ -1,6 +1,12 @@
+import random
 from unittest import TestCase
+
+from mock import Mock
+
 from regulations.generator.layers import layers_applier
 from regulations.generator.layers import location_replace
+from regulations.generator.layers import offset_replace
+from regulations.generator.layers import segments
 
 class LayersApplierTest(TestCase):
 
@@ -34,6 +40,19 @@ class LayersApplierTest(TestCase):
         replaced = 'Prefix linksecondword <a href="url" data="test">link linksecondword</a> postfix text'
         self.assertEquals(applier.text, replaced)
 
+    def test_replace_all_in_dom(self):
+        """Text which Segments can't treat as a DOM would is parsed into one"""
+        for text, replaced in (
+                ('a &amp; a', 'b & b'),
+                ('<p>a</p> a', '<p>b</p> b'),
+                (' <i>a</i>', '<i>b</i>')):
+            applier = layers_applier.LayersApplier()
+            applier.text = text
+            applier.replace_in_dom = Mock(wraps=applier.replace_in_dom)
+            applier.replace_all('a', 'b')
+            self.assertTrue(applier.replace_in_dom.called)
+            self.assertEquals(replaced, applier.text)
+
     def test_find_all_offsets(self):
         pattern = 'ABCD'
         text = 'The grey fox ABCD jumped over the fence ABCD'
@@ -64,6 +83,15 @@ class LayersApplierTest(TestCase):
 
         self.assertEquals(applier.text, 'The grey fox <a>ABCD</a> jumped ABCD over the fence <a>ABCD</a>')
 
+    def test_replace_at_leaves_locations(self):
+        applier = layers_applier.LayersApplier()
+        applier.text = 'ABCD ABCD ABCD'
+        locations = [2, 0]
+        applier.replace_at('ABCD', '<a>ABCD</a>', locations)
+
+        self.assertEquals(applier.text, '<a>ABCD</a> ABCD <a>ABCD</a>')
+        self.assertEquals(locations, [2, 0])
+
     def test_update_offsets(self):
         lr = location_replace.LocationReplace()
         lr.offset_starter = 5
@@ -121,3 +149,233 @@ class LayersApplierTest(TestCase):
         result = "<em>(6)</em> <dfn> Under <a href=\"link_url\">state</a> law. </dfn> state law. <dfn> <a href=\"link_url\">state</a> liability. </dfn>"
         self.assertEquals(applier.text, result)
 
+
+    def test_replace_each(self):
+        applier = layers_applier.LayersApplier()
+        text = applier.replace_each('state law', [
+            ('state law', '<a>state law</a>', [0]),
+            ('law', '<b>law</b>', [0])])
+        self.assertEqual('<a>state <b>law</b></a>', text)
+
+
+class InlineLayersTest(TestCase):
+
+    def setUp(self):
+        layers_applier.inline_counters.reset()
+
+    def test_get_layer_pairs(self):
+        class Layer(Mock):
+            shorthand = 'layer'
+        layer = Layer()
+        layer.apply_layer.return_value = [
+            ('ab', '<i>ab</i>', (3, 5)), ('ab', '<i>ab</i>', ('0', '2')),
+            ('ab', '<i>ab</i>', (1, 3)), ('', '<br>', (0, 0))]
+        applier = layers_applier.InlineLayersApplier()
+        applier.add_layer(layer)
+        self.assertEqual(
+            [offset_replace.OffsetElement('ab', '<i>ab</i>', (3, 5)),
+             offset_replace.OffsetElement('ab', '<i>ab</i>', (0, 2))],
+            applier.get_layer_pairs('1-a', 'ab ab'))
+        self.assertEqual(('ab ab', '1-a'), layer.apply_layer.call_args[0])
+        self.assertEqual(2, layers_applier.inline_counters['misaligned'])
+
+    def test_to_locations(self):
+        elements = [offset_replace.OffsetElement('a', 'A', (6, 7)),
+                    offset_replace.OffsetElement('a', 'B', (1, 2)),
+                    ('b', 'C', [0])]
+        self.assertEqual(
+            [('a', 'A', [2]), ('a', 'B', [0]), ('b', 'C', [0])],
+            layers_applier.to_locations(elements, 'ba ab a'))
+        self.assertEqual([], layers_applier.to_locations(elements[:1], 'b'))
+        self.assertEqual(2, layers_applier.inline_counters['converted'])
+        self.assertEqual(1, layers_applier.inline_counters['misaligned'])
+
+    def test_apply_layers(self):
+        """Elements apply at their offsets, nesting within longer ones, and
+        are dropped if an earlier replacement hides them"""
+        text = 'one two one two'
+        applier = layers_applier.LayersApplier()
+        applier.enqueue_from_list([
+            ('one two', '<u>one two</u>', [0]),
+            offset_replace.OffsetElement('two', '<b>two</b>', (4, 7)),
+            offset_replace.OffsetElement('one', '<a>one</a>', (8, 11)),
+            offset_replace.OffsetElement('e t', '<i>e t</i>', (2, 5))])
+        self.assertEqual('<u>on<i>e t</i>wo</u> <a>one</a> two',
+                         applier.apply_layers(text))
+        self.assertEqual({'applied': 2, 'converted': 0, 'misaligned': 0,
+                          'hidden': 1},
+                         layers_applier.inline_counters.snapshot())
+
+    def test_apply_layers_converted(self):
+        """Text which can't be handled by offsets falls back to locating
+        elements by occurrence"""
+        applier = layers_applier.LayersApplier()
+        applier.enqueue_from_list([
+            offset_replace.OffsetElement('a', '<i>a</i>', (8, 9))])
+        self.assertEqual('a & <i>a</i>', applier.apply_layers('a &amp; a'))
+        self.assertEqual(1, layers_applier.inline_counters['converted'])
+
+
+class OffsetReplaceTest(TestCase):
+    def assert_same(self, text, elements):
+        """The offset engine's result matches the legacy path's"""
+        expected = layers_applier.LayersApplier().replace_each(
+            text, [(o, r, list(l)) for o, r, l in elements])
+        result = offset_replace.OffsetReplace(text).apply(elements)
+        self.assertEqual(expected, result)
+        return result
+
+    def test_nested(self):
+        result = self.assert_same('A credit card issuer', [
+            ('credit card issuer', '<a class="d">credit card issuer</a>',
+             [0]),
+            ('card', '<b>card</b>', [0])])
+        self.assertEqual(
+            'A <a class="d">credit <b>card</b> issuer</a>', result)
+
+    def test_straddling_occurrences_skipped(self):
+        """An occurrence which crosses an earlier replacement's boundary
+        isn't counted"""
+        self.assert_same('credit card card issuer', [
+            ('card issuer', '<a>card issuer</a>', [0]),
+            ('card', '<b>card</b>', [0, 1])])
+
+    def test_occurrences_in_replacement_text(self):
+        """Text introduced by a replacement counts towards locations"""
+        self.assert_same('(a) a rule about a', [
+            ('(a)', '<span>a.</span><em>(a)</em>', [0]),
+            ('a', '<i>a</i>', [3])])
+        self.assertIsNone(offset_replace.OffsetReplace('(a) a').apply([
+            ('(a)', '<span>a.</span><em>(a)</em>', [0]),
+            ('a', '<i>a</i>', [0])]))
+
+    def test_locate(self):
+        """Occurrences found after spans have been added account for all of
+        them"""
+        replacer = offset_replace.OffsetReplace('b ab b ab bb')
+        replacer.apply([
+            ('ab', '<i>ab</i>', [0]),
+            ('bb', '<u>x b b</u>', [0]),
+            ('b', '<br>', [2])])
+        self.assertEqual([(0, False), (3, False), (8, False), (10, True),
+                          (10, True)], replacer.locate('b'))
+        self.assertEqual(replacer.locate('b'), replacer.occurrences('b'))
+        self.assertEqual('b <i>ab</i> <br> ab <u>x b b</u>',
+                         replacer.render())
+
+    def test_entities(self):
+        result = self.assert_same('the term', [
+            ('term', '<a data-term="&#39;term&#39;">term</a>', [0])])
+        self.assertEqual('the <a data-term="\'term\'">term</a>', result)
+
+    def test_unsupported(self):
+        unsupported = [
+            ('<em>term</em>', [('term', '<a>term</a>', [0])]),
+            ('AT&amp;T', [('T', '<a>T</a>', [0])]),
+            ('a term', [('term', '<a>term</a>', [])]),
+            ('a term', [('term', 'term<sub>1</sub>', [0])]),
+            ('a term', [('term', '<a>term</a', [0])]),
+            ('aaa', [('aa', '<a>aa</a>', [0, 1])])]
+        for text, elements in unsupported:
+            self.assertIsNone(
+                offset_replace.OffsetReplace(text).apply(elements))
+            applier = layers_applier.LayersApplier()
+            applier.enqueue_from_list(elements)
+            self.assertEqual(
+                layers_applier.LayersApplier().replace_each(text, elements),
+                applier.apply_layers(text))
+
+    def test_matches_legacy(self):
+        """Random elements over random text give the same markup either
+        way"""
+        rng = random.Random(0)
+        words = ['ab', 'a', 'b', 'ba', 'abc', 'bc', 'a b', 'b a']
+        templates = ['<a href="u">%s</a>', '<i><u>%s</u></i>',
+                     '<b data-x="&#39;%s&amp;">%s</b>',
+                     '<span>%s.</span><em>%s</em>', '<a>\n<img/>\n</a>']
+        applied = 0
+        for _ in range(500):
+            text = ' '.join(rng.choice(words)
+                            for _ in range(rng.randint(1, 12)))
+            elements = []
+            for _ in range(rng.randint(0, 6)):
+                original = rng.choice(words)
+                template = rng.choice(templates)
+                replacement = template.replace('%s', original)
+                locations = sorted(set(rng.randint(0, 4)
+                                       for _ in range(rng.randint(1, 3))))
+                elements.append((original, replacement, locations))
+            elements = [e for _, e in sorted((-len(e[0]), e)
+                                             for e in elements)]
+            expected = layers_applier.LayersApplier().replace_each(
+                text, [(o, r, list(l)) for o, r, l in elements])
+            result = offset_replace.OffsetReplace(text).apply(elements)
+            if result is not None:
+                applied += 1
+                self.assertEqual(expected, result)
+        self.assertTrue(applied > 250)
+
+
+class SegmentsTest(TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(['a ', '<b class="x">', 'c', '</b>'],
+                         segments.tokenize('a <b class="x">c</b>'))
+        self.assertEqual([], segments.tokenize(''))
+        self.assertEqual(None, segments.tokenize('a <b c'))
+
+    def test_replace_all(self):
+        text = segments.Segments('one <em data-one="one">one</em> two')
+        self.assertTrue(text.replace_all('one', '<dfn>one</dfn>'))
+        self.assertEqual('<dfn>one</dfn> <em data-one="one"><dfn>one</dfn>'
+                         '</em> two', text.text())
+        #   The inserted markup is tracked as markup
+        self.assertTrue(text.replace_all('dfn', 'x'))
+        self.assertTrue(text.replace_all('two', '&amp;'))
+        self.assertEqual('<dfn>one</dfn> <em data-one="one"><dfn>one</dfn>'
+                         '</em> &amp;', text.text())
+
+    def test_replace_all_unsafe(self):
+        for text in ('<p>a</p>', '<a>a<a>a</a></a>', 'a <i>a', 'a &amp; a',
+                     "<a href='a'>a</a>", '<IMG/>a', ' <b>a</b>'):
+            replacer = segments.Segments(text)
+            self.assertFalse(replacer.replace_all('a', 'b'))
+            self.assertEqual(text, replacer.text())
+
+    def test_replace_at(self):
+        text = segments.Segments('aa <i title="a">a</i> a')
+        text.replace_at('a', 'b', [1, 2])
+        self.assertEqual('ab <i title="a">b</i> a', text.text())
+
+        text = segments.Segments('a <i a')
+        text.replace_at('a', 'b', [0])
+        self.assertEqual('b <i a', text.text())
+
+    def test_unescape(self):
+        text = segments.Segments('a &amp; <b title="&quot;">&lt;i&gt;</b>')
+        text.unescape()
+        self.assertEqual(['a & ', '<b title=""">', '<i>', '</b>'], text.parts)
+
+    def test_matches_dom(self):
+        """Replacing in segments gives the same text as the DOM round trip
+        wherever it's used"""
+        rng = random.Random(0)
+        pieces = ['ab', 'a', 'b', ' ', 'ba', '<i>', '</i>', '<em class="a">',
+                  '</em>', '<br>', '<a href="b">', '</a>', '<p>', '&amp;']
+        replacements = ['<dfn>a</dfn>', 'c', '&lt;', '<i>ab</i>', '']
+        used = 0
+        for _ in range(500):
+            text = ''.join(rng.choice(pieces)
+                           for _ in range(rng.randint(1, 6)))
+            original = rng.choice(['a', 'b', 'ab'])
+            replacement = rng.choice(replacements)
+
+            expected = layers_applier.LayersApplier()
+            expected.text = text
+            expected.replace_in_dom(original, replacement)
+
+            replacer = segments.Segments(text)
+            if replacer.replace_all(original, replacement):
+                used += 1
+                self.assertEqual(expected.text, replacer.text())
+        self.assertTrue(used > 50)
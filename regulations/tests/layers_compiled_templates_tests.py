@@ -0,0 +1,96 @@
+# vim: set fileencoding=utf-8
+import os
+
+from django.template import Context, engines, loader
+from django.test import SimpleTestCase
+from django.utils.safestring import mark_safe
+
+from regulations.generator.layers.compiled_templates import (
+    compile_template, CompiledTemplate, IF, VAR)
+
+
+LAYER_TEMPLATES = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'templates', 'regulations',
+    'layers')
+VALUES = [u'plain', u'a & <b> "q" \'s\'', 'bytes & <str>', u'caf\xe9 ©',
+          mark_safe(u'<i>safe</i>'), 42, 1.5, None, u'', [u'<li>'],
+          lambda: u'<called>']
+
+
+def lookups(nodes):
+    """Every variable (as its lookups) a compiled template refers to"""
+    found = []
+    for node in nodes:
+        if node[0] == VAR:
+            found.append(node[1])
+        elif node[0] == IF:
+            for condition, branch in node[1]:
+                if condition is not None:
+                    found.append(condition)
+                found.extend(lookups(branch))
+    return found
+
+
+def context_with(variables, value, skip=None):
+    context = {}
+    for bits in variables:
+        if bits == skip:
+            continue
+        target = context
+        for bit in bits[:-1]:
+            target = target.setdefault(bit, {})
+        target[bits[-1]] = value
+    return context
+
+
+class CompiledTemplatesTest(SimpleTestCase):
+    def assertSameRendering(self, template, context):
+        compiled = compile_template(template)
+        self.assertTrue(isinstance(compiled, CompiledTemplate))
+        expected = template.render(Context(context))
+        self.assertEqual(expected, compiled.render(context))
+        self.assertEqual(expected, compiled.render(Context(context)))
+
+    def test_layer_templates(self):
+        """Every layer template without loops compiles, and renders exactly
+        as Django does for all sorts of values"""
+        compiled_names = []
+        for name in sorted(os.listdir(LAYER_TEMPLATES)):
+            template = loader.get_template('regulations/layers/' + name)
+            compiled = compile_template(template)
+            if not isinstance(compiled, CompiledTemplate):
+                continue
+            compiled_names.append(name)
+            variables = lookups(compiled.nodes)
+            for value in VALUES:
+                self.assertSameRendering(
+                    template, context_with(variables, value))
+                for skip in variables:
+                    self.assertSameRendering(
+                        template, context_with(variables, value, skip))
+        self.assertEqual(
+            ['dash.html', 'defining.html', 'definition_citation.html',
+             'external_citation.html', 'graphics.html',
+             'internal_citation.html', 'key_term.html',
+             'paragraph_markers.html', 'subscript.html', 'sxs-footnotes.html'],
+            compiled_names)
+
+    def test_if(self):
+        template = engines['django'].from_string(
+            u'{% if a.b %}<{{ a.b }}>{% else %}{% if c %}{{ c|safe }}'
+            u'{% endif %}none{% endif %}')
+        for context in ({}, {'a': {'b': u'&'}}, {'a': {'b': 0}, 'c': '<'},
+                        {'a': u'str', 'c': mark_safe('&amp;')}):
+            self.assertSameRendering(template, context)
+
+    def test_unsupported(self):
+        """Left to Django"""
+        for source in (u'{% for x in xs %}{{ x }}{% endfor %}',
+                       u'{{ x|upper }}', u'{{ "literal" }}',
+                       u'{% if x == 1 %}one{% endif %}',
+                       u'{% static path %}'):
+            template = engines['django'].from_string(
+                u'{% load static %}' + source)
+            self.assertTrue(compile_template(template) is template)
+        mocked = compile_template(object())
+        self.assertFalse(isinstance(mocked, CompiledTemplate))
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from regulations.generator.layers.compiled import (
+    CompiledLayer, element_offsets)
+
+
+class CompiledLayerTest(TestCase):
+    def setUp(self):
+        self.layer_json = {
+            '1005-2': [{'ref': 'a:1005-1', 'offsets': [[4, 7], [10, 13]]},
+                       {'ref': 'b:1005-1', 'offsets': [['0', '2']]}],
+            '1005-3': [{'no': 'offsets'}],
+            '1005-4': [],
+            'referenced': {'a:1005-1': {'term': 'a'}}}
+
+    def test_reads_like_json(self):
+        layer = CompiledLayer(self.layer_json)
+        for label in self.layer_json:
+            self.assertTrue(label in layer)
+            self.assertEqual(self.layer_json[label], layer[label])
+            self.assertEqual(self.layer_json[label], layer.get(label))
+        self.assertFalse('1005-5' in layer)
+        self.assertEqual('default', layer.get('1005-5', 'default'))
+        self.assertEqual(sorted(self.layer_json), sorted(layer))
+        self.assertRaises(KeyError, lambda: layer['1005-5'])
+
+    def test_offsets(self):
+        layer = CompiledLayer(self.layer_json)
+        first, second = self.layer_json['1005-2']
+        self.assertEqual([(4, 7, first), (10, 13, first), (0, 2, second)],
+                         layer.offsets('1005-2'))
+        self.assertEqual([], layer.offsets('1005-3'))
+        self.assertEqual([], layer.offsets('1005-4'))
+        self.assertEqual([], layer.offsets('1005-5'))
+        self.assertTrue(layer.nbytes > 0)
+
+    def test_element_offsets(self):
+        del self.layer_json['1005-3']
+        layer = CompiledLayer(self.layer_json)
+        for label in ('1005-2', '1005-4', '1005-5'):
+            self.assertEqual(element_offsets(layer, label),
+                             element_offsets(self.layer_json, label))
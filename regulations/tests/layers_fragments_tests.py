@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from django.test import override_settings
+from mock import Mock
+
+from regulations.generator.layers import fragments
+from regulations.generator.lru import footprint
+
+
+class FragmentsTest(TestCase):
+    def setUp(self):
+        fragments.clear()
+        self.addCleanup(fragments.clear)
+
+    def test_rendered(self):
+        render = Mock(return_value=u'<a>link</a>')
+        before = fragments.fragment_stats()
+        for _ in range(3):
+            self.assertEqual(u'<a>link</a>',
+                             fragments.rendered(('layer', 'link'), render))
+        self.assertEqual(1, render.call_count)
+
+        stats = fragments.fragment_stats()
+        self.assertEqual(2, stats['hits'] - before['hits'])
+        self.assertEqual(1, stats['misses'] - before['misses'])
+        self.assertEqual(footprint(u'<a>link</a>'), stats['bytes'])
+        self.assertTrue(0 < stats['hit_rate'] <= 1)
+
+        fragments.clear()
+        fragments.rendered(('layer', 'link'), render)
+        self.assertEqual(2, render.call_count)
+
+    @override_settings(EREGS_FRAGMENT_CACHE={
+        'MAX_BYTES': 2 * footprint('aaaa') + 2,
+        'MAX_ITEM_BYTES': footprint('x' * 6)})
+    def test_byte_cap(self):
+        for text in ('aaaa', 'bbbb', 'cccc'):
+            fragments.rendered(text, lambda: text)
+        fragments.rendered('big', lambda: 'x' * 7)
+        stats = fragments.fragment_stats()
+        self.assertEqual(2 * footprint('aaaa'), stats['bytes'])
+        self.assertEqual(1, stats['rejections'])
+
+        render = Mock(return_value='aaaa')
+        fragments.rendered('aaaa', render)
+        self.assertEqual(1, render.call_count)     # evicted
+
+    @override_settings(EREGS_FRAGMENT_CACHE={'TIMEOUT': -1})
+    def test_timeout(self):
+        render = Mock(return_value='fragment')
+        fragments.rendered('key', render)
+        fragments.rendered('key', render)
+        self.assertEqual(2, render.call_count)
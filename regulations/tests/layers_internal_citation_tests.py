@@ -1,8 +1,13 @@
+from regulations.generator.layers import fragments
 from regulations.generator.layers.internal_citation import InternalCitationLayer
 from mock import patch
 from unittest import TestCase
 
 class InternalCitationLayerTest(TestCase):
+    def setUp(self):
+        #   Don't share mocked renders with other tests
+        fragments.clear()
+        self.addCleanup(fragments.clear)
 
     @patch('regulations.generator.layers.internal_citation.loader')
     def test_render_url(self, loader):
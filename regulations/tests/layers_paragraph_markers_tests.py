@@ -2,9 +2,14 @@ from unittest import TestCase
 
 from mock import patch
 
+from regulations.generator.layers import fragments
 from regulations.generator.layers.paragraph_markers import *
 
 class ParagraphMarkersLayerTest(TestCase):
+    def setUp(self):
+        #   Don't share mocked renders with other tests
+        fragments.clear()
+        self.addCleanup(fragments.clear)
 
     @patch('regulations.generator.layers.paragraph_markers.loader')
     def test_apply_layer(self, loader):
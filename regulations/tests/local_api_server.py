@@ -0,0 +1,138 @@
+"""A stand-in for regcore which serves a dummy_api-style directory over HTTP
+from a background thread. Used to exercise the HTTP paths of the API client
+without any external services."""
+from BaseHTTPServer import HTTPServer
+from cStringIO import StringIO
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import json
+import os
+import socket
+import threading
+import time
+from urlparse import parse_qs, urlparse
+
+
+DUMMY_API = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, 'dummy_api')
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self.connections = []
+
+    def process_request(self, request, client_address):
+        self.connections.append(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        """Clients hang up on slow responses (e.g. hedged requests); that's
+        expected, so don't print tracebacks for it"""
+        pass
+
+    def close_connections(self):
+        """Clients keep connections alive; hang up on them so that handler
+        threads exit rather than waiting for another request"""
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class LocalApiServer(object):
+    """Serve `root` on an ephemeral localhost port. `delay` (seconds) is
+    added before every response, which is handy when simulating a slow
+    replica. Responses carry ETags and honor If-None-Match. With `bundle`,
+    also serves the bundle endpoint (see api_client.DEFAULT_BUNDLE). Use as
+    a context manager or call start()/stop()."""
+    def __init__(self, root=DUMMY_API, delay=0, bundle=False):
+        self.root = os.path.abspath(root)
+        self.delay = delay
+        self.bundle = bundle
+        self.requests = []
+
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def translate_path(self, path):
+                path = path.split('?', 1)[0].split('#', 1)[0]
+                return os.path.join(server.root, *path.strip('/').split('/'))
+
+            def send_head(self):
+                server.requests.append(self.path)
+                if server.delay:
+                    time.sleep(server.delay)
+                if server.bundle and urlparse(self.path).path == '/bundle':
+                    return self.send_bundle()
+                path = self.translate_path(self.path)
+                if os.path.isdir(path):
+                    path = os.path.join(path, 'index.html')
+                if not os.path.isfile(path):
+                    self.send_error(404, 'Not found')
+                    return None
+                stat = os.stat(path)
+                etag = '"%x-%x"' % (int(stat.st_mtime * 1000), stat.st_size)
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return None
+                f = open(path, 'rb')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(stat.st_size))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return f
+
+            def send_bundle(self):
+                bundle = {}
+                query = parse_qs(urlparse(self.path).query)
+                for suffix in query.get('path', []):
+                    path = self.translate_path(suffix)
+                    if os.path.isdir(path):
+                        path = os.path.join(path, 'index.html')
+                    bundle[suffix] = None
+                    if os.path.isfile(path):
+                        with open(path) as f:
+                            bundle[suffix] = json.load(f)
+                body = json.dumps(bundle)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                return StringIO(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _ThreadingServer(('127.0.0.1', 0), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.httpd.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.close_connections()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,14 @@
+from __future__ import absolute_import, unicode_literals
+
+
+class MockStorage(object):
+    calls = []
+
+    def regulation(self, label, version):
+        self.calls.append(('regulation', label, version))
+        if label != 'missing':
+            return {'label': label.split('-'), 'version': version}
+
+    def layer(self, name, label, version):
+        self.calls.append(('layer', name, label, version))
+        return {label: [{'name': name}]}
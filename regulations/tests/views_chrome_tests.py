@@ -59,6 +59,35 @@ class ViewsChromeTest(TestCase):
         response = view.get(view.request, label_id='lab', version='ver')
         self.assertEqual(410, response.status_code)
 
+    @patch('regulations.views.chrome.error_handling')
+    @patch('regulations.views.chrome.generator')
+    @patch('regulations.views.chrome.SideBarView')
+    def test_prefetch(self, sbv, generator, error_handling):
+        """Only views whose partial renders the tree prefetch it"""
+        class FakeView(ChromeView):
+            has_sidebar = False
+
+            def add_main_content(self, context):
+                pass
+
+            def set_chrome_context(self, context, reg_part, version):
+                pass
+
+        view = FakeView()
+        view.request = RequestFactory().get('/')
+        view.get(view.request, label_id='lab', version='ver')
+        self.assertFalse(generator.prefetch_page.called)
+
+        FakeView.prefetch = True
+        view.get(view.request, label_id='lab', version='')
+        self.assertFalse(generator.prefetch_page.called)
+        view.get(view.request, label_id='lab', version='ver')
+        generator.prefetch_page.assert_called_with('lab', 'ver')
+
+        for view_class in (ChromeSearchView, ChromeLandingView,
+                           ChromeSubterpView):
+            self.assertFalse(view_class.prefetch)
+
     @patch('regulations.views.chrome.generator')
     def test_get_404(self, generator):
         generator.get_regulation.return_value = None
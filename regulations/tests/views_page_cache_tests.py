@@ -0,0 +1,166 @@
+import time
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.http import http_date
+from mock import Mock, patch
+
+from regulations.generator import degraded
+from regulations.middleware import DegradedResponseMiddleware
+from regulations.views import page_cache
+
+
+@override_settings(CACHES={'swr': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'swr-tests'}})
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        caches['swr'].clear()
+        degraded.reset()
+        self.view = Mock()
+        self.view.return_value = HttpResponse('first')
+        self.decorated = page_cache.stale_while_revalidate(
+            10, 100, 'swr')(self.view)
+
+    def tearDown(self):
+        degraded.reset()
+
+    def test_fresh_entries_are_served_from_cache(self):
+        request = RequestFactory().get('/some/page')
+        self.assertEqual('first', self.decorated(request).content)
+        self.view.return_value = HttpResponse('second')
+        response = self.decorated(request)
+        self.assertEqual('first', response.content)
+        self.assertEqual(1, self.view.call_count)
+        self.assertIn('max-age=10', response['Cache-Control'])
+
+    @patch('regulations.views.page_cache.refresher')
+    @patch('django.utils.cache.time')
+    @patch('regulations.views.page_cache.time')
+    def test_served_with_remaining_freshness(self, time_mod, django_time,
+                                             refresher):
+        django_time.time = time_mod.time
+        time_mod.time.return_value = 1000
+        request = RequestFactory().get('/some/page')
+        self.decorated(request)
+
+        time_mod.time.return_value = 1006
+        response = self.decorated(request)
+        self.assertIn('max-age=4', response['Cache-Control'])
+        self.assertEqual(http_date(1010), response['Expires'])
+
+        time_mod.time.return_value = 1011
+        response = self.decorated(request)
+        self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertEqual(http_date(1011), response['Expires'])
+
+    @patch('regulations.views.page_cache.time')
+    def test_stale_entries_are_refreshed_in_background(self, time_mod):
+        time_mod.time.return_value = 1000
+        request = RequestFactory().get('/some/page')
+        self.decorated(request)
+
+        time_mod.time.return_value = 1011
+        self.view.return_value = HttpResponse('second')
+        self.assertEqual('first', self.decorated(request).content)
+
+        for _ in range(200):
+            if self.view.call_count == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.01)
+        self.assertEqual(2, self.view.call_count)
+        self.assertEqual('second', self.decorated(request).content)
+
+    def test_errors_are_not_cached(self):
+        self.view.return_value = HttpResponse('error', status=500)
+        request = RequestFactory().get('/some/page')
+        self.decorated(request)
+        self.decorated(request)
+        self.assertEqual(2, self.view.call_count)
+
+    def test_degraded_pages_are_not_cached(self):
+        def view(request):
+            degraded.mark('layer-terms')
+            return HttpResponse('stale')
+        decorated = page_cache.stale_while_revalidate(10, 100, 'swr')(view)
+        request = RequestFactory().get('/some/page')
+        degraded.reset()
+        response = decorated(request)
+        self.assertIn('110', response['Warning'])
+        self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertIsNone(page_cache.page_key(request, caches['swr']))
+
+    def test_keyed_by_vary_headers(self):
+        def view(request):
+            response = HttpResponse(request.META.get('HTTP_X_FLAVOR', ''))
+            response['Vary'] = 'X-Flavor'
+            return response
+        decorated = page_cache.stale_while_revalidate(10, 100, 'swr')(view)
+        factory = RequestFactory()
+        for flavor in ('a', 'b', 'a'):
+            request = factory.get('/some/page', HTTP_X_FLAVOR=flavor)
+            self.assertEqual(flavor, decorated(request).content)
+        self.assertEqual(2, len(set(
+            page_cache.page_key(factory.get('/some/page', HTTP_X_FLAVOR=f),
+                                caches['swr'])
+            for f in 'ab')))
+
+    def test_private_pages_are_not_cached(self):
+        request = RequestFactory().get('/some/page')
+        for header, value in (('Cache-Control', 'private'),
+                              ('Cache-Control', 'no-store'),
+                              ('Cache-Control', 'max-age=0')):
+            response = HttpResponse('private')
+            response[header] = value
+            self.view.return_value = response
+            self.decorated(request)
+            self.assertIsNone(page_cache.page_key(request, caches['swr']))
+
+        response = HttpResponse('cookie')
+        response.set_cookie('session', 'mine')
+        self.view.return_value = response
+        self.decorated(request)
+        self.assertIsNone(page_cache.page_key(request, caches['swr']))
+
+    def test_only_get(self):
+        request = RequestFactory().post('/some/page')
+        self.decorated(request)
+        self.decorated(request)
+        self.assertEqual(2, self.view.call_count)
+
+    @override_settings(EREGS_STALE_WHILE_REVALIDATE={'ENABLED': False})
+    @patch('regulations.views.page_cache.cache_page')
+    def test_disabled_uses_django_cache_page(self, cache_page):
+        page_cache.long_term_cache(123, 'swr')
+        cache_page.assert_called_with(123, cache='swr')
+
+
+class DegradedTests(TestCase):
+    def tearDown(self):
+        degraded.reset()
+
+    def test_uncached_if_degraded(self):
+        view = Mock(return_value=HttpResponse('page'))
+        wrapped = page_cache.uncached_if_degraded(view)
+        degraded.reset()
+        self.assertNotIn('Warning', wrapped(RequestFactory().get('/')))
+
+        view.side_effect = lambda request: (degraded.mark('key')
+                                            or HttpResponse('page'))
+        response = wrapped(RequestFactory().get('/'))
+        self.assertIn('110', response['Warning'])
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+    def test_middleware(self):
+        middleware = DegradedResponseMiddleware()
+        request = RequestFactory().get('/')
+        degraded.mark('left over from another request')
+        middleware.process_request(request)
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotIn('Warning', response)
+
+        degraded.mark('key')
+        response = middleware.process_response(request, HttpResponse())
+        self.assertIn('110', response['Warning'])
@@ -1,6 +1,5 @@
 from django.conf import settings
 from django.conf.urls import patterns, url
-from django.views.decorators.cache import cache_page
 
 from regulations.views.about import about
 from regulations.views.chrome_breakaway import ChromeSXSView
@@ -15,6 +14,7 @@ from regulations.views.partial import PartialParagraphView
 from regulations.views.partial import PartialRegulationView, PartialSectionView
 from regulations.views import partial_interp
 from regulations.views.partial_search import PartialSearch
+from regulations.views.page_cache import long_term_cache
 from regulations.views.partial_sxs import ParagraphSXSView
 from regulations.views.redirect import diff_redirect, redirect_by_date
 from regulations.views.redirect import redirect_by_date_get
@@ -42,8 +42,9 @@ section_or_subterp_pattern = (
     ')'
 )
 
-lt_cache = cache_page(settings.CACHES['eregs_longterm_cache']['TIMEOUT'],
-                      cache='eregs_longterm_cache')
+lt_cache = long_term_cache(
+    settings.CACHES['eregs_longterm_cache']['TIMEOUT'],
+    cache='eregs_longterm_cache')
 
 
 urlpatterns = patterns(
@@ -27,6 +27,9 @@ class ChromeView(TemplateView):
     has_sidebar = True
     #   Which view name to use when switching versions
     version_switch_view = 'chrome_section_view'
+    #   Whether the partial renders this label's tree and layers, so that
+    #   they're worth fetching up front (see generator.prefetch_page)
+    prefetch = False
 
     def check_tree(self, context):
         """Throw an exception if the requested section doesn't exist"""
@@ -102,6 +105,8 @@ class ChromeView(TemplateView):
         context['formatted_id'] = label_to_text(label_id_list, True, True)
         context['node_type'] = type_from_label(label_id_list)
 
+        if self.prefetch and version:
+            generator.prefetch_page(label_id, version)
         error_handling.check_regulation(reg_part)
 
         try:
@@ -125,17 +130,20 @@ class ChromeView(TemplateView):
 class ChromeInterpView(ChromeView):
     """Interpretation of regtext section/paragraph or appendix with chrome"""
     partial_class = PartialInterpView
+    prefetch = True
 
 
 class ChromeSectionView(ChromeView):
     """Regtext section with chrome"""
     partial_class = PartialSectionView
+    prefetch = True
 
 
 class ChromeParagraphView(ChromeView):
     """Regtext paragraph with chrome"""
     partial_class = PartialParagraphView
     version_switch_view = 'chrome_paragraph_view'
+    prefetch = True
 
     def diff_redirect_label(self, label_id, toc):
         """We don't do diffs for individual paragraphs; instead, link to the
@@ -151,6 +159,7 @@ class ChromeRegulationView(ChromeView):
     """Entire regulation with chrome"""
     partial_class = PartialRegulationView
     version_switch_view = 'chrome_regulation_view'
+    prefetch = True
 
     def diff_redirect_label(self, label_id, toc):
         """We don't do diffs of the whole reg; instead link to the first
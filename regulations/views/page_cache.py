@@ -0,0 +1,129 @@
+from functools import wraps
+import math
+import time
+
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import (
+    cc_delim_re, get_cache_key, get_max_age, learn_cache_key,
+    patch_response_headers)
+from django.utils.decorators import available_attrs
+from django.views.decorators.cache import cache_page
+
+from regulations.generator import degraded
+from regulations.generator.refresh import refresher, swr_config
+from regulations.middleware import mark_degraded
+
+
+def long_term_cache(timeout, cache):
+    """Per-view page caching. Equivalent to Django's cache_page unless
+    stale-while-revalidate is enabled, in which case pages past their soft
+    TTL are served immediately while a background thread re-renders them.
+    Either way, pages built from stale API data aren't cached. Settings
+    are read when this is called (i.e. as urls.py is imported)"""
+    config = swr_config()
+    if not config['ENABLED']:
+        django_cache = cache_page(timeout, cache=cache)
+        return lambda view: django_cache(uncached_if_degraded(view))
+    return stale_while_revalidate(
+        config['PAGE_SOFT_TTL'], config['PAGE_HARD_TTL'], cache)
+
+
+def uncached_if_degraded(view):
+    """cache_page decides whether to cache before a TemplateResponse is
+    rendered (and so before all of its API calls have been made); render
+    first so that a degraded response can be marked uncacheable"""
+    @wraps(view, assigned=available_attrs(view))
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        if degraded.is_degraded():
+            mark_degraded(response)
+        return response
+    return wrapped
+
+
+KEY_PREFIX = 'eregs.swr_page'
+
+
+def page_key(request, cache):
+    """The key of a cached page for this request, as cache_page would key
+    it: by URL and the request headers named in the page's Vary header.
+    None if no page for the URL has been cached"""
+    key = get_cache_key(request, KEY_PREFIX, 'GET', cache=cache)
+    if key is not None and request.method == 'HEAD' and cache.get(key) is None:
+        key = get_cache_key(request, KEY_PREFIX, 'HEAD', cache=cache)
+    return key
+
+
+def cacheable(request, response):
+    """Whether Django's cache middleware would cache this response, except
+    that responses setting cookies or marked private aren't either: the
+    page is replayed to everyone"""
+    if response.streaming or response.status_code != 200:
+        return False
+    if response.cookies:
+        return False
+    if response.has_header('Cache-Control'):
+        directives = [directive.strip().lower().split('=')[0] for directive
+                      in cc_delim_re.split(response['Cache-Control'])]
+        if 'private' in directives or 'no-store' in directives:
+            return False
+    return get_max_age(response) != 0
+
+
+def clone_request(request):
+    """A bare GET request to the same URL which outlives the original"""
+    clone = HttpRequest()
+    clone.method = 'GET'
+    clone.path = request.path
+    clone.path_info = request.path_info
+    clone.META = dict(request.META)
+    clone.GET = request.GET.copy()
+    return clone
+
+
+def stale_while_revalidate(soft_ttl, hard_ttl, cache_alias):
+    def decorator(view):
+        def render(request, args, kwargs):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            if degraded.is_degraded():
+                mark_degraded(response)
+            elif cacheable(request, response):
+                patch_response_headers(response, soft_ttl)
+                cache = caches[cache_alias]
+                key = learn_cache_key(request, response, hard_ttl,
+                                      KEY_PREFIX, cache=cache)
+                entry = (time.time() + soft_ttl, response.content,
+                         response.items())
+                cache.set(key, entry, hard_ttl)
+            return response
+
+        @wraps(view, assigned=available_attrs(view))
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, caches[cache_alias])
+            entry = caches[cache_alias].get(key) if key else None
+            if entry is None:
+                return render(request, args, kwargs)
+
+            fresh_until, content, headers = entry
+            if fresh_until < time.time():
+                clone = clone_request(request)
+                refresher().refresh(
+                    key, lambda: render(clone, args, kwargs))
+            response = HttpResponse(content)
+            for header, value in headers:
+                response[header] = value
+            #   Freshness as of now, not as of when the page was rendered
+            del response['Expires']
+            patch_response_headers(
+                response, max(0, int(math.ceil(fresh_until - time.time()))))
+            return response
+        return wrapped
+    return decorator
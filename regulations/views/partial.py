@@ -9,9 +9,10 @@ from regulations.generator.node_types import EMPTYPART, REGTEXT, label_to_text
 from regulations.views import navigation, utils
 
 
-def generate_html(regulation_tree, layer_appliers):
+def generate_html(regulation_tree, layer_appliers, version=None):
     builder = HTMLBuilder(*layer_appliers)
     builder.tree = regulation_tree
+    builder.cache_version = version
     builder.generate_html()
     return builder
 
@@ -49,7 +50,8 @@ class PartialView(TemplateView):
         inline_applier, p_applier, s_applier = self.determine_appliers(
             label_id, version)
 
-        builder = generate_html(tree, (inline_applier, p_applier, s_applier))
+        builder = generate_html(tree, (inline_applier, p_applier, s_applier),
+                                version)
         return self.transform_context(context, builder)
 
 
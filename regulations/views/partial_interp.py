@@ -66,7 +66,8 @@ class PartialSubterpView(PartialSectionView):
         interp['label'] = label
         inline_applier, p_applier, s_applier = self.determine_appliers(
             reg_part + '-Interp', version)
-        builder = generate_html(interp, (inline_applier, p_applier, s_applier))
+        builder = generate_html(interp, (inline_applier, p_applier, s_applier),
+                                version)
         interp = builder.tree
         interp['html_label'] = html_label
         context['tree'] = {'children': [interp]}